@@ -4,21 +4,26 @@ Utilities for assisting with the benchmarking analysis process.
 """
 import io
 import os
+import json
+import time
+import pickle
+import threading
+import concurrent.futures
+import functools
 from collections import namedtuple
 import pandas as pd
 import numpy as np
 import requests
+import cache_util as cu
 
 def calendar_to_fiscal(cal_year, cal_mo):
     """Converts a calendar year and month into a fiscal year and month.
-    Returns (fiscal_year, fical_month) tuple.
+    Returns (fiscal_year, fical_month) tuple.  The inputs can be single
+    integers or equal-length Numpy arrays or Pandas Series of integers, in 
+    which case arrays or Series are returned.
     """
-    if cal_mo <= 6:
-        fiscal_year = cal_year
-        fiscal_month = cal_mo + 6
-    else:
-        fiscal_year = cal_year + 1
-        fiscal_month = cal_mo - 6
+    fiscal_year = cal_year + (cal_mo > 6)
+    fiscal_month = (cal_mo + 5) % 12 + 1
 
     return fiscal_year, fiscal_month
 
@@ -60,26 +65,261 @@ def split_period(start_date, end_date):
     and the fraction of the original date range are returned in a namedtuple.
     For the first and last day in the date range, it is assumed that only half
     the day is served (this is typically the meter reading day).
+    This is a single bill version of split_periods(), below.
     """
-    # make a daily series.  The value is the fraction of the day served,
-    # 1.0 for days except the first and last.
-    ser = pd.Series(data=1.0, index=pd.date_range(start_date, end_date))
-    
-    # the half days at the beginning and end
-    ser.iloc[0] = 0.5
-    ser.iloc[-1] = 0.5
-    
-    tot_days = ser.sum()    # total days served in the bill
-    
-    # break into monthly pieces and add up the days served
-    pieces = ser.resample('M').sum()
-    
-    result = []
-    for dt, days in pieces.items():
-        result.append(
-            PeriodSplit(cal_year=dt.year, cal_mo=dt.month, bill_frac=days/tot_days, days_served=days)
-        )
-    return result
+    pieces = split_periods([start_date], [end_date])
+    return [
+        PeriodSplit(cal_year=p.cal_year, cal_mo=p.cal_mo, bill_frac=p.bill_frac, days_served=p.days_served)
+        for p in pieces.itertuples()
+    ]
+
+class CalendarIndex:
+    """Precomputed lookup arrays for quickly allocating ranges of days to 
+    calendar months.  Days and months are identified by integer ordinals:
+    a day ordinal is the number of days since 1970-01-01 (the integer value
+    of a Numpy 'datetime64[D]') and a month ordinal is the number of months
+    since January 1970 (the integer value of a Numpy 'datetime64[M]').  The 
+    index covers all of the days from January 1 of 'first_year' through 
+    December 31 of 'last_year'.  The methods accept single ordinals or Numpy
+    arrays of them.
+    """
+
+    def __init__(self, first_year, last_year):
+        self.first_year = first_year
+        self.last_year = last_year
+        months = np.datetime64('{:04d}-01'.format(first_year), 'M') + \
+            np.arange((last_year - first_year + 1) * 12 + 1)
+        self.first_month = months[0].astype(np.int64)
+        
+        # The day ordinal of the first day of each month, with one extra 
+        # element for the day following the last month.  These are cumulative
+        # counts of the days in the months.
+        self.month_start = months.astype('datetime64[D]').astype(np.int64)
+        self.first_day = self.month_start[0]
+        
+        # The month ordinal of each day in the index.
+        days_in_month = np.diff(self.month_start)
+        self.day_month = np.repeat(np.arange(len(days_in_month)) + self.first_month, days_in_month)
+
+    def covers(self, day_ords):
+        """Returns True if all of the day ordinals in 'day_ords' are in the index.
+        """
+        day_ords = np.asarray(day_ords)
+        return bool(np.all((day_ords >= self.first_day) & (day_ords < self.month_start[-1])))
+
+    def month_of_day(self, day_ords):
+        """Returns the month ordinals of the days with ordinals 'day_ords'.
+        """
+        if not self.covers(day_ords):
+            raise ValueError('Day is outside of the CalendarIndex years {}-{}.'.format(
+                self.first_year, self.last_year))
+        return self.day_month[np.asarray(day_ords) - self.first_day]
+
+    def month_first_day(self, month_ords):
+        """Returns the ordinal of the first day of the months 'month_ords'.
+        """
+        return self.month_start[np.asarray(month_ords) - self.first_month]
+
+    def month_last_day(self, month_ords):
+        """Returns the ordinal of the last day of the months 'month_ords'.
+        """
+        return self.month_start[np.asarray(month_ords) - self.first_month + 1] - 1
+
+    def days_in_month(self, month_ords):
+        """Returns the number of days in the months 'month_ords'.
+        """
+        return self.month_last_day(month_ords) - self.month_first_day(month_ords) + 1
+
+    @staticmethod
+    def calendar_to_month(cal_year, cal_mo):
+        """Returns the month ordinal of calendar year 'cal_year' and month 'cal_mo'.
+        """
+        return (cal_year - 1970) * 12 + cal_mo - 1
+
+    @staticmethod
+    def month_to_calendar(month_ords):
+        """Returns a (calendar year, calendar month) tuple for 'month_ords'.
+        """
+        return month_ords // 12 + 1970, month_ords % 12 + 1
+
+    @staticmethod
+    def fiscal_to_month(fiscal_year, fiscal_mo):
+        """Returns the month ordinal of fiscal year 'fiscal_year' and month
+        'fiscal_mo'.  Fiscal month 1 is July of the prior calendar year.
+        """
+        return (fiscal_year - 1970) * 12 + fiscal_mo - 7
+
+    @staticmethod
+    def month_to_fiscal(month_ords):
+        """Returns a (fiscal year, fiscal month) tuple for 'month_ords'.
+        """
+        return calendar_to_fiscal(*CalendarIndex.month_to_calendar(month_ords))
+
+    def allocate(self, first_days, last_days):
+        """Allocates the days of the ranges running from the day ordinals in 
+        'first_days' through those in 'last_days' (equal-length arrays, with 
+        each range having last day >= first day) to months.  Returns three 
+        arrays with one element per month piece of each range:
+            the position of the range in the input arrays,
+            the month ordinal of the piece,
+            the number of days of the range that fall in that month.
+        Pieces are ordered by range position and then by month.
+        """
+        first_days = np.asarray(first_days, dtype=np.int64)
+        last_days = np.asarray(last_days, dtype=np.int64)
+        first_mo = self.month_of_day(first_days)
+        n_pieces = self.month_of_day(last_days) - first_mo + 1
+        
+        # explode the ranges into one element per month
+        piece_starts = np.cumsum(n_pieces) - n_pieces
+        range_ix = np.repeat(np.arange(len(first_days)), n_pieces)
+        piece_mo = first_mo[range_ix] + np.arange(n_pieces.sum()) - piece_starts[range_ix]
+        
+        # days in each piece are the days in the month, clipped to the range.
+        piece_first = np.maximum(self.month_first_day(piece_mo), first_days[range_ix])
+        piece_last = np.minimum(self.month_last_day(piece_mo), last_days[range_ix])
+        return range_ix, piece_mo, piece_last - piece_first + 1
+
+@functools.lru_cache(maxsize=None)
+def calendar_index(first_year=1900, last_year=2100):
+    """Returns a CalendarIndex covering 'first_year' through 'last_year',
+    only creating it on the first request for those years.
+    """
+    return CalendarIndex(first_year, last_year)
+
+def split_periods(start_dates, end_dates):
+    """Splits many utility bill service periods into pieces that fit within
+    calendar months, all at once using Numpy arrays.  'start_dates' and 
+    'end_dates' are equal-length array-likes of dates (e.g. the From and Thru 
+    columns of the Utility Bill DataFrame).  As in split_period(), only half of
+    the first and last day of each period is counted as served.
+    Returns a DataFrame with one row per monthly piece and the columns:
+        bill_ix: the position of the bill in the input arrays,
+        cal_year, cal_mo: the calendar year and month of the piece,
+        bill_frac: the fraction of the bill's days that fall in the piece,
+        days_served: the number of days served in the piece.
+    Pieces are ordered by bill_ix and then by month.  Bills with a missing date
+    or with an end date prior to the start date produce no pieces.
+    """
+    st = np.asarray(start_dates, dtype='datetime64[D]')
+    en = np.asarray(end_dates, dtype='datetime64[D]')
+    valid = ~(np.isnat(st) | np.isnat(en))
+    valid[valid] = en[valid] >= st[valid]
+    bill_ix = np.flatnonzero(valid)
+    st = st[valid].astype(np.int64)
+    en = en[valid].astype(np.int64)
+
+    # Use the standard calendar index unless there are unusual dates.
+    cal = calendar_index()
+    if len(st) and not (cal.covers(st) and cal.covers(en)):
+        years = np.array([st.min(), en.max()]).astype('datetime64[D]').astype('datetime64[Y]')
+        cal = calendar_index(min(years[0].astype(int) + 1970, 1900), max(years[1].astype(int) + 1970, 2100))
+    piece_bill, piece_mo, days = cal.allocate(st, en)
+
+    # total days served in each bill; a one day bill only serves a half day.
+    tot_days = (en - st).astype(float)
+    one_day = tot_days == 0.0
+    tot_days[one_day] = 0.5
+
+    # remove the half day not served at the start and end of the bill.
+    days = days.astype(float)
+    days -= 0.5 * (cal.month_first_day(piece_mo) <= st[piece_bill])
+    days -= 0.5 * (cal.month_last_day(piece_mo) >= en[piece_bill])
+    days[one_day[piece_bill]] = 0.5
+
+    cal_year, cal_mo = cal.month_to_calendar(piece_mo)
+    return pd.DataFrame({
+        'bill_ix': bill_ix[piece_bill],
+        'cal_year': cal_year,
+        'cal_mo': cal_mo,
+        'bill_frac': days / tot_days[piece_bill],
+        'days_served': days,
+    })
+
+# The text columns that, along with the month, identify one row of the 
+# monthly totals produced by bill_month_totals(), in sort order.  The month is
+# sorted between the service type and the item description.
+month_total_keys = ['site_id', 'service_type', 'item_desc', 'units']
+
+# The columns that are scaled by the fraction of the bill falling in a month.
+# Other numeric columns are summed without scaling.
+split_cols = ['usage', 'cost', 'mmbtu']
+
+def _sum_by_month(df, month_ords, frac=None):
+    """Sums the numeric columns of 'df' by the month_total_keys columns and
+    the month ordinals 'month_ords' (see CalendarIndex), in one pass.  If
+    'frac' is given, the split_cols columns are multiplied by it before 
+    summing.  Rows with a missing key are dropped, and missing values are 
+    summed as zero.  See bill_month_totals() for the returned DataFrame.
+    """
+    # Code each key as an integer in sort order and combine the codes into
+    # one group number per row, re-coding after each key so the numbers 
+    # stay small.
+    keys = [(col, df[col].values) for col in month_total_keys]
+    keys.insert(2, ('month', np.asarray(month_ords)))
+    codes = {}
+    uniques = {}
+    keep = np.ones(len(df), dtype=bool)
+    for col, vals in keys:
+        codes[col], uniques[col] = pd.factorize(vals, sort=True)
+        keep &= codes[col] >= 0
+    rows = np.flatnonzero(keep)
+    group = np.zeros(len(rows), dtype=np.int64)
+    for col, _ in keys:
+        group = pd.factorize(group * len(uniques[col]) + codes[col][rows], sort=True)[0]
+    n_groups = group.max() + 1 if len(group) else 0
+
+    # the first row of each group gives the key values of the group.
+    first = np.zeros(n_groups, dtype=np.int64)
+    first[group[::-1]] = rows[::-1]
+    key_vals = {col: uniques[col][codes[col][first]] for col, _ in keys}
+    cal_year, cal_mo = CalendarIndex.month_to_calendar(np.asarray(key_vals['month'], dtype=np.int64))
+
+    result = {
+        'site_id': key_vals['site_id'],
+        'service_type': key_vals['service_type'],
+        'cal_year': cal_year,
+        'cal_mo': cal_mo,
+        'item_desc': key_vals['item_desc'],
+        'units': key_vals['units'],
+    }
+    skip_cols = set(month_total_keys + ['cal_year', 'cal_mo', 'fiscal_year', 'fiscal_mo'])
+    for col in df.columns:
+        if col in skip_cols or not np.issubdtype(df[col].dtype, np.number):
+            continue
+        vals = df[col].values[keep]
+        if frac is not None and col in split_cols:
+            vals = vals * frac[keep]
+        tot = np.bincount(group, weights=np.nan_to_num(vals), minlength=n_groups)
+        result[col] = tot.astype(df[col].dtype) if np.issubdtype(df[col].dtype, np.integer) else tot
+
+    result['fiscal_year'], result['fiscal_mo'] = calendar_to_fiscal(cal_year, cal_mo)
+    return pd.DataFrame(result)
+
+def bill_month_totals(df_bills):
+    """Splits the bill charge rows in the DataFrame 'df_bills' into calendar
+    month pieces (see split_periods()) and sums the pieces by site, service 
+    type, month, item description and units, in one pass.  'df_bills' must
+    have the month_total_keys columns and 'from_dt' and 'thru_dt' date columns;
+    its split_cols columns are allocated to months by the fraction of the bill
+    days in the month, and any other numeric columns are summed unsplit.
+    Returns a DataFrame sorted on the keys, with the columns: site_id,
+    service_type, cal_year, cal_mo, item_desc, units, the summed columns,
+    fiscal_year and fiscal_mo.
+    """
+    pieces = split_periods(df_bills.from_dt.values, df_bills.thru_dt.values)
+    df_pieces = df_bills.drop(columns=['from_dt', 'thru_dt']).take(pieces.bill_ix.values)
+    month_ords = CalendarIndex.calendar_to_month(pieces.cal_year.values, pieces.cal_mo.values)
+    return _sum_by_month(df_pieces, month_ords, pieces.bill_frac.values)
+
+def combine_month_totals(df_totals):
+    """Sums the rows of the DataFrame 'df_totals', which is a concatenation of
+    DataFrames returned by bill_month_totals(), so that there is one row per 
+    site, service type, month, item description and units.  Returns a 
+    DataFrame of the same form as bill_month_totals().
+    """
+    month_ords = CalendarIndex.calendar_to_month(df_totals.cal_year.values, df_totals.cal_mo.values)
+    return _sum_by_month(df_totals, month_ords)
 
 def months_present(df, yr_col='fiscal_year', mo_col='fiscal_mo'):
     """Returns a list of the year/months present in a DataFrame.  Each item
@@ -218,44 +458,516 @@ def df_to_dictionaries(df, change_names={}, include_index=True):
     
     return result
 
+class SiteIndex:
+    """Partitions the preprocessed Utility Bill DataFrame by site, once, so
+    that the rows for one site are found without scanning the whole 
+    DataFrame.  site_ix[site_id] returns the rows for 'site_id', in their 
+    original order and with their original index; a site without any rows
+    gives an empty DataFrame with the same columns.  The whole DataFrame is
+    available as the 'df' attribute for portfolio-wide calculations.
+    """
+
+    def __init__(self, df, site_col='site_id'):
+        self.df = df
+        self._empty = df.iloc[:0]
+        self._frames = dict(iter(df.groupby(site_col, sort=False, observed=True)))
+
+    def __getitem__(self, site_id):
+        return self._frames.get(site_id, self._empty)
+
+    def __contains__(self, site_id):
+        return site_id in self._frames
+
+    def sites(self):
+        """Returns a sorted list of the sites that have rows."""
+        return sorted(self._frames)
+
+# Compact dtypes for the columns of the preprocessed Utility Bill DataFrame.
+# The float columns are only converted if requested, as some precision is lost.
+compact_dtypes = {
+    'site_id': 'category',
+    'service_type': 'category',
+    'item_desc': 'category',
+    'units': 'category',
+    'cal_year': 'int16',
+    'cal_mo': 'int8',
+    'fiscal_year': 'int16',
+    'fiscal_mo': 'int8',
+}
+compact_float_cols = ['usage', 'cost', 'mmbtu']
+
+def compact_bill_frame(df, float32=False):
+    """Returns a copy of the preprocessed Utility Bill DataFrame 'df' that uses
+    less memory: the text columns become Pandas Categoricals and the year and
+    month columns become small integers.  If 'float32' is True, the usage, cost
+    and mmbtu columns are also converted to 32-bit floats.  Columns not
+    present in 'df' are ignored.  When grouping or pivoting on the categorical
+    columns, use 'observed=True' so that only categories present in the data
+    appear in the result.
+    """
+    dtypes = dict(compact_dtypes)
+    if float32:
+        dtypes.update(dict.fromkeys(compact_float_cols, 'float32'))
+    return df.astype({col: dt for col, dt in dtypes.items() if col in df.columns})
+
+def compact_frame_matches(df, df_compact, rtol=1e-6):
+    """Returns True if the compact DataFrame 'df_compact' made by
+    compact_bill_frame() holds the same data as the original DataFrame 'df'.
+    Text and integer values must match exactly; float values, and their
+    totals by site, must match within the relative tolerance 'rtol'.
+    """
+    if list(df.columns) != list(df_compact.columns) or len(df) != len(df_compact):
+        return False
+    for col in df.columns:
+        orig = df[col].values
+        compact = np.asarray(df_compact[col])
+        if col in compact_float_cols:
+            if not np.allclose(compact, orig, rtol=rtol, atol=0.0, equal_nan=True):
+                return False
+        elif not pd.Series(compact).equals(pd.Series(orig).astype(compact.dtype)):
+            return False
+    # Totals are where float32 rounding errors accumulate.
+    float_cols = [col for col in compact_float_cols if col in df.columns]
+    if 'site_id' in df.columns and float_cols:
+        tot = df.groupby('site_id')[float_cols].sum()
+        tot_compact = df_compact.groupby('site_id', observed=True)[float_cols].sum()
+        tot_compact.index = tot_compact.index.astype(object)
+        if not np.allclose(tot_compact.loc[tot.index].values, tot.values, rtol=rtol, atol=0.0, equal_nan=True):
+            return False
+    return True
+
+def last_bill_records(util_df):
+    """Returns the rows of the raw Utility Bill DataFrame 'util_df' that are
+    from the last bill (latest 'Thru' date) for each Site ID and Service Name
+    combination, keeping only the columns needed by the Util class to 
+    determine service providers and account numbers.  Duplicate rows are 
+    removed, but the original row order is retained.  Because the last bill
+    of a combined set of bill records is always one of the last bills of its
+    parts, this function can be applied to pieces of a Utility Bill file and 
+    then again to the combined results.
+    """
+    df = util_df[['Site ID', 'Service Name', 'Thru', 'Account Number', 'Vendor Name']]
+    last_thru = df.groupby(['Site ID', 'Service Name']).Thru.transform('max')
+    return df[df.Thru == last_thru].drop_duplicates()
+
+# URL of the degree-day file on the AHFC BMON server.  The file is a pickled
+# Pandas DataFrame using bz2 compression.
+DEGREE_DAY_URL = 'https://ahfc.bmon.org/data/degree_days.pkl'
+
+def provider_account_index(util_df, service_to_category):
+    """Returns a dictionary giving the service provider and account numbers
+    from the latest bills of each site and service category in the raw utility
+    bill DataFrame 'util_df' (or its last_bill_records()).  The keys are 
+    (Site ID, service category) tuples and the values are (provider name,
+    account numbers) tuples; multiple account numbers are separated by commas.
+    The provider is taken from the first of the latest bills.  Service names
+    are converted to categories with the 'service_to_category' dictionary.
+    Site and category combinations without bills are not included, and those
+    whose latest bills are missing an account number get blank values.
+    """
+    df = util_df[['Site ID', 'Service Name', 'Thru', 'Account Number', 'Vendor Name']].copy()
+    df['svc_cat'] = df['Service Name'].map(service_to_category)
+    df = df.dropna(subset=['Site ID', 'svc_cat', 'Thru'])
+    keys = ['Site ID', 'svc_cat']
+
+    # Only the bills with the last Thru date for each site and category.
+    df_last = df[df.Thru == df.groupby(keys).Thru.transform('max')]
+
+    provider = df_last.drop_duplicates(keys).set_index(keys)['Vendor Name']
+    accts = df_last.drop_duplicates(keys + ['Account Number']).groupby(keys)['Account Number'].agg(list).to_dict()
+
+    index = {}
+    for key, prov in provider.items():
+        if all(isinstance(a, str) for a in accts[key]):
+            index[key] = (prov, ', '.join(accts[key]))
+        else:
+            index[key] = ('', '')
+    return index
+
+def service_type_lookups(other_data_pth, cache_dir=None):
+    """Reads the 'Service Types' sheet of the Services.xlsx spreadsheet in the
+    'other_data_pth' directory and returns a two-tuple:
+        a DataFrame giving the Btus per unit of fuel, with the columns
+            'service' and 'unit', both in lower case, and 'btu_per_unit'.
+            Only energy services are included.
+        a dictionary mapping service type to a standard service type category.
+    For duplicate service type entries, the last entry is used.  If 
+    'cache_dir' is given, a parsed copy of the sheet is cached there; see
+    cache_util.read_excel_cached().
+    """
+    df_services = cu.read_excel_cached(os.path.join(other_data_pth, 'Services.xlsx'), cache_dir,
+                                       sheet_name='Service Types', skiprows=3)
+
+    # Only put energy services into fuel btu table
+    df_fuel = df_services[df_services.btu_per_unit > 0.0]
+    df_fuel = pd.DataFrame({
+        'service': df_fuel.service.str.lower(),
+        'unit': df_fuel.unit.str.lower(),
+        'btu_per_unit': df_fuel.btu_per_unit,
+    }).drop_duplicates(['service', 'unit'], keep='last').reset_index(drop=True)
+
+    return df_fuel, dict(zip(df_services.service, df_services.category))
+
+# Name of the local copy of the degree-day file in the cache directory.  The
+# HTTP validators of the copy are stored in a JSON file of the same name with 
+# a '.json' extension added.
+DEGREE_DAY_FILE = 'degree_days.pkl'
+
+@functools.lru_cache(maxsize=None)
+def degree_day_file_content(cache_dir=None, offline=False):
+    """Returns the contents (bytes) of the degree-day file at DEGREE_DAY_URL.
+    The file is only read once per Python session for each set of arguments.
+    If 'cache_dir' is None, the file is simply downloaded.  Otherwise, a
+    local copy of the file is kept in the 'cache_dir' directory and the file
+    is only downloaded again if it has changed on the server, as determined
+    by the ETag and Last-Modified headers from the last download.  The local
+    copy is used if the server cannot be reached, and if 'offline' is True 
+    the server is not contacted at all.
+    """
+    if cache_dir is None:
+        return requests.get(DEGREE_DAY_URL).content
+
+    local_fn = os.path.join(cache_dir, DEGREE_DAY_FILE)
+    meta_fn = local_fn + '.json'
+    have_local = os.path.exists(local_fn)
+
+    def read_local():
+        with open(local_fn, 'rb') as fin:
+            return fin.read()
+
+    if offline:
+        if not have_local:
+            raise FileNotFoundError('No local copy of the degree-day file at {}'.format(local_fn))
+        return read_local()
+
+    # Ask the server to only send the file if it has changed.
+    headers = {}
+    if have_local and os.path.exists(meta_fn):
+        with open(meta_fn) as fin:
+            meta = json.load(fin)
+        if meta.get('url') == DEGREE_DAY_URL:
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+
+    try:
+        resp = requests.get(DEGREE_DAY_URL, headers=headers, timeout=60)
+        if resp.status_code == 304 and have_local:
+            return read_local()
+        resp.raise_for_status()
+    except requests.RequestException:
+        if have_local:
+            return read_local()
+        raise
+
+    # Save the new file and its validators.  Write to temporary files first 
+    # so a partially written file is never used.
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(local_fn + '.tmp', 'wb') as fout:
+        fout.write(resp.content)
+    os.replace(local_fn + '.tmp', local_fn)
+    meta = {
+        'url': DEGREE_DAY_URL,
+        'etag': resp.headers.get('ETag'),
+        'last_modified': resp.headers.get('Last-Modified'),
+    }
+    with open(meta_fn + '.tmp', 'w') as fout:
+        json.dump(meta, fout)
+    os.replace(meta_fn + '.tmp', meta_fn)
+
+    return resp.content
+
+class DegreeDayStore:
+    """Holds monthly heating degree days (base 65 F) for a number of degree-day
+    sites in a dense 2-D Numpy array, with one row per degree-day site and one
+    column per month, so the degree days for whole columns of sites and 
+    months are found with one array lookup.  Months are identified by month
+    ordinals (see CalendarIndex).
+    """
+
+    def __init__(self, df_dd):
+        """'df_dd' is the DataFrame from the degree-day file: it is indexed on
+        degree-day site and has a 'month' column of dates in the month and an 
+        'hdd65' column of degree days.  Missing months are stored as NaN.  For
+        duplicate site/months, the last value is used.
+        """
+        site_codes, self.sites = pd.factorize(df_dd.index)
+        months = df_dd.month.values.astype('datetime64[M]').astype(np.int64)
+        self.first_month = months.min() if len(months) else 0
+        n_months = months.max() - self.first_month + 1 if len(months) else 0
+        self.hdd = np.full((len(self.sites), n_months), np.nan)
+        self.hdd[site_codes, months - self.first_month] = df_dd.hdd65.values
+
+    @classmethod
+    def from_file_content(cls, content):
+        """Returns a DegreeDayStore made from the contents (bytes) of the 
+        degree-day file.
+        """
+        return cls(pd.read_pickle(io.BytesIO(content), compression='bz2'))
+
+    @classmethod
+    def from_arrays(cls, sites, first_month, hdd):
+        """Returns a DegreeDayStore made from its parts: the array of 
+        degree-day sites, the month ordinal of the first month and the 2-D 
+        array of degree days.
+        """
+        store = cls.__new__(cls)
+        store.sites = pd.Index(sites, dtype=object)
+        store.first_month = first_month
+        store.hdd = hdd
+        return store
+
+    def site_codes(self, dd_sites):
+        """Returns the row numbers in the degree-day array for the degree-day
+        sites 'dd_sites', with -1 for unknown sites.
+        """
+        return self.sites.get_indexer(np.asarray(dd_sites, dtype=object))
+
+    def lookup(self, dd_sites, month_ords):
+        """Returns an array of the degree days for the degree-day sites 
+        'dd_sites' and month ordinals 'month_ords' (equal-length arrays).  NaN
+        is returned for unknown sites and months.
+        """
+        rows = self.site_codes(dd_sites)
+        cols = np.asarray(month_ords, dtype=np.int64) - self.first_month
+        ok = (rows >= 0) & (cols >= 0) & (cols < self.hdd.shape[1])
+        result = np.full(len(rows), np.nan)
+        result[ok] = self.hdd[rows[ok], cols[ok]]
+        return result
+
+    def lookup_fiscal(self, dd_sites, fiscal_years, fiscal_mos):
+        """Same as lookup() but the months are given as arrays of fiscal 
+        years and fiscal months.
+        """
+        month_ords = CalendarIndex.fiscal_to_month(
+            np.asarray(fiscal_years, dtype=np.int64), np.asarray(fiscal_mos, dtype=np.int64))
+        return self.lookup(dd_sites, month_ords)
 
 class Util:
+    """Provides information about the sites, services and degree days needed
+    for the benchmarking analysis.  The information is loaded lazily: each
+    resource (the Services.xlsx sheets, the Buildings.xlsx sheet, the building
+    information and the degree days) is loaded the first time it is needed 
+    and kept for later use.  load_all() loads everything, overlapping the 
+    independent loads on a thread pool.  The object can be pickled once all
+    of its resources are loaded.  save_snapshot() and 
+    load_snapshot() store the object in a compact, versioned format instead.
+    """
+
+    # Names of the resources; each is loaded by a _load_<name>() method.
+    all_resources = ('service_types', 'service_cat_info', 'bldg_sheet', 'degree_days',
+                     'buildings', 'site_dd_site')
+
+    # Version of the save_snapshot() file format; increase it whenever the
+    # contents of the snapshot change, so that older snapshots are rejected.
+    SNAPSHOT_VERSION = 1
     
-    def __init__(self, util_df, other_data_pth):
+    def __init__(self, util_df, other_data_pth, dd_cache_dir=None, dd_offline=False, excel_cache_dir=None):
         """
-        util_df: DataFrame containing the raw utility bill data
+        util_df: DataFrame containing the raw utility bill data, or just the
+            last bill records for each site and service, as returned by 
+            last_bill_records().
         other_data_pth: path to the directory containing other application data spreadsheets,
             building info, degree days, etc.
+        dd_cache_dir, dd_offline: where to keep a local copy of the degree-day
+            file and whether to only use that copy; see degree_day_file_content().
+        excel_cache_dir: directory to cache parsed copies of the spreadsheets
+            in, or None to always parse them; see cache_util.read_excel_cached().
         """
+        self._util_df = util_df
+        self._other_data_pth = other_data_pth
+        self._dd_cache_dir = dd_cache_dir
+        self._dd_offline = dd_offline
+        self._excel_cache_dir = excel_cache_dir
+
+        self._resources = {}     # the loaded resources, keyed on name
+        self.load_times = {}     # time in seconds to load each resource
+        self._make_locks()
+
+    def _make_locks(self):
+        """Makes a lock for each resource, so a resource is only loaded once
+        even if it is requested from several threads at the same time.
+        """
+        self._locks = {name: threading.Lock() for name in self.all_resources}
+
+    def __getstate__(self):
+        # Loading the resources here could read the spreadsheets and download
+        # the degree days, so they must be loaded before pickling.
+        missing = [name for name in self.all_resources if name not in self._resources]
+        if missing:
+            raise pickle.PicklingError(
+                'Util resources {} are not loaded; call load_all() before pickling.'.format(
+                    ', '.join(missing)))
+
+        # Locks cannot be pickled, and the raw utility data is not needed
+        # once all of the resources are loaded.
+        state = self.__dict__.copy()
+        del state['_locks']
+        state['_util_df'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._make_locks()
+
+    @staticmethod
+    def _json_value(val):
+        """Converts Numpy scalars to Python values so 'val' can be stored as
+        JSON.
+        """
+        return val.item() if isinstance(val, np.generic) else val
+
+    def save_snapshot(self, file_path):
+        """Saves all of the resources of this object to 'file_path' (a '.npz'
+        file) in a columnar snapshot format that does not depend on the 
+        layout of the class: the spreadsheet and building tables are stored
+        as DataFrames, the degree days as an array, and the remaining small 
+        lookup tables as JSON.  Load the snapshot with load_snapshot().
+        """
+        self.load_all()
+        fuel_btus_table, _, service_to_category = self._resources['service_types']
+        _, bldg_info_df, site_categories = self._resources['buildings']
+        dd = self._resources['degree_days']
         
-        # Get Service Type information and create a Fuel Btu dictionary as an
-        # object attribute.  Keys are fuel type, fuel unit, both in lower case.
-        # Also create a dictionary mapping service types to standard service 
-        # type category names.  
-        df_services = pd.read_excel(os.path.join(other_data_pth, 'Services.xlsx'), sheet_name='Service Types', skiprows=3)
-        self._fuel_btus = {}
-        for ix, row in df_services.iterrows():
-            # Only put energy services into fuel btu dictionary
-            if row.btu_per_unit > 0.0:
-                self._fuel_btus[(row.service.lower(), row.unit.lower())] = row.btu_per_unit
-
-        # Make a dictionary mapping Service Type to Service Type Category
-        # For duplicate service type entries, this will take the last category.
-        self._service_to_category = dict(zip(df_services.service, df_services.category))
-
-        # Make a dictionary that maps the standard Service Category for fuels
-        # to the standard display units and the Btus per unit for that fuel unit.
-        # The keys are the standardized service type names, but only include energy
-        # producing fuels (not water, refuse, etc.).  The values are a two-tuple:
-        # (unit, Btus/unit).
-        df_svc_cat_info = pd.read_excel(os.path.join(other_data_pth, 'Services.xlsx'),
-            sheet_name='Service Categories', skiprows=3)
+        frames = {
+            'fuel_btus_table': fuel_btus_table,
+            'bldg_info_df': bldg_info_df,
+        }
+        arrays = {
+            'dd_sites': np.array(dd.sites, dtype=str),
+            'dd_hdd': dd.hdd,
+        }
+        jv = self._json_value
+        info = {
+            'version': self.SNAPSHOT_VERSION,
+            # a list of pairs, as the keys may not be strings
+            'service_to_category': [[jv(k), jv(v)] for k, v in service_to_category.items()],
+            'service_cat_info': [[jv(k), jv(unit), jv(btus)] 
+                                 for k, (unit, btus) in self._resources['service_cat_info'].items()],
+            'site_categories': site_categories,
+            # the Buildings.xlsx sheet is the first columns of the building table
+            'bldg_sheet_columns': list(self._resources['bldg_sheet'].columns),
+            'dd_first_month': int(dd.first_month),
+            'other_data_pth': self._other_data_pth,
+            'dd_cache_dir': self._dd_cache_dir,
+            'dd_offline': self._dd_offline,
+            'excel_cache_dir': self._excel_cache_dir,
+        }
+        cu.save_frames(file_path, frames, arrays, info)
+
+    @classmethod
+    def load_snapshot(cls, file_path):
+        """Returns a Util object loaded from the snapshot file 'file_path' 
+        made by save_snapshot().  Raises ValueError if the file cannot be read
+        or was made with a different snapshot version.
+        """
+        try:
+            frames, arrays, info = cu.load_frames(file_path)
+        except Exception as e:
+            raise ValueError('Cannot read Util snapshot {}: {}'.format(file_path, e))
+        version = info.get('version') if isinstance(info, dict) else None
+        if version != cls.SNAPSHOT_VERSION:
+            raise ValueError('Util snapshot {} has version {}, version {} is required.'.format(
+                file_path, version, cls.SNAPSHOT_VERSION))
+
+        util = cls.__new__(cls)
+        util._util_df = None
+        util._other_data_pth = info['other_data_pth']
+        util._dd_cache_dir = info['dd_cache_dir']
+        util._dd_offline = info['dd_offline']
+        util._excel_cache_dir = info['excel_cache_dir']
+        util.load_times = {}
+        util._make_locks()
+
+        fuel_btus_table = frames['fuel_btus_table']
+        fuel_btus = dict(zip(
+            zip(fuel_btus_table.service, fuel_btus_table.unit),
+            fuel_btus_table.btu_per_unit
+        ))
+        service_to_category = {k: v for k, v in info['service_to_category']}
+        service_cat_info = {k: (unit, btus) for k, unit, btus in info['service_cat_info']}
+
+        # The building information dictionary is rebuilt from the building 
+        # table.  For duplicate sites, the last record is used.
+        bldg_info_df = frames['bldg_info_df']
+        cols = list(bldg_info_df.columns) + ['site_id']
+        col_values = [bldg_info_df[c].tolist() for c in bldg_info_df.columns]
+        site_ids = bldg_info_df.index.tolist()
+        bldg_info = {site_id: dict(zip(cols, vals + (site_id,))) 
+                     for site_id, vals in zip(site_ids, zip(*col_values))}
+
+        dd = DegreeDayStore.from_arrays(arrays['dd_sites'].astype(object), 
+                                        info['dd_first_month'], arrays['dd_hdd'])
+
+        util._resources = {
+            'service_types': (fuel_btus_table, fuel_btus, service_to_category),
+            'service_cat_info': service_cat_info,
+            'bldg_sheet': bldg_info_df[info['bldg_sheet_columns']],
+            'degree_days': dd,
+            'buildings': (bldg_info, bldg_info_df, info['site_categories']),
+        }
+        util._resource('site_dd_site')
+        return util
+
+    def _resource(self, name):
+        """Returns the resource 'name', loading it with the _load_<name>()
+        method the first time it is requested.
+        """
+        with self._locks[name]:
+            if name not in self._resources:
+                st = time.time()
+                self._resources[name] = getattr(self, '_load_' + name)()
+                self.load_times[name] = time.time() - st
+            return self._resources[name]
+
+    def load_all(self):
+        """Loads all of the resources that are not yet loaded, concurrently on
+        a thread pool, so that the degree-day download and the spreadsheet 
+        reads overlap.  A resource that depends on others waits for them to 
+        load.  Returns the total time in seconds.
+        """
+        st = time.time()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(self.all_resources)) as executor:
+            futures = [executor.submit(self._resource, name) for name in self.all_resources]
+            for future in futures:
+                future.result()
+        return time.time() - st
+
+    def _load_service_types(self):
+        """Reads the Service Type information and creates a Fuel Btu table and
+        dictionary, keyed on fuel type and fuel unit, both in lower case. Also 
+        creates a dictionary mapping service types to standard service type 
+        category names.  Returns (fuel btu table, fuel btu dictionary, service
+        to category dictionary).
+        """
+        fuel_btus_table, service_to_category = service_type_lookups(self._other_data_pth, self._excel_cache_dir)
+        fuel_btus = dict(zip(
+            zip(fuel_btus_table.service, fuel_btus_table.unit),
+            fuel_btus_table.btu_per_unit
+        ))
+        return fuel_btus_table, fuel_btus, service_to_category
+
+    def _load_service_cat_info(self):
+        """Returns a dictionary that maps the standard Service Category for fuels
+        to the standard display units and the Btus per unit for that fuel unit.
+        The keys are the standardized service type names, but only include energy
+        producing fuels (not water, refuse, etc.).  The values are a two-tuple:
+        (unit, Btus/unit).
+        """
+        df_svc_cat_info = cu.read_excel_cached(os.path.join(self._other_data_pth, 'Services.xlsx'),
+            self._excel_cache_dir, sheet_name='Service Categories', skiprows=3)
         ky_val = zip(df_svc_cat_info.category, zip(df_svc_cat_info.unit, df_svc_cat_info.btu_per_unit))
-        self._service_cat_info = dict(ky_val)
+        return dict(ky_val)
 
-        # Read in the Building Information. Ensure site_id is a string.
-        df_bldg = pd.read_excel(
-                os.path.join(other_data_pth, 'Buildings.xlsx'), 
+    def _load_bldg_sheet(self):
+        """Reads in and returns the Building Information DataFrame, indexed on
+        site_id.
+        """
+        # Ensure site_id is a string.
+        df_bldg = cu.read_excel_cached(
+                os.path.join(self._other_data_pth, 'Buildings.xlsx'), 
+                self._excel_cache_dir,
                 skiprows=3, 
                 converters={'site_id': str},
                 )
@@ -267,6 +979,16 @@ class Util:
         # now remove any leading or trailing commas.
         df_bldg.full_address = df_bldg.full_address.str.strip(',') 
 
+        return df_bldg
+
+    def _load_buildings(self):
+        """Combines the Building Information with the service providers and 
+        account numbers from the utility bills.  Returns (dictionary of 
+        building info keyed on site_id, DataFrame of building info, list of 
+        site categories and their buildings).
+        """
+        df_bldg = self._resource('bldg_sheet')
+
         # Create a dictionary to hold info for each building
         # The keys of the dictionary are the columns from the spreadsheet that
         # was just read, but also fields that hold service provider names and
@@ -279,35 +1001,12 @@ class Util:
         # string for defaults)
         default_info = dict(zip(dict_keys, [''] * len(dict_keys)))
 
-        def find_src_acct(dfs, service_cat):
-            """Function used below to return service provider and account
-            numbers for a particular service type.  'dfs' is a DataFrame that
-            has only the records for one site.  'service_type' is the name of
-            the service, e.g. 'Water'.  (provider name, account numbers) are
-            returned.
-            """
-            try:
-                # add in the service type category
-                dfs2 = dfs.copy()
-                dfs2['svc_cat'] = dfs2['Service Name'].map(self._service_to_category)
-                df_svc = dfs2[dfs2.svc_cat==service_cat]
-                last_bill_date = df_svc.Thru.max()
-                df_last_bill = df_svc[df_svc.Thru == last_bill_date]
-                
-                # could be multiple account numbers. Get them all and
-                # separate with commas
-                accts = df_last_bill['Account Number'].unique()
-                acct_str = ', '.join(accts)
-                # Assume only one provider.
-                provider = df_last_bill['Vendor Name'].iloc[0]
-                
-                return provider, acct_str
-            
-            except:
-                return '', ''
+        # Find the service providers and account numbers of all the sites 
+        # from the latest bills.
+        src_acct = provider_account_index(self._util_df, self.service_to_category())
 
         # create a dictionary to map site_id to info about the building
-        self._bldg_info = {}
+        bldg_info = {}
         
         # separately, create a list that will be used to make a DataFrame
         # that also contains this info.
@@ -319,14 +1018,13 @@ class Util:
             rec = default_info.copy()
             rec.update(row.to_dict())
 
-            # now find providers and account numbers from raw utility file.
-            df_site = util_df[util_df['Site ID']==ix]
+            # now fill in the providers and account numbers.
             for svc_cat in all_services:
-                source, accounts = find_src_acct(df_site, svc_cat)
+                source, accounts = src_acct.get((ix, svc_cat), ('', ''))
                 rec['source_{}'.format(svc_cat)] = source
                 rec['acct_{}'.format(svc_cat)] = accounts
                 
-            self._bldg_info[row.name] = rec
+            bldg_info[row.name] = rec
             
             # add in the site_id to the record so the DataFrame has this
             # column.
@@ -335,49 +1033,54 @@ class Util:
             
         # Make a DataFrame, indexed on site_id to hold this building info
         # as well.
-        self._bldg_info_df = pd.DataFrame(rec_list)
-        self._bldg_info_df.set_index('site_id', inplace=True)
+        bldg_info_df = pd.DataFrame(rec_list)
+        bldg_info_df.set_index('site_id', inplace=True)
         
         # make a list of site categories and their associated builddings
         df_sites = df_bldg.reset_index()[['site_id', 'site_name', 'site_category']]
         cats = df_sites.groupby('site_category')
-        self._site_categories = []
+        site_categories = []
         for nm, gp in cats:
             bldgs = list(zip(gp['site_name'], gp['site_id']))
             bldgs.sort()
             sites = []
             for site_name, site_id in bldgs:
                 sites.append(dict(id=site_id, name=site_name))
-            self._site_categories.append( {'name': nm, 'sites': sites} )
-
-        # read in the degree-day info from AHFC's online file
-        resp = requests.get('https://ahfc.bmon.org/data/degree_days.pkl').content
-        df_dd = pd.read_pickle(io.BytesIO(resp), compression='bz2')
-
-        # make a dictionary keyed on fiscal_yr, fiscal_mo, site_id
-        # with a value of degree days.
-        self._dd = {}
-        for ix, row in df_dd.iterrows():
-            f_yr, f_mo = calendar_to_fiscal(row.month.year, row.month.month)
-            self._dd[(f_yr, f_mo, ix)] = row.hdd65
-  
+            site_categories.append( {'name': nm, 'sites': sites} )
+
+        return bldg_info, bldg_info_df, site_categories
+
+    def _load_degree_days(self):
+        """Reads in the degree-day info from AHFC's online file, or the local
+        copy of it, returning a DegreeDayStore.
+        """
+        resp = degree_day_file_content(self._dd_cache_dir, self._dd_offline)
+        return DegreeDayStore.from_file_content(resp)
+
+    def _load_site_dd_site(self):
+        """Returns a Series mapping site_id to degree-day site.  For duplicate 
+        sites, the last one is used, as in the building info dictionary.
+        """
+        dd_site = self._resource('bldg_sheet').dd_site
+        return dd_site[~dd_site.index.duplicated(keep='last')]
+
     def building_info(self, site_id):
         """Returns building information, a dictionary, for the facility
         identified by 'site_id'.  Throws a KeyError if the site is not present.
         """
-        return self._bldg_info[site_id]
+        return self._resource('buildings')[0][site_id]
     
     def building_info_df(self):
         """Returns a DataFrame with all of the building information.  The index
         of the DataFrame is the Site ID.
         """
-        return self._bldg_info_df
+        return self._resource('buildings')[1]
     
     def all_sites(self):
         """Returns a list of all Site IDs present in the Other Data spreadsheet.
         The list is sorted alphabetically.
         """
-        ids = list(self._bldg_info.keys())
+        ids = list(self._resource('buildings')[0].keys())
         ids.sort()
         return ids
     
@@ -389,23 +1092,17 @@ class Util:
         category; the building is a two-tuple (building name, site ID).  Buildings
         are sorted alphabetically by building name.
         """
-        return self._site_categories
+        return self._resource('buildings')[2]
     
     def add_degree_days_col(self, df):
         """Adds a degree-day column to the Pandas DataFrame df.  The new column
         is named "degree_days".  The code assumes that there are columns: 
         fiscal_year, fiscal_mo, and site_id already in the DataFrame.  These are 
-        used to look-up the degree-days for a paricular site and month.
-        """
-        dd_col = []
-        for ix, row in df.iterrows():
-            try:
-                deg_days = self._dd[(row.fiscal_year, row.fiscal_mo, self._bldg_info[row.site_id]['dd_site'])]
-            except:
-                deg_days = np.nan
-            dd_col.append(deg_days)
-        
-        df['degree_days'] = dd_col
+        used to look-up the degree-days for a paricular site and month.  Sites
+        or months without degree-day data are given a value of NaN.
+        """
+        dd_sites = self._resource('site_dd_site').reindex(np.asarray(df.site_id, dtype=object)).values
+        df['degree_days'] = self._resource('degree_days').lookup_fiscal(dd_sites, df.fiscal_year, df.fiscal_mo)
         
     def degree_days_monthly(self, months_to_include, site_id):
         """Returns a DataFrame that includes three colunns: fiscal_year, 
@@ -414,20 +1111,14 @@ class Util:
         parameter, 'months_to_include', a list of (fiscal_yr, fiscal_mo)
         tuples. For months or sites without degree days, Numpy NaN is returned.
         """
-        recs = []
-        for yr, mo in months_to_include:
-            try:
-                deg_days = self._dd[(yr, mo, self._bldg_info[site_id]['dd_site'])]
-            except:
-                deg_days = np.NaN
-
-            recs.append(
-                {'fiscal_year': yr, 
-                 'fiscal_mo': mo, 
-                 'dd': deg_days
-                }
-            )
-        dfdd = pd.DataFrame(data=recs)
+        yrs = [yr for yr, _ in months_to_include]
+        mos = [mo for _, mo in months_to_include]
+        dd_site = self._resource('site_dd_site').get(site_id, np.nan)
+        dfdd = pd.DataFrame({
+            'fiscal_year': yrs,
+            'fiscal_mo': mos,
+            'dd': self._resource('degree_days').lookup_fiscal([dd_site] * len(yrs), yrs, mos),
+        })
         return dfdd
 
     def degree_days_yearly(self, months_to_include, site_id):
@@ -455,17 +1146,23 @@ class Util:
         Parameters are case insenstive.  If the fuel type and units are not in
         source spreadsheet, 0.0 is returned.
         """
-        return self._fuel_btus.get( (fuel_type.lower(), fuel_units.lower()), 0.0)
+        return self._resource('service_types')[1].get( (fuel_type.lower(), fuel_units.lower()), 0.0)
+
+    def fuel_btus_table(self):
+        """Returns the Btus per unit of fuel information as a DataFrame, for
+        joining to DataFrames of fuel use.  See service_type_lookups().
+        """
+        return self._resource('service_types')[0].copy()
 
     def service_to_category(self):
         """Returns a dictionary that maps service type to a standard service
         cateogory.
         """
-        return self._service_to_category.copy()   # return copy to protect original
+        return self._resource('service_types')[2].copy()   # return copy to protect original
 
     def service_category_info(self, service_category):
         """For a 'service_category' that is a fuel (e.g. 'natural_gal') this method
         returns a a two-tuple containing the standard unit for that category 
         (e.g. CCF, Gallons) and the Btus/unit for that unit.
         """
-        return self._service_cat_info[service_category]
+        return self._resource('service_cat_info')[service_category]
@@ -38,6 +38,10 @@ These are present in this directory.
 """
 import time
 import pickle
+import hashlib
+import inspect
+import concurrent.futures
+import multiprocessing
 import glob
 import os
 import pprint
@@ -48,7 +52,7 @@ import numpy as np
 import bench_util as bu
 import graph_util as gu
 import template_util
-import shutil
+import cache_util as cu
 import settings       # the file holding settings for this script
 
 # Filter out Matplotlib warnings, as we sometimes get warnings
@@ -59,14 +63,276 @@ warnings.filterwarnings("ignore", module="matplotlib")
 #*****************************************************************************
 # ----------------------Function for Preprocessing Data ----------------------
 
+# Columns read from the Utility Bill file: (column name in file, column name
+# used in the preprocessed data, dtype).  The two account columns are only
+# used to determine the service provider and account numbers for each site.
+BILL_FILE_COLUMNS = [
+    ('Site ID', 'site_id', 'object'),
+    ('From', 'from_dt', None),
+    ('Thru', 'thru_dt', None),
+    ('Service Name', 'service_type', 'object'),
+    ('Item Description', 'item_desc', 'object'),
+    ('Usage', 'usage', 'float64'),
+    ('Cost', 'cost', 'float64'),
+    ('Units', 'units', 'object'),
+    ('Account Number', None, 'object'),
+    ('Vendor Name', None, 'object'),
+]
+
+# The columns that identify one bill, used to fingerprint bills for
+# incremental preprocessing.
+BILL_KEYS = ['site_id', 'service_type', 'from_dt', 'thru_dt']
+
+# File in the cache directory holding the bills and monthly data from the 
+# last incremental preprocessing run, and the format version of that file.
+BILL_STORE_FILE = 'bill_store.pkl'
+BILL_STORE_VERSION = 3
+
+def read_bill_file(fn, chunk_size=0):
+    """Reads the Utility Bill CSV file 'fn', returning an iterator of
+    DataFrames.  Only the columns listed in BILL_FILE_COLUMNS are read, and 
+    they are read with explicit dtypes; the From and Thru columns are converted
+    to Pandas dates.  If 'chunk_size' is 0, the whole file is returned as one
+    DataFrame, otherwise DataFrames of 'chunk_size' rows are returned.
+    """
+    cols = [c[0] for c in BILL_FILE_COLUMNS]
+    dtypes = {c[0]: c[2] for c in BILL_FILE_COLUMNS if c[2]}
+    if chunk_size:
+        return pd.read_csv(fn, usecols=cols, dtype=dtypes, parse_dates=['From', 'Thru'],
+                           chunksize=chunk_size)
+    else:
+        return iter([pd.read_csv(fn, usecols=cols, dtype=dtypes, parse_dates=['From', 'Thru'])])
+
+def prepare_bills(dfu, fuel_btus, service_to_category):
+    """Returns a DataFrame of the needed (and renamed) columns from the raw
+    Utility Bill DataFrame 'dfu', with an 'mmbtu' column added and the
+    service types converted to the standard service type categories, so the
+    rows are ready to be summed by bench_util.bill_month_totals().  The 
+    non-usage charges are labeled "Other Charge".  'fuel_btus' and 
+    'service_to_category' are the two lookups returned by 
+    bench_util.service_type_lookups().
+    """
+    # Filter down to the needed columns and rename them
+    cols = [(old, new) for old, new, _ in BILL_FILE_COLUMNS if new]
+    old_cols, new_cols = zip(*cols)         # unpack into old and new column names
+    dfu1 = dfu[list(old_cols)].copy()       # select just those columns from the origina dataframe
+    dfu1.columns = new_cols                 # rename the columns
+
+    # Combine all of the non-consumption charges of a bill into one item.
+    dfu1.loc[np.isnan(dfu1.usage), 'item_desc'] = 'Other Charge'
+    # Pandas can't do a GroupBy on NaNs, so replace with something
+    dfu1.units.fillna('-', inplace=True)   
+
+    # Look up the Btus per unit for each row by joining on the lower case
+    # service type and units.  Service types and units that are not energy
+    # sources, or are not in the Services spreadsheet, have no MMBtus.
+    keys = pd.DataFrame({
+        'service': dfu1.service_type.str.lower(),
+        'unit': dfu1.units.str.lower(),
+    })
+    btus = keys.merge(fuel_btus, how='left', on=['service', 'unit']).btu_per_unit.values
+    dfu1['mmbtu'] = np.nan_to_num(btus * dfu1.usage.values / 1e6)
+
+    # Now that original service types have been used to determine MMBtus,
+    # convert all service types to standard service types.
+    dfu1['service_type'] = dfu1.service_type.map(service_to_category)
+
+    return dfu1
+
+def process_bills(dfu1):
+    """Splits and sums the bills in 'dfu1' (produced by prepare_bills()) into
+    monthly totals, returning the DataFrame of monthly totals described in 
+    bench_util.bill_month_totals().
+    """
+    return bu.bill_month_totals(dfu1)
+
+def site_partitions(dfu1, n_parts):
+    """Divides the bill DataFrame 'dfu1' into at most 'n_parts' DataFrames,
+    each holding all of the rows for a contiguous range of the sorted Site IDs.
+    The ranges are chosen so the partitions have similar numbers of rows.
+    Returns a list of the DataFrames, in Site ID order.
+    """
+    site_codes, sites = pd.factorize(dfu1.site_id, sort=True)
+    site_rows = np.bincount(site_codes[site_codes >= 0], minlength=len(sites))
+    rows_before = np.cumsum(site_rows) - site_rows
+    site_part = rows_before * n_parts // max(len(dfu1), 1)
+    row_part = np.where(site_codes >= 0, site_part[site_codes], -1)
+    return [dfu1[row_part == i] for i in np.unique(row_part[row_part >= 0])]
+
+def _process_bills_worker(dfu1):
+    """Runs process_bills() on one site partition in a worker process.  Returns
+    the result, the process ID, and the elapsed time in seconds.
+    """
+    st = time.time()
+    dfu4 = process_bills(dfu1)
+    return dfu4, os.getpid(), time.time() - st
+
+def process_bills_parallel(dfu1, workers):
+    """Same as process_bills(), but the bills are partitioned by site and the
+    partitions are processed by a pool of 'workers' processes.  Each site's
+    bills are processed entirely within one partition, and the partition
+    results are concatenated in Site ID order, so the result is identical to
+    that of process_bills().  The processing time of each worker is printed.
+    """
+    if workers <= 1 or dfu1.site_id.nunique() <= 1:
+        return process_bills(dfu1)
+
+    # Use several partitions per worker so that a partition with slow sites
+    # does not leave the other workers idle.
+    parts = site_partitions(dfu1, workers * 4)
+    worker_times = {}
+    results = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        for dfu4, pid, elapsed in executor.map(_process_bills_worker, parts):
+            results.append(dfu4)
+            n_parts, tot_time = worker_times.get(pid, (0, 0.0))
+            worker_times[pid] = (n_parts + 1, tot_time + elapsed)
+
+    for i, (pid, (n_parts, tot_time)) in enumerate(sorted(worker_times.items())):
+        msg('Worker {} (pid {}): {} partitions in {:.2f} s'.format(i + 1, pid, n_parts, tot_time))
+
+    return pd.concat(results, ignore_index=True)
+
+def bill_fingerprints(dfu1):
+    """Returns a Pandas Series indexed on the BILL_KEYS columns (site, service
+    type, From and Thru dates) giving a fingerprint for each bill in the 
+    'dfu1' DataFrame (produced by prepare_bills()).  The fingerprint is a 
+    hash of all of the charge rows of the bill, so it changes if any
+    charge of the bill changes.
+    """
+    row_hash = pd.util.hash_pandas_object(
+        dfu1[['item_desc', 'units', 'usage', 'cost']], index=False
+    )
+    # The wrapping sum of the row hashes does not depend on the order of the
+    # rows.
+    return row_hash.groupby([dfu1[col] for col in BILL_KEYS]).sum()
+
+def preprocess_incremental(dfu1, cache_dir, workers=1):
+    """Returns the preprocessed DataFrame for the bills in 'dfu1' (produced
+    by prepare_bills()), reusing the results of the last incremental run
+    stored in the BILL_STORE_FILE in the 'cache_dir' directory.  Only bills 
+    that have been added, removed or changed since the last run are split 
+    and summed; their monthly totals are then added to (or, for removed 
+    bills, subtracted from) the stored preprocessed DataFrame.  Bills are 
+    matched through bill_fingerprints().  The store is rebuilt from all the
+    bills if it is missing or cannot be read, or if the Services.xlsx file 
+    or the preprocessing code has changed.  The changed bills are processed 
+    by process_bills_parallel() using 'workers' processes.
+    """
+    fingerprints = bill_fingerprints(dfu1)
+    with open(os.path.join(settings.OTHER_DATA_DIR_PATH, 'Services.xlsx'), 'rb') as fin:
+        services_hash = hashlib.sha1(fin.read()).hexdigest()
+    code_key = preprocess_code_key()
+
+    store_fn = os.path.join(cache_dir, BILL_STORE_FILE)
+    store = None
+    if os.path.exists(store_fn):
+        # A damaged store, or one made by different code, is rebuilt.
+        try:
+            with open(store_fn, 'rb') as fin:
+                store = pickle.load(fin)
+            if (store.get('version') != BILL_STORE_VERSION 
+                    or store['services_hash'] != services_hash
+                    or store['code_key'] != code_key):
+                store = None
+        except (OSError, EOFError, pickle.UnpicklingError, ValueError, 
+                KeyError, AttributeError) as e:
+            msg('The stored bills could not be read ({}: {}).'.format(type(e).__name__, e))
+            store = None
+
+    # Each bill row carries a count so that monthly rows can be removed once
+    # all of the bills contributing to them have been removed.
+    if store is None:
+        msg('No usable stored bills from a prior run; processing all bills.')
+        delta = dfu1.assign(bill_count=1)
+        dfu4 = None
+    else:
+        old_fp = store['fingerprints']
+        common = fingerprints.index.intersection(old_fp.index)
+        changed = common[fingerprints.loc[common].values != old_fp.loc[common].values]
+        added = fingerprints.index.difference(old_fp.index)
+        removed = old_fp.index.difference(fingerprints.index)
+        msg('{} bills added, {} removed and {} changed since the last run.'.format(
+            len(added), len(removed), len(changed)))
+
+        old_bills = store['bills']
+        old_keys = pd.MultiIndex.from_frame(old_bills[BILL_KEYS])
+        new_keys = pd.MultiIndex.from_frame(dfu1[BILL_KEYS])
+        backed_out = old_bills[old_keys.isin(removed.append(changed))].copy()
+        for col in bu.split_cols:
+            backed_out[col] *= -1.0
+        delta = pd.concat([
+            backed_out.assign(bill_count=-1),
+            dfu1[new_keys.isin(added.append(changed))].assign(bill_count=1),
+        ])
+        dfu4 = store['dfu4']
+
+    dfu4_delta = process_bills_parallel(delta, workers)
+    if dfu4 is None:
+        dfu4 = dfu4_delta
+    elif len(dfu4_delta):
+        dfu4 = bu.combine_month_totals(pd.concat([dfu4, dfu4_delta]))
+        dfu4 = dfu4.query('bill_count != 0').reset_index(drop=True)
+
+    # Write to a temporary file first so an interrupted run cannot leave a
+    # partially written store.
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_fn = store_fn + '.tmp'
+    with open(tmp_fn, 'wb') as fout:
+        pickle.dump(
+            dict(
+                version=BILL_STORE_VERSION,
+                services_hash=services_hash,
+                code_key=code_key,
+                fingerprints=fingerprints,
+                bills=dfu1,
+                dfu4=dfu4,
+            ),
+            fout
+        )
+    os.replace(tmp_fn, store_fn)
+
+    return dfu4.drop(columns=['bill_count'])
+
+def degree_day_source():
+    """Returns the (local cache directory, offline) arguments used to obtain
+    the degree-day file; see bench_util.degree_day_file_content().
+    """
+    return (getattr(settings, 'CACHE_DIR_PATH', 'cache/'),
+            getattr(settings, 'DEGREE_DAY_OFFLINE', False))
+
 def preprocess_data():
     """Loads and processes the Utility Bill data into a smaller and more usable
     form.  Returns
-        - a DataFrame with the raw billing data,
+        - a DataFrame with the last bill records for each site and service
+            type, which is all of the raw billing data needed to determine
+            service providers and account numbers,
         - a DataFrame with the preprocessed data,
         - and a bench_util.Util object, which provides useful functions to
             the analysis portion of this script.
     
+    The bill rows are labeled with their standard service type category and
+    MMBtus, and are then split into calendar months and summed into the final
+    (site, service type, month, item description, units) rows in a single 
+    aggregation; see bench_util.bill_month_totals().
+
+    If the UTILITY_BILL_CHUNK_SIZE setting is not zero, the Utility Bill file
+    is read and processed in chunks of that many rows. Each chunk is reduced 
+    to monthly totals before it is combined with the prior chunks, so memory
+    use depends on the number of site-months of data, not on the size of the 
+    file.
+
+    If the INCREMENTAL_PREPROCESSING setting is True, only the bills that
+    changed since the last run are split and summed; see preprocess_incremental().
+
+    If the PREPROCESS_WORKERS setting is greater than 1, the bills are split
+    and summed by that many processes; see process_bills_parallel().  The
+    bills from all chunks are then kept in memory until they are processed.
+
+    If the COMPACT_DATA_FRAME setting is True, the returned DataFrame uses the
+    memory-saving data types of bench_util.compact_bill_frame(), as long as
+    they do not change the data.
+
     This the "preprocess_data.ipynb" was used to develop this code and shows
     intermdediate results from each of the steps.
     """
@@ -74,118 +340,118 @@ def preprocess_data():
     # --- Read the CSV file and convert the billing period dates into 
     #     real Pandas dates
     fn = settings.UTILITY_BILL_FILE_PATH
+    chunk_size = getattr(settings, 'UTILITY_BILL_CHUNK_SIZE', 0)
+    incremental = getattr(settings, 'INCREMENTAL_PREPROCESSING', False)
+    workers = getattr(settings, 'PREPROCESS_WORKERS', 1) or os.cpu_count()
+    dn = settings.OTHER_DATA_DIR_PATH
+    cache_dir = getattr(settings, 'CACHE_DIR_PATH', 'cache/')
+    fuel_btus, service_to_category = bu.service_type_lookups(dn, cache_dir)
     msg('Starting to read Utility Bill Data File.')
-    dfu = pd.read_csv(fn, 
-                      parse_dates=['From', 'Thru'],
-                      dtype={'Site ID': 'object', 'Account Number': 'object'}
-                    )
 
-    msg('Removing Unneeded columns and Combining Charges.')
-    
-    # Filter down to the needed columns and rename them
-    cols = [
-        ('Site ID', 'site_id'),
-        ('From', 'from_dt'),
-        ('Thru', 'thru_dt'),
-        ('Service Name', 'service_type'),
-        ('Item Description', 'item_desc'),
-        ('Usage', 'usage'),
-        ('Cost', 'cost'),
-        ('Units', 'units'),
-    ]
-    
-    old_cols, new_cols = zip(*cols)         # unpack into old and new column names
-    dfu1 = dfu[list(old_cols)].copy()       # select just those columns from the origina dataframe
-    dfu1.columns = new_cols                 # rename the columns
-    
-    # --- Collapse Non-Usage Changes into "Other Charge"
-    
-    # This cuts the processing time in half due to not having to split a whole 
-    # bunch of non-consumption charges.
-    dfu1.loc[np.isnan(dfu1.usage), 'item_desc'] = 'Other Charge'
-    # Pandas can't do a GroupBy on NaNs, so replace with something
-    dfu1.units.fillna('-', inplace=True)   
-    dfu1 = dfu1.groupby(['site_id', 
-                         'from_dt', 
-                         'thru_dt', 
-                         'service_type', 
-                         'item_desc', 
-                         'units']).sum()
-    dfu1.reset_index(inplace=True)
-    
-    # --- Split Each Bill into Multiple Pieces, each within one Calendar Month
-
-    msg('Split Bills into Calendar Month Pieces.')
-    # Split all the rows into calendar month pieces and make a new DataFrame
-    recs=[]
-    for ix, row in dfu1.iterrows():
-        # it is *much* faster to modify a dictionary than a Pandas series
-        row_tmpl = row.to_dict()   
-    
-        # Pull out start and end of billing period; can drop the from & thru dates now
-        # doing split-up of billing period across months.
-        st = row_tmpl['from_dt']
-        en = row_tmpl['thru_dt']
-        del row_tmpl['from_dt']
-        del row_tmpl['thru_dt']
-        
-        for piece in bu.split_period(st, en):
-            new_row = row_tmpl.copy()
-            new_row['cal_year'] = piece.cal_year
-            new_row['cal_mo'] = piece.cal_mo
-            # new_row['days_served'] = piece.days_served    # not really needed
-            new_row['usage'] *= piece.bill_frac
-            new_row['cost'] *= piece.bill_frac
-            recs.append(new_row)
-    
-    dfu2 = pd.DataFrame(recs, index=range(len(recs)))
-    
-    # --- Sum Up the Pieces by Month
-    dfu3 = dfu2.groupby(
-        ['site_id', 'service_type', 'cal_year', 'cal_mo', 'item_desc', 'units']
-    ).sum()
-    dfu3 = dfu3.reset_index()
+    dfu_last = None     # last bill records, accumulated across chunks
+    dfu3 = None         # monthly totals, accumulated across chunks
+    bill_chunks = []    # bills, kept for incremental or parallel preprocessing
+    for dfu in read_bill_file(fn, chunk_size):
+
+        # Only the last bill records are needed to find providers and account
+        # numbers, so discard the rest of the raw data.
+        dfu_last = bu.last_bill_records(pd.concat([dfu_last, dfu]))
+
+        # --- Label Non-Usage Charges as "Other Charge" and add MMBtu and
+        #     Service Category Information
+        msg('Removing Unneeded columns and Adding MMBtu Information.')
+        dfu1 = prepare_bills(dfu, fuel_btus, service_to_category)
+        del dfu
+
+        if incremental or workers > 1:
+            # The bills are compared to those of the last run, or divided 
+            # among the worker processes, after all chunks are read.
+            bill_chunks.append(dfu1)
+            continue
+
+        # --- Split Each Bill into Multiple Pieces, each within one Calendar Month,
+        #     and sum up by month.  Then add to the totals from prior chunks.
+        msg('Split Bills into Calendar Month Pieces and Sum by Month.')
+        dfu3_chunk = process_bills(dfu1)
+        del dfu1
+        if dfu3 is None:
+            dfu3 = dfu3_chunk
+        else:
+            dfu3 = bu.combine_month_totals(pd.concat([dfu3, dfu3_chunk]))
 
     #--- Make a utility function object
     msg('Make an Object containing Useful Utility Functions.')
-    dn = settings.OTHER_DATA_DIR_PATH
-    ut = bu.Util(dfu, dn)
+    ut = bu.Util(dfu_last, dn, *degree_day_source(), excel_cache_dir=cache_dir)
+    load_time = ut.load_all()
+    msg('Site, Service and Degree-Day Information loaded in {:.2f} s.'.format(load_time))
     
-    # --- Add MMBtus Fiscal Year Info and MMBtus
-    msg('Add MMBtu Information.')
-    mmbtu = []
-    for ix, row in dfu3.iterrows():
-        row_mmbtu = ut.fuel_btus_per_unit(row.service_type, row.units) * row.usage / 1e6
-        if np.isnan(row_mmbtu): row_mmbtu = 0.0
-        mmbtu.append(row_mmbtu)
-    dfu3['mmbtu'] = mmbtu
+    if bill_chunks:
+        dfu1 = pd.concat(bill_chunks, ignore_index=True)
+        del bill_chunks
 
-    # Now that original service types have been used to determine MMBtus,
-    # convert all service types to standard service types.
-    dfu3['service_type'] = dfu3.service_type.map(ut.service_to_category())
-
-    # This may cause multiple rows for a fiscal month and service type.
-    # Re-sum to reduce to least number of rows.
-    dfu4 = dfu3.groupby(
-        ['site_id', 'service_type', 'cal_year', 'cal_mo', 'item_desc', 'units']
-    ).sum()
-    dfu4 = dfu4.reset_index()
-
-    # Add the fiscal year information
-    msg('Add Fiscal Year Information.')
-    fyr = []
-    fmo = []
-    for cyr, cmo in zip(dfu4.cal_year, dfu4.cal_mo):
-        fis_yr, fis_mo = bu.calendar_to_fiscal(cyr, cmo)
-        fyr.append(fis_yr)
-        fmo.append(fis_mo)
-    dfu4['fiscal_year'] = fyr
-    dfu4['fiscal_mo'] = fmo
+    if incremental:
+        msg('Update Preprocessed Data from Changed Bills.')
+        dfu4 = preprocess_incremental(dfu1, cache_dir, workers)
+
+    elif workers > 1:
+        msg('Split Bills and Sum by Month using {} Processes.'.format(workers))
+        dfu4 = process_bills_parallel(dfu1, workers)
+
+    else:
+        dfu4 = dfu3
+
+    if getattr(settings, 'COMPACT_DATA_FRAME', False):
+        msg('Convert to Compact Data Types.')
+        dfu4_compact = bu.compact_bill_frame(dfu4, getattr(settings, 'COMPACT_FLOAT32', False))
+        if bu.compact_frame_matches(dfu4, dfu4_compact):
+            dfu4 = dfu4_compact
+        else:
+            msg('Compact data types changed the data; using standard data types.')
+        del dfu4_compact
 
     msg('Preprocessing complete!')
     
-    return dfu, dfu4, ut
+    return dfu_last, dfu4, ut
     
+# The functions whose code determines the preprocessed data.  Used to key the 
+# cache of preprocessed data.
+PREPROCESS_FUNCTIONS = (
+    read_bill_file,
+    degree_day_source,
+    prepare_bills,
+    process_bills,
+    site_partitions,
+    process_bills_parallel,
+    bill_fingerprints,
+    preprocess_incremental,
+    preprocess_data,
+)
+
+def preprocess_code_key():
+    """Returns a hash key identifying the code and settings that 
+    preprocess_data() uses to process the bills.
+    """
+    code_parts = [inspect.getsource(bu), BILL_FILE_COLUMNS, BILL_KEYS,
+                  getattr(settings, 'COMPACT_DATA_FRAME', False),
+                  getattr(settings, 'COMPACT_FLOAT32', False)]
+    code_parts += [inspect.getsource(func) for func in PREPROCESS_FUNCTIONS]
+    return cu.cache_key(*code_parts)
+
+def preprocess_cache_key():
+    """Returns a hash key identifying all of the inputs to preprocess_data():
+    the Utility Bill file, the Buildings.xlsx and Services.xlsx files, the
+    degree-day data, and the code that does the preprocessing.  A cached 
+    result of preprocess_data() is only valid if its key matches this key.
+    """
+    dn = settings.OTHER_DATA_DIR_PATH
+    return cu.cache_key(
+        cu.file_hash(settings.UTILITY_BILL_FILE_PATH),
+        cu.file_hash(os.path.join(dn, 'Buildings.xlsx')),
+        cu.file_hash(os.path.join(dn, 'Services.xlsx')),
+        hashlib.sha1(bu.degree_day_file_content(*degree_day_source())).hexdigest(),
+        preprocess_code_key(),
+    )
+
 #******************************************************************************
 #******************************************************************************
 # --------- Functions that That Produce Reports for One Site ----------
@@ -195,8 +461,10 @@ The functions frequently have some or all of the following input parameters, whi
 are documented here:
 
     Input parameters:
-        site:  The Site ID of the site to analyze.
-        df:    The preprocessed Pandas DataFrame of Utility Bill information.
+        site:     The Site ID of the site to analyze.
+        site_ix:  A bench_util.SiteIndex of the preprocessed Pandas DataFrame
+                      of Utility Bill information, giving the rows for one 
+                      site (site_ix[site]) or for all sites (site_ix.df).
         ut:    The bench_util.Util object that provides additional site data
                    needed in the benchmarking process.
 The functions all save the required graphs for their respective reports to the
@@ -225,11 +493,326 @@ def building_info_report(site, ut, report_date_time):
 
 # -------------------------- Energy Index Report ----------------------------
 
-def energy_index_report(site, df, ut):
-    """As well as returning template data, this function writes a spreadsheet
-    that summarizes values for every building.  The spreadsheet is written to
+class EnergyIndexPortfolio:
+    """Holds the portfolio-wide data used by the Energy Index report, which
+    is the same for every site: the Details table of every building for a 
+    fiscal year, with totals and ranks across all buildings, and the yearly 
+    EUI and ECI values of every site that are used by the comparison 
+    graphs, with their percentile bands.  Each is computed the first time it
+    is needed and reused for the remaining sites.
+    """
+
+    def __init__(self, site_ix, ut):
+        """'site_ix' and 'ut' are the same as for the report functions."""
+        self.site_ix = site_ix
+        self.ut = ut
+        self._last_complete_year = None
+        self._details = {}         # Details table data, keyed on fiscal year
+        self._comparison = None
+        self._comparison_ix = None  # comparison data partitioned by site
+        self._bands = None
+
+    def last_complete_year(self):
+        """Returns the last complete fiscal year for the entire dataset."""
+        if self._last_complete_year is not None:
+            return self._last_complete_year
+
+        # Determine month count by year for Electricity in entire dataset
+        # to determine the latest complete year.
+        electric_only = self.site_ix.df.query("service_type == 'electricity'")
+        electric_months_present = bu.months_present(electric_only)
+        electric_mo_count = bu.month_count(electric_months_present)
+        self._last_complete_year = max(electric_mo_count[electric_mo_count==12].index)
+        return self._last_complete_year
+
+    def details_year(self, site):
+        """Returns the fiscal year used for the Details table of 'site': the
+        last complete year of energy use for the site or, if the site has no
+        complete year, the last complete year for the entire dataset.
+        """
+        energy_services = bu.missing_energy_services([])
+        df1 = self.site_ix[site].query('service_type==@energy_services')
+        mo_count = bu.month_count(bu.months_present(df1))
+        full_years = mo_count[mo_count == 12].index
+        return full_years.max() if len(full_years) else self.last_complete_year()
+
+    def prepare(self, site_ids):
+        """Computes all of the data needed by the Energy Index reports of the
+        sites in 'site_ids', so that it can be shared with worker processes
+        instead of being computed in each of them.
+        """
+        for fiscal_year in sorted(set(self.details_year(site) for site in site_ids)):
+            self.details(fiscal_year)
+        self.comparison_bands()
+        self.comparison_site_index()
+
+    def details(self, fiscal_year):
+        """Returns the data for the Details table for the fiscal year 
+        'fiscal_year': (DataFrame of values for each building, Series of 
+        totals across all buildings, DataFrame of building ranks).  The first
+        time a year is requested, its DataFrame of building values is also 
+        saved to the spreadsheet 'output/extra_data/site_summary_FYYYYY.xlsx'.
+        """
+        if fiscal_year in self._details:
+            return self._details[fiscal_year]
+
+        # Filter down to just the records of the targeted fiscal year
+        df1 = self.site_ix.df.query('fiscal_year == @fiscal_year')
+
+        # Get Total Utility cost by building. This includes non-energy utilities as well.
+        df2 = df1.pivot_table(index='site_id', values=['cost'], aggfunc=np.sum, observed=True)
+        df2.columns = ['total_cost']
+
+        # Save this into the Final DataFrame that we will build up as we go.
+        df_final = df2.copy()
+
+        # Get a list of the Energy Services and restrict the data to
+        # just these services
+        energy_svcs = bu.missing_energy_services([])
+        df2 = df1.query('service_type == @energy_svcs')
+
+        # Summarize Cost by Service Type
+        df3 = pd.pivot_table(df2, index='site_id', columns='service_type', values='cost', aggfunc=np.sum, observed=True)
+
+        # Add in any missing columns
+        bu.add_missing_columns(df3, energy_svcs)
+
+        # Change column names
+        cols = ['{}_cost'.format(col) for col in df3.columns]
+        df3.columns = cols
+
+        # Add a total energy cost column
+        df3['total_energy_cost'] = df3.sum(axis=1)
+
+        # Add a total Heat Cost Column
+        df3['total_heat_cost'] = df3.total_energy_cost.fillna(0.0) - df3.electricity_cost.fillna(0.0)
+
+        # Add this to the final DataFrame
+        df_final = pd.concat([df_final, df3], axis=1, sort=True)
+
+        # Summarize MMBtu by Service Type
+        df3 = pd.pivot_table(df2, index='site_id', columns='service_type', values='mmbtu', aggfunc=np.sum, observed=True)
+
+        # Add in any missing columns
+        bu.add_missing_columns(df3, energy_svcs)
+
+        # Change column names
+        cols = ['{}_mmbtu'.format(col) for col in df3.columns]
+        df3.columns = cols
+
+        # Add a total mmbtu column
+        df3['total_mmbtu'] = df3.sum(axis=1)
+
+        # Add a total Heat mmbtu Column
+        df3['total_heat_mmbtu'] = df3.total_mmbtu.fillna(0.0) - df3.electricity_mmbtu.fillna(0.0)
+
+        # Add this to the final DataFrame
+        df_final = pd.concat([df_final, df3], axis=1, sort=True)
+
+        # Electricity kWh summed by building
+        df3 = pd.pivot_table(df2.query('units == "kWh"'), index='site_id', values='usage', aggfunc=np.sum, observed=True)
+        df3.columns = ['electricity_kwh']
+
+        # Include in Final DF
+        df_final = pd.concat([df_final, df3], axis=1, sort=True)
+
+        # Electricity kW, both Average and Max by building
+        # First, sum up kW pieces for each month.
+        df3 = df2.query('units == "kW"').groupby(['site_id', 'fiscal_year', 'fiscal_mo'], observed=True).sum()
+        df3 = pd.pivot_table(df3.reset_index(), index='site_id', values='usage', aggfunc=[np.mean, np.max], observed=True)
+        df3.columns = ['electricity_kw_average', 'electricity_kw_max']
+
+        # Add into Final Frame
+        df_final = pd.concat([df_final, df3], axis=1, sort=True)
+
+        # Add in Square footage info
+        df_bldg = self.ut.building_info_df()[['sq_ft']]
+
+        # Add into Final Frame.  I do a merge here so as not to bring
+        # in buildings from the building info spreadsheet that are not in this
+        # dataset; this dataset has been restricted to one year.
+        df_final = pd.merge(df_final, df_bldg, how='left', left_index=True, right_index=True)
+
+        # Build a DataFrame that has monthly degree days for each site/year/month
+        # combination.
+        combos = set(zip(df1.site_id, df1.fiscal_year, df1.fiscal_mo))
+        df_dd = pd.DataFrame(data=list(combos), columns=['site_id', 'fiscal_year', 'fiscal_mo'])
+        self.ut.add_degree_days_col(df_dd)
+
+        # Add up the degree days by site (we've already filtered down to one year or less
+        # of data.)
+        dd_series = df_dd.groupby('site_id', observed=True).sum()['degree_days']
+
+        # Put in final DataFrame
+        df_final = pd.concat([df_final, dd_series], axis=1)
+
+        # Add in a column that gives the number of months present for each site
+        # in this year.  Then filter down to just the sites that have 12 months
+        # of data.
+        df_final.reset_index(inplace=True)
+        df_final['fiscal_year'] = fiscal_year
+        df_final.set_index(['site_id', 'fiscal_year'], inplace=True)
+        df_final = bu.add_month_count_column_by_site(df_final, df2)
+        df_final = df_final.query('month_count==12').copy()
+        df_final.reset_index(inplace=True)
+        df_final.set_index('site_id', inplace=True)
+
+        # Calculate per square foot values for each building.
+        df_final['eui'] = df_final.total_mmbtu * 1e3 / df_final.sq_ft
+        df_final['eci'] = df_final.total_energy_cost / df_final.sq_ft
+        df_final['specific_eui'] = df_final.total_heat_mmbtu * 1e6 / df_final.sq_ft / df_final.degree_days
+
+        # Save this to a spreadsheet.  Write to a temporary file first, as 
+        # worker processes may save the same spreadsheet.
+        fn = 'output/extra_data/site_summary_FY{}.xlsx'.format(fiscal_year)
+        tmp_fn = '{}.{}.tmp.xlsx'.format(fn[:-5], os.getpid())
+        with pd.ExcelWriter(tmp_fn) as excel_writer:
+            df_final.to_excel(excel_writer, sheet_name='Sites')
+        os.replace(tmp_fn, fn)
+
+        # Get the totals across all buildings
+        totals_all_bldgs = df_final.sum()
+
+        # Total Degree-Days are not relevant
+        totals_all_bldgs.drop(['degree_days'], inplace=True)
+
+        # Only use the set of buildings that have some energy use and non-zero
+        # square footage to determine EUI's and ECI's
+        energy_bldgs = df_final.query("total_mmbtu > 0 and sq_ft > 0")
+
+        # Get total square feet, energy use, and energy cost for these buildings
+        # and calculate EUI and ECI
+        sq_ft_energy_bldgs = energy_bldgs.sq_ft.sum()
+        energy_in_energy_bldgs = energy_bldgs.total_mmbtu.sum()
+        energy_cost_in_energy_bldgs = energy_bldgs.total_energy_cost.sum()
+        totals_all_bldgs['eui'] = energy_in_energy_bldgs * 1e3 / sq_ft_energy_bldgs
+        totals_all_bldgs['eci'] = energy_cost_in_energy_bldgs / sq_ft_energy_bldgs
+
+        # For calculating heating specific EUI, further filter the set of
+        # buildings down to those that have heating fuel use.
+        # Get separate square footage total and weighted average degree-day for these.
+        heat_bldgs = energy_bldgs.query("total_heat_mmbtu > 0")
+        heat_bldgs_sq_ft = heat_bldgs.sq_ft.sum()
+        heat_bldgs_heat_mmbtu = heat_bldgs.total_heat_mmbtu.sum()
+        heat_bldgs_degree_days = (heat_bldgs.total_heat_mmbtu * heat_bldgs.degree_days).sum() / heat_bldgs.total_heat_mmbtu.sum()
+        totals_all_bldgs['specific_eui'] = heat_bldgs_heat_mmbtu * 1e6 / heat_bldgs_sq_ft / heat_bldgs_degree_days
+
+        # calculate a rank DataFrame
+        df_rank = pd.DataFrame()
+        for col in df_final.columns:
+            df_rank[col] = df_final[col].rank(ascending=False)
+
+        self._details[fiscal_year] = (df_final, totals_all_bldgs, df_rank)
+        return self._details[fiscal_year]
+
+    def comparison_data(self):
+        """Returns a DataFrame of the yearly cost, energy use, EUI, ECI and 
+        specific EUI of every site, for full years only, used by the Energy
+        Comparison graphs.
+        """
+        if self._comparison is not None:
+            return self._comparison
+
+        # Filter down to only services that are energy services.
+        energy_services = bu.missing_energy_services([])
+        df4 = self.site_ix.df.query('service_type==@energy_services').copy()
+
+        # Sum Energy Costs and Usage
+        df5 = pd.pivot_table(df4, index=['site_id', 'fiscal_year'], values=['cost', 'mmbtu'], aggfunc=np.sum, observed=True)
+
+        # Add a column showing number of months present in each fiscal year.
+        df5 = bu.add_month_count_column_by_site(df5, df4)
+
+        # Create an Electric MMBtu column so it can be subtracted from total to determine
+        # Heat MMBtu.
+        dfe = df4.query("service_type=='Electricity'").groupby(['site_id', 'fiscal_year'], observed=True).sum()[['mmbtu']]
+        dfe.rename(columns={'mmbtu': 'elec_mmbtu'}, inplace = True)
+        df5 = df5.merge(dfe, how='left', left_index=True, right_index=True)
+        df5['elec_mmbtu'] = df5['elec_mmbtu'].fillna(0.0)
+        df5['heat_mmbtu'] = df5.mmbtu - df5.elec_mmbtu
+
+        # Add in degree-days:
+        # Create a DataFrame with site, year, month and degree-days, but only one row
+        # for each site/year/month combo.
+        dfd = df4[['site_id', 'fiscal_year', 'fiscal_mo']].copy()
+        dfd.drop_duplicates(inplace=True)
+        self.ut.add_degree_days_col(dfd)
+
+        # Use the agg function below so that a NaN will be returned for the year
+        # if any monthly values are NaN
+        dfd = dfd.groupby(['site_id', 'fiscal_year'], observed=True).agg({'degree_days': lambda x: np.sum(x.values)})[['degree_days']]
+        df5 = df5.merge(dfd, how='left', left_index=True, right_index=True)
+
+        # Add in some needed building info like square footage, primary function 
+        # and building category.
+        df_bldg = self.ut.building_info_df()
+
+        # Shrink to just the needed fields and remove index.
+        # Also, fill blank values with 'Unknown'.
+        df_info = df_bldg[['sq_ft', 'site_category', 'primary_func']].copy().reset_index()
+        df_info['site_category'] = df_info.site_category.fillna('Unknown')
+        df_info['primary_func'] = df_info.primary_func.fillna('Unknown Type')
+
+        # Also Remove the index from df5 and merge in building info
+        df5.reset_index(inplace=True)
+        df5 = df5.merge(df_info, how='left')
+
+        # Now calculate per square foot energy measures
+        df5['eui'] = df5.mmbtu * 1e3 / df5.sq_ft
+        df5['eci'] = df5.cost / df5.sq_ft
+        df5['specific_eui'] = df5.heat_mmbtu * 1e6 / df5.degree_days / df5.sq_ft
+
+        # Restrict to full years
+        df5 = df5.query("month_count == 12").copy()
+
+        self._comparison = df5
+        return df5
+
+    def comparison_bands(self):
+        """Returns the DataFrame of 10th and 90th percentile bands for each
+        building type and owner, from graph_util.comparison_bands(), used by 
+        the Energy Comparison graphs.
+        """
+        if self._bands is None:
+            self._bands = gu.comparison_bands(self.comparison_data())
+        return self._bands
+
+    def comparison_site_index(self):
+        """Returns the comparison data partitioned by site, as a 
+        bench_util.SiteIndex.
+        """
+        if self._comparison_ix is None:
+            self._comparison_ix = bu.SiteIndex(self.comparison_data())
+        return self._comparison_ix
+
+    def site_comparison_data(self, site):
+        """Returns the data needed by the Energy Comparison graphs of 'site':
+        (the rows of comparison_data() for the site, the rows of 
+        comparison_bands() for the site's building type and owner).  Only 
+        this data is passed to the graphs, so the graph jobs stay small when
+        the graphs are rendered by a pool of processes.
+        """
+        site_df = self.comparison_site_index()[site]
+        bands = self.comparison_bands()
+        if len(site_df) == 0:
+            return site_df, bands.iloc[:0]
+
+        group_type = bands.index.get_level_values('group_type')
+        group = bands.index.get_level_values('group')
+        keep = (((group_type == 'primary_func') & (group == site_df.primary_func.iloc[0])) |
+                ((group_type == 'site_category') & (group == site_df.site_category.iloc[0])))
+        return site_df, bands[keep]
+
+def energy_index_report(site, site_ix, ut, portfolio=None):
+    """'portfolio' is the EnergyIndexPortfolio holding the data for all of 
+    the buildings; pass the same object for every site so that data is only
+    computed once.  If None, a new one is made.  As well as returning template
+    data, the portfolio writes a spreadsheet that summarizes values for every
+    building.  The spreadsheet is written to 
     'output/extra_data/site_summary_FYYYYY.xlsx'.
     """
+    if portfolio is None:
+        portfolio = EnergyIndexPortfolio(site_ix, ut)
 
     # Start a dictionary with the main key to hold the template data
     template_data = {'energy_index_comparison': {}}
@@ -239,19 +822,19 @@ def energy_index_report(site, df, ut):
     # Filter down to just this site's bills and only services that
     # are energy services.
     energy_services = bu.missing_energy_services([])
-    df1 = df.query('site_id==@site and service_type==@energy_services')
+    df1 = site_ix[site].query('service_type==@energy_services')
 
     # Only do this table if there are energy services.
     if not df1.empty:
 
         # Sum Energy Costs and Usage
-        df2 = pd.pivot_table(df1, index='fiscal_year', values=['cost', 'mmbtu'], aggfunc=np.sum)
+        df2 = pd.pivot_table(df1, index='fiscal_year', values=['cost', 'mmbtu'], aggfunc=np.sum, observed=True)
 
         # Add a column showing number of months present in each fiscal year.
         bu.add_month_count_column(df2, df1)
 
         # Make a column with just the Heat MMBtu
-        dfe = df1.query("service_type=='electricity'").groupby('fiscal_year').sum()[['mmbtu']]
+        dfe = df1.query("service_type=='electricity'").groupby('fiscal_year', observed=True).sum()[['mmbtu']]
         dfe.rename(columns={'mmbtu': 'elec_mmbtu'}, inplace = True)
         df2 = df2.merge(dfe, how='left', left_index=True, right_index=True)
         df2['elec_mmbtu'] = df2['elec_mmbtu'].fillna(0.0)
@@ -285,159 +868,9 @@ def energy_index_report(site, df, ut):
     # Use the last complete year for this site as the year for the Details
     # table.  If there was no complete year for the site, then use the
     # last complete year for the entire dataset.
-    if 'df2' in locals() and len(df2):
-        last_complete_year = df2.index.max()
-    else:
-        # Determine month count by year for Electricity in entire dataset
-        # to determine the latest complete year.
-        electric_only = df.query("service_type == 'electricity'")
-        electric_months_present = bu.months_present(electric_only)
-        electric_mo_count = bu.month_count(electric_months_present)
-        last_complete_year = max(electric_mo_count[electric_mo_count==12].index)
-
-    # Filter down to just the records of the targeted fiscal year
-    df1 = df.query('fiscal_year == @last_complete_year')
-
-    # Get Total Utility cost by building. This includes non-energy utilities as well.
-    df2 = df1.pivot_table(index='site_id', values=['cost'], aggfunc=np.sum)
-    df2.columns = ['total_cost']
-
-    # Save this into the Final DataFrame that we will build up as we go.
-    df_final = df2.copy()
+    last_complete_year = portfolio.details_year(site)
 
-    # Get a list of the Energy Services and restrict the data to
-    # just these services
-    energy_svcs = bu.missing_energy_services([])
-    df2 = df1.query('service_type == @energy_svcs')
-
-    # Summarize Cost by Service Type
-    df3 = pd.pivot_table(df2, index='site_id', columns='service_type', values='cost', aggfunc=np.sum)
-
-    # Add in any missing columns
-    bu.add_missing_columns(df3, energy_svcs)
-
-    # Change column names
-    cols = ['{}_cost'.format(col) for col in df3.columns]
-    df3.columns = cols
-
-    # Add a total energy cost column
-    df3['total_energy_cost'] = df3.sum(axis=1)
-
-    # Add a total Heat Cost Column
-    df3['total_heat_cost'] = df3.total_energy_cost.fillna(0.0) - df3.electricity_cost.fillna(0.0)
-
-    # Add this to the final DataFrame
-    df_final = pd.concat([df_final, df3], axis=1, sort=True)
-
-    # Summarize MMBtu by Service Type
-    df3 = pd.pivot_table(df2, index='site_id', columns='service_type', values='mmbtu', aggfunc=np.sum)
-
-    # Add in any missing columns
-    bu.add_missing_columns(df3, energy_svcs)
-
-    # Change column names
-    cols = ['{}_mmbtu'.format(col) for col in df3.columns]
-    df3.columns = cols
-
-    # Add a total mmbtu column
-    df3['total_mmbtu'] = df3.sum(axis=1)
-
-    # Add a total Heat mmbtu Column
-    df3['total_heat_mmbtu'] = df3.total_mmbtu.fillna(0.0) - df3.electricity_mmbtu.fillna(0.0)
-
-    # Add this to the final DataFrame
-    df_final = pd.concat([df_final, df3], axis=1, sort=True)
-
-    # Electricity kWh summed by building
-    df3 = pd.pivot_table(df2.query('units == "kWh"'), index='site_id', values='usage', aggfunc=np.sum)
-    df3.columns = ['electricity_kwh']
-
-    # Include in Final DF
-    df_final = pd.concat([df_final, df3], axis=1, sort=True)
-
-    # Electricity kW, both Average and Max by building
-    # First, sum up kW pieces for each month.
-    df3 = df2.query('units == "kW"').groupby(['site_id', 'fiscal_year', 'fiscal_mo']).sum()
-    df3 = pd.pivot_table(df3.reset_index(), index='site_id', values='usage', aggfunc=[np.mean, np.max])
-    df3.columns = ['electricity_kw_average', 'electricity_kw_max']
-
-    # Add into Final Frame
-    df_final = pd.concat([df_final, df3], axis=1, sort=True)
-
-    # Add in Square footage info
-    df_bldg = ut.building_info_df()[['sq_ft']]
-
-    # Add into Final Frame.  I do a merge here so as not to bring
-    # in buildings from the building info spreadsheet that are not in this
-    # dataset; this dataset has been restricted to one year.
-    df_final = pd.merge(df_final, df_bldg, how='left', left_index=True, right_index=True)
-
-    # Build a DataFrame that has monthly degree days for each site/year/month
-    # combination.
-    combos = set(zip(df1.site_id, df1.fiscal_year, df1.fiscal_mo))
-    df_dd = pd.DataFrame(data=list(combos), columns=['site_id', 'fiscal_year', 'fiscal_mo'])
-    ut.add_degree_days_col(df_dd)
-
-    # Add up the degree days by site (we've already filtered down to one year or less
-    # of data.)
-    dd_series = df_dd.groupby('site_id').sum()['degree_days']
-
-    # Put in final DataFrame
-    df_final = pd.concat([df_final, dd_series], axis=1)
-
-    # Add in a column that gives the number of months present for each site
-    # in this year.  Then filter down to just the sites that have 12 months
-    # of data.
-    df_final.reset_index(inplace=True)
-    df_final['fiscal_year'] = last_complete_year
-    df_final.set_index(['site_id', 'fiscal_year'], inplace=True)
-    df_final = bu.add_month_count_column_by_site(df_final, df2)
-    df_final = df_final.query('month_count==12').copy()
-    df_final.reset_index(inplace=True)
-    df_final.set_index('site_id', inplace=True)
-
-    # Calculate per square foot values for each building.
-    df_final['eui'] = df_final.total_mmbtu * 1e3 / df_final.sq_ft
-    df_final['eci'] = df_final.total_energy_cost / df_final.sq_ft
-    df_final['specific_eui'] = df_final.total_heat_mmbtu * 1e6 / df_final.sq_ft / df_final.degree_days
-
-    # Save this to a spreadsheet, if it has not already been saved
-    fn = 'output/extra_data/site_summary_FY{}.xlsx'.format(last_complete_year)
-    if not os.path.exists(fn):
-        excel_writer = pd.ExcelWriter(fn)
-        df_final.to_excel(excel_writer, sheet_name='Sites')
-
-    # Get the totals across all buildings
-    totals_all_bldgs = df_final.sum()
-
-    # Total Degree-Days are not relevant
-    totals_all_bldgs.drop(['degree_days'], inplace=True)
-
-    # Only use the set of buildings that have some energy use and non-zero
-    # square footage to determine EUI's and ECI's
-    energy_bldgs = df_final.query("total_mmbtu > 0 and sq_ft > 0")
-
-    # Get total square feet, energy use, and energy cost for these buildings
-    # and calculate EUI and ECI
-    sq_ft_energy_bldgs = energy_bldgs.sq_ft.sum()
-    energy_in_energy_bldgs = energy_bldgs.total_mmbtu.sum()
-    energy_cost_in_energy_bldgs = energy_bldgs.total_energy_cost.sum()
-    totals_all_bldgs['eui'] = energy_in_energy_bldgs * 1e3 / sq_ft_energy_bldgs
-    totals_all_bldgs['eci'] = energy_cost_in_energy_bldgs / sq_ft_energy_bldgs
-
-    # For calculating heating specific EUI, further filter the set of
-    # buildings down to those that have heating fuel use.
-    # Get separate square footage total and weighted average degree-day for these.
-    heat_bldgs = energy_bldgs.query("total_heat_mmbtu > 0")
-    heat_bldgs_sq_ft = heat_bldgs.sq_ft.sum()
-    heat_bldgs_heat_mmbtu = heat_bldgs.total_heat_mmbtu.sum()
-    heat_bldgs_degree_days = (heat_bldgs.total_heat_mmbtu * heat_bldgs.degree_days).sum() / heat_bldgs.total_heat_mmbtu.sum()
-    totals_all_bldgs['specific_eui'] = heat_bldgs_heat_mmbtu * 1e6 / heat_bldgs_sq_ft / heat_bldgs_degree_days
-
-    # calculate a rank DataFrame
-    df_rank = pd.DataFrame()
-    for col in df_final.columns:
-        df_rank[col] = df_final[col].rank(ascending=False)
+    df_final, totals_all_bldgs, df_rank = portfolio.details(last_complete_year)
 
     if site in df_final.index:
         # The site exists in the DataFrame
@@ -464,76 +897,26 @@ def energy_index_report(site, df, ut):
 
     # -------------- Energy Comparison Graphs ---------------
 
-    # Filter down to only services that are energy services.
-    energy_services = bu.missing_energy_services([])
-    df4 = df.query('service_type==@energy_services').copy()
-
-    # Sum Energy Costs and Usage
-    df5 = pd.pivot_table(df4, index=['site_id', 'fiscal_year'], values=['cost', 'mmbtu'], aggfunc=np.sum)
-
-    # Add a column showing number of months present in each fiscal year.
-    df5 = bu.add_month_count_column_by_site(df5, df4)
-
-    # Create an Electric MMBtu column so it can be subtracted from total to determine
-    # Heat MMBtu.
-    dfe = df4.query("service_type=='Electricity'").groupby(['site_id', 'fiscal_year']).sum()[['mmbtu']]
-    dfe.rename(columns={'mmbtu': 'elec_mmbtu'}, inplace = True)
-    df5 = df5.merge(dfe, how='left', left_index=True, right_index=True)
-    df5['elec_mmbtu'] = df5['elec_mmbtu'].fillna(0.0)
-    df5['heat_mmbtu'] = df5.mmbtu - df5.elec_mmbtu
-
-    # Add in degree-days:
-    # Create a DataFrame with site, year, month and degree-days, but only one row
-    # for each site/year/month combo.
-    dfd = df4[['site_id', 'fiscal_year', 'fiscal_mo']].copy()
-    dfd.drop_duplicates(inplace=True)
-    ut.add_degree_days_col(dfd)
-
-    # Use the agg function below so that a NaN will be returned for the year
-    # if any monthly values are NaN
-    dfd = dfd.groupby(['site_id', 'fiscal_year']).agg({'degree_days': lambda x: np.sum(x.values)})[['degree_days']]
-    df5 = df5.merge(dfd, how='left', left_index=True, right_index=True)
-
-    # Add in some needed building info like square footage, primary function 
-    # and building category.
-    df_bldg = ut.building_info_df()
-
-    # Shrink to just the needed fields and remove index.
-    # Also, fill blank values with 'Unknown'.
-    df_info = df_bldg[['sq_ft', 'site_category', 'primary_func']].copy().reset_index()
-    df_info['site_category'] = df_info.site_category.fillna('Unknown')
-    df_info['primary_func'] = df_info.primary_func.fillna('Unknown Type')
-
-    # Also Remove the index from df5 and merge in building info
-    df5.reset_index(inplace=True)
-    df5 = df5.merge(df_info, how='left')
-
-    # Now calculate per square foot energy measures
-    df5['eui'] = df5.mmbtu * 1e3 / df5.sq_ft
-    df5['eci'] = df5.cost / df5.sq_ft
-    df5['specific_eui'] = df5.heat_mmbtu * 1e6 / df5.degree_days / df5.sq_ft
-
-    # Restrict to full years
-    df5 = df5.query("month_count == 12").copy()
+    df5, bands = portfolio.site_comparison_data(site)
 
     # Make all of the comparison graphs
     g1_fn, g1_url = gu.graph_filename_url(site, 'eci_func')
-    gu.building_type_comparison_graph(df5, 'eci', site, g1_fn)
+    g1_url = gu.building_type_comparison_graph(df5, 'eci', site, g1_fn, bands) or g1_url
 
     g2_fn, g2_url = gu.graph_filename_url(site, 'eci_owner')
-    gu.building_owner_comparison_graph(df5, 'eci', site, g2_fn)
+    g2_url = gu.building_owner_comparison_graph(df5, 'eci', site, g2_fn, bands) or g2_url
     
     g3_fn, g3_url = gu.graph_filename_url(site, 'eui_func')
-    gu.building_type_comparison_graph(df5, 'eui', site, g3_fn)
+    g3_url = gu.building_type_comparison_graph(df5, 'eui', site, g3_fn, bands) or g3_url
 
     g4_fn, g4_url = gu.graph_filename_url(site, 'eui_owner')
-    gu.building_owner_comparison_graph(df5, 'eui', site, g4_fn)
+    g4_url = gu.building_owner_comparison_graph(df5, 'eui', site, g4_fn, bands) or g4_url
 
     g5_fn, g5_url = gu.graph_filename_url(site, 'speui_func')
-    gu.building_type_comparison_graph(df5, 'specific_eui', site, g5_fn)
+    g5_url = gu.building_type_comparison_graph(df5, 'specific_eui', site, g5_fn, bands) or g5_url
 
     g6_fn, g6_url = gu.graph_filename_url(site, 'speui_owner')
-    gu.building_owner_comparison_graph(df5, 'specific_eui', site, g6_fn)
+    g6_url = gu.building_owner_comparison_graph(df5, 'specific_eui', site, g6_fn, bands) or g6_url
 
     template_data['energy_index_comparison']['graphs'] = [
         g1_url, g2_url, g3_url, g4_url, g5_url, g6_url
@@ -543,14 +926,14 @@ def energy_index_report(site, df, ut):
 
 # ------------------ Utility Cost Overview Report ----------------------
 
-def utility_cost_report(site, df, ut):
+def utility_cost_report(site, site_ix, ut):
     """As well as return the template data, this function returns a utility cost
     DataFrame that is needed in the Heating Cost Analysis Report.
     """
 
     # From the main DataFrame, get only the rows for this site, and only get
     # the needed columns for this analysis
-    df1 = df.query('site_id == @site')[['service_type', 'fiscal_year', 'fiscal_mo', 'cost']]
+    df1 = site_ix[site][['service_type', 'fiscal_year', 'fiscal_mo', 'cost']]
 
     # Summarize cost by fiscal year and service type.
     df2 = pd.pivot_table(
@@ -558,7 +941,8 @@ def utility_cost_report(site, df, ut):
         values='cost',
         index=['fiscal_year'],
         columns=['service_type'],
-        aggfunc=np.sum
+        aggfunc=np.sum,
+        observed=True
     )
 
     # Add in columns for the missing services
@@ -599,11 +983,11 @@ def utility_cost_report(site, df, ut):
 
     # make the area cost distribution graph
     utility_list = bu.all_services.copy()
-    gu.area_cost_distribution(reset_df2, 'fiscal_year', utility_list, g1_fn);
+    g1_url = gu.area_cost_distribution(reset_df2, 'fiscal_year', utility_list, g1_fn) or g1_url
 
     # make the stacked bar graph
     g2_fn, g2_url = gu.graph_filename_url(site, 'util_cost_ovw_g2')
-    gu.create_stacked_bar(reset_df2, 'fiscal_year', utility_list, 'Utility Cost ($)', "Annual Cost by Utility Type",g2_fn)
+    g2_url = gu.create_stacked_bar(reset_df2, 'fiscal_year', utility_list, 'Utility Cost ($)', "Annual Cost by Utility Type",g2_fn) or g2_url
 
     # Put results into the final dictionary that will be passed to the Template.
     # A function is used to convert the DataFrame into a list of dictionaries.
@@ -618,7 +1002,7 @@ def utility_cost_report(site, df, ut):
 
 # -------------------- Energy Use and Cost Reports -----------------------
 
-def energy_use_cost_reports(site, df, ut, df_utility_cost):
+def energy_use_cost_reports(site, site_ix, ut, df_utility_cost):
     """This does both the Energy Usage report and the Energy Cost & Usage
     Pie charts.
     'df_utility_cost' is a summary utility cost DataFrame from the prior
@@ -629,7 +1013,7 @@ def energy_use_cost_reports(site, df, ut, df_utility_cost):
 
     # From the main DataFrame, get only the rows for this site, and only get
     # the needed columns for this analysis
-    usage_df1 = df.query('site_id == @site')[['service_type', 'fiscal_year', 'fiscal_mo', 'mmbtu']]
+    usage_df1 = site_ix[site][['service_type', 'fiscal_year', 'fiscal_mo', 'mmbtu']]
 
     # Total mmbtu by service type and year.
     usage_df2 = pd.pivot_table(
@@ -637,7 +1021,8 @@ def energy_use_cost_reports(site, df, ut, df_utility_cost):
         values='mmbtu',
         index=['fiscal_year'],
         columns=['service_type'],
-        aggfunc=np.sum
+        aggfunc=np.sum,
+        observed=True
     )
 
     # drop non-energy columns
@@ -688,11 +1073,11 @@ def energy_use_cost_reports(site, df, ut, df_utility_cost):
     p4g2_filename, p4g2_url = gu.graph_filename_url(site, 'energy_usage_ovw_g2')
 
     # Create the area graph
-    gu.area_use_distribution(reset_usage_df2, 'fiscal_year', usage_cols, p4g2_filename)
+    p4g2_url = gu.area_use_distribution(reset_usage_df2, 'fiscal_year', usage_cols, p4g2_filename) or p4g2_url
 
     # The stacked bar graph
     p4g1_filename, p4g1_url = gu.graph_filename_url(site, 'energy_usage_ovw_g1')
-    gu.energy_use_stacked_bar(reset_usage_df2, 'fiscal_year', usage_cols, p4g1_filename)
+    p4g1_url = gu.energy_use_stacked_bar(reset_usage_df2, 'fiscal_year', usage_cols, p4g1_filename) or p4g1_url
 
     # Convert df to dictionary
     energy_use_overview_rows = bu.df_to_dictionaries(usage_df2)
@@ -725,11 +1110,11 @@ def energy_use_cost_reports(site, df, ut, df_utility_cost):
 
 # -------------------- Electrical Usage and Cost Reports  -------------------------
 
-def electrical_usage_and_cost_reports(site, df):
+def electrical_usage_and_cost_reports(site, site_ix):
     """This does both the Electrical Usage and Electrical
     Cost reports."""
 
-    site_df = df.query("site_id == @site")
+    site_df = site_ix[site]
 
     electric_df = site_df.query("units == 'kWh' or units == 'kW'")
     if 'electricity' in site_df.service_type.unique() and site_df.query("service_type == 'electricity'")['usage'].sum(axis=0) > 0:
@@ -738,10 +1123,10 @@ def electrical_usage_and_cost_reports(site, df):
                                     index=['fiscal_year', 'fiscal_mo'],
                                     columns=['units'],
                                     values='usage',
-                                    aggfunc=np.sum)
+                                    aggfunc=np.sum, observed=True)
     else:
         # Create an empty dataframe with the correct index
-        electric_pivot_monthly = site_df.groupby(['fiscal_year', 'fiscal_mo']).mean()[[]]
+        electric_pivot_monthly = site_df.groupby(['fiscal_year', 'fiscal_mo'], observed=True).mean()[[]]
 
     # Add in missing electricity columns and fill them with zeros
     electric_pivot_monthly = bu.add_missing_columns(electric_pivot_monthly, ['kWh', 'kW'])
@@ -759,23 +1144,24 @@ def electrical_usage_and_cost_reports(site, df):
                                                index=['fiscal_year'],
                                                columns=['units'],
                                                values='usage',
-                                               aggfunc=np.sum
+                                               aggfunc=np.sum,
+                                               observed=True
                                               )
     else:
         # Create an empty dataframe with the correct index
-        electric_pivot_annual = site_df.groupby(['fiscal_year']).mean()[[]]
+        electric_pivot_annual = site_df.groupby(['fiscal_year'], observed=True).mean()[[]]
 
     electric_pivot_annual = bu.add_missing_columns(electric_pivot_annual, ['kWh', 'kW'])
     electric_use_annual = electric_pivot_annual[['kWh']]
     electric_use_annual = electric_use_annual.rename(columns={'kWh':'ann_electric_usage_kWh'})
 
     # Get average annual demand usage
-    electric_demand_avg = electric_pivot_monthly.groupby(['fiscal_year']).mean()
+    electric_demand_avg = electric_pivot_monthly.groupby(['fiscal_year'], observed=True).mean()
     electric_demand_avg = electric_demand_avg[['kW']]
     electric_demand_avg = electric_demand_avg.rename(columns={'kW': 'avg_demand_kW'})
 
     # Find annual maximum demand usage
-    electric_demand_max = electric_pivot_monthly.groupby(['fiscal_year']).max()
+    electric_demand_max = electric_pivot_monthly.groupby(['fiscal_year'], observed=True).max()
     electric_demand_max = electric_demand_max[['kW']]
     electric_demand_max = electric_demand_max.rename(columns={'kW': 'max_demand_kW'})
 
@@ -807,13 +1193,13 @@ def electrical_usage_and_cost_reports(site, df):
     ylabel2 = 'Electricity Demand [kW]'
 
     p6g1_filename, p6g1_url = gu.graph_filename_url(site, "electricity_usage_g1")
-    gu.stacked_bar_with_line(annual_electric_data.reset_index(), 'fiscal_year', ['kwh'], 'kw_avg',
-                          ylabel1, ylabel2, "Annual Electricity Usage and Demand", p6g1_filename)
+    p6g1_url = gu.stacked_bar_with_line(annual_electric_data.reset_index(), 'fiscal_year', ['kwh'], 'kw_avg',
+                                     ylabel1, ylabel2, "Annual Electricity Usage and Demand", p6g1_filename) or p6g1_url
 
 
     p6g2_filename, p6g2_url = gu.graph_filename_url(site, "electricity_usage_g2")
-    gu.create_monthly_profile(electric_pivot_monthly, 'kWh', 'Monthly Electricity Usage Profile [kWh]', 'blue',
-                             "Monthly Electricity Usage Profile by Fiscal Year",p6g2_filename)
+    p6g2_url = gu.create_monthly_profile(electric_pivot_monthly, 'kWh', 'Monthly Electricity Usage Profile [kWh]', 'blue',
+                                        "Monthly Electricity Usage Profile by Fiscal Year",p6g2_filename) or p6g2_url
 
     # Convert df to dictionary
     electric_use_rows = bu.df_to_dictionaries(annual_electric_data)
@@ -839,10 +1225,11 @@ def electrical_usage_and_cost_reports(site, df):
                                                index=['fiscal_year'],
                                                columns=['cost_categories'],
                                                values='cost',
-                                               aggfunc=np.sum
+                                               aggfunc=np.sum,
+                                               observed=True
                                               )
     else:
-        electric_annual_cost = site_df.groupby(['fiscal_year']).mean()[[]]
+        electric_annual_cost = site_df.groupby(['fiscal_year'], observed=True).mean()[[]]
 
     electric_annual_cost = bu.add_missing_columns(electric_annual_cost, ['demand_cost', 'usage_cost'] ,0.0)
 
@@ -870,14 +1257,14 @@ def electrical_usage_and_cost_reports(site, df):
 
     renamed_use_and_cost = electric_use_and_cost.rename(columns={'kwh_cost':'Electricity Usage Cost [$]',
                                                                 'kw_avg_cost':'Electricity Demand Cost [$]'})
-    gu.create_stacked_bar(renamed_use_and_cost.reset_index(), 'fiscal_year', ['Electricity Usage Cost [$]',
-                                                                              'Electricity Demand Cost [$]'],
-                          'Electricity Cost [$]', "Annual Electricity Usage and Demand Costs", p7g1_filename)
+    p7g1_url = gu.create_stacked_bar(renamed_use_and_cost.reset_index(), 'fiscal_year', ['Electricity Usage Cost [$]',
+                                                                                         'Electricity Demand Cost [$]'],
+                                     'Electricity Cost [$]', "Annual Electricity Usage and Demand Costs", p7g1_filename) or p7g1_url
 
     # Create Monthly Profile of Electricity Demand
     p7g2_filename, p7g2_url = gu.graph_filename_url(site, "electrical_cost_g2")
-    gu.create_monthly_profile(electric_pivot_monthly, 'kW', 'Monthly Electricity Demand Profile [kW]', 'blue',
-                              "Monthly Electricity Demand Profile by Fiscal Year",p7g2_filename)
+    p7g2_url = gu.create_monthly_profile(electric_pivot_monthly, 'kW', 'Monthly Electricity Demand Profile [kW]', 'blue',
+                                         "Monthly Electricity Demand Profile by Fiscal Year",p7g2_filename) or p7g2_url
 
     # Convert df to dictionary
     electric_cost_rows = bu.df_to_dictionaries(electric_use_and_cost)
@@ -891,13 +1278,57 @@ def electrical_usage_and_cost_reports(site, df):
     return template_data
 
 # --------------------Heating Usage and Cost Reports ------------------------
-def heating_usage_cost_reports(site, df, ut, df_utility_cost, df_usage):
+def fuel_price_table(site_ix):
+    """Returns a DataFrame of the monthly average price per MMBtu of each fuel,
+    across all of the sites.  The DataFrame is indexed on fiscal_year and 
+    fiscal_mo and has one column per service type.  It is the same for every 
+    site, so compute it once and pass it to heating_usage_cost_reports().
+    """
+    # Filter out natural gas customer charges as the unit cost goes to infinity if there is a charge but no use
+    df = site_ix.df
+    df_no_gas_cust_charges = df.drop(df[(df['service_type'] == 'natural_gas') & (df['units'] != 'CCF')].index)
+
+    # Filter out records with zero usage, which correspond to things like customer charges, etc.
+    nonzero_usage = df_no_gas_cust_charges.query("usage > 0")
+
+    nonzero_usage = nonzero_usage.query("mmbtu > 0")
+
+    # Filter out zero cost or less records (these are related to waste oil)
+    nonzero_usage = nonzero_usage.query("cost > 0")
+
+    # Get the total fuel cost and usage for all buildings by year and month
+    grouped_nonzero_usage = nonzero_usage.groupby(['service_type', 'fiscal_year', 'fiscal_mo'], observed=True).sum()
+
+    # Divide the total cost for all building by the total usage for all buildings so that the average is weighted correctly
+    grouped_nonzero_usage['avg_price_per_mmbtu'] = grouped_nonzero_usage.cost / grouped_nonzero_usage.mmbtu
+
+    # Get only the desired outcome, price per million BTU for each fuel type, and the number of calendar months it is based on
+    # i.e. the number of months of bills for each fuel for all buildings for that particular month.
+    grouped_nonzero_usage = grouped_nonzero_usage[['avg_price_per_mmbtu', 'cal_mo']]
+
+    # Drop electricity from the dataframe.
+    grouped_nonzero_usage = grouped_nonzero_usage.reset_index()
+    grouped_nonzero_heatfuel_use = grouped_nonzero_usage.query("service_type != 'Electricity'")
+
+    # Create a column for each service type
+    grouped_nonzero_heatfuel_use = pd.pivot_table(grouped_nonzero_heatfuel_use,
+                                                  values='avg_price_per_mmbtu',
+                                                  index=['fiscal_year', 'fiscal_mo'],
+                                                  columns='service_type',
+                                                  observed=True
+                                                    )
+
+    return grouped_nonzero_heatfuel_use
+
+def heating_usage_cost_reports(site, site_ix, ut, df_utility_cost, df_usage, fuel_prices=None):
     '''This produces both the Heating Usage and the Heating Cost
     reports.
     'df_utility_cost': The utility cost DataFrame produced in the
     utility_cost_report function above.
     'df_usage': A summary energy usage DataFrame produced in the prior
     energy_use_cost_reports function.
+    'fuel_prices': The portfolio fuel price table from fuel_price_table().  
+    If None, it is computed.
     '''
 
     # Abort if no heating usage
@@ -933,20 +1364,21 @@ def heating_usage_cost_reports(site, df, ut, df_utility_cost, df_usage):
     # ----- Create Heating Usage Analysis Graphs
 
     p8g1_filename, p8g1_url = gu.graph_filename_url(site, "heating_usage_g1")
-    gu.stacked_bar_with_line(heating_usage.reset_index(), 'fiscal_year', heat_service_mmbtu_list, 'hdd',
-                            'Heating Fuel Usage [MMBTU/yr]', 'Heating Degree Days [Base 65F]',
-                             "Annual Heating Energy Use and Degree Day Comparison", p8g1_filename)
+    p8g1_url = gu.stacked_bar_with_line(heating_usage.reset_index(), 'fiscal_year', heat_service_mmbtu_list, 'hdd',
+                                       'Heating Fuel Usage [MMBTU/yr]', 'Heating Degree Days [Base 65F]',
+                                        "Annual Heating Energy Use and Degree Day Comparison", p8g1_filename) or p8g1_url
 
     # --- Create Monthly Heating Usage dataframe for graph
 
     # From the main DataFrame, get only the rows for this site, and only get
     # the needed columns for this analysis
-    usage_df1 = df.query('site_id == @site')[['service_type', 'fiscal_year', 'fiscal_mo', 'mmbtu']]
+    usage_df1 = site_ix[site][['service_type', 'fiscal_year', 'fiscal_mo', 'mmbtu']]
     monthly_heating = pd.pivot_table(usage_df1,
                                     values='mmbtu',
                                     index=['fiscal_year', 'fiscal_mo'],
                                     columns=['service_type'],
-                                    aggfunc=np.sum
+                                    aggfunc=np.sum,
+                                    observed=True
                                     )
 
     # Add in columns for the missing energy services
@@ -960,8 +1392,8 @@ def heating_usage_cost_reports(site, df, ut, df_utility_cost, df_usage):
     monthly_heating['total_heating_energy'] = monthly_heating.sum(axis=1)
 
     p8g2_filename, p8g2_url = gu.graph_filename_url(site, "heating_usage_g2")
-    gu.create_monthly_profile(monthly_heating, 'total_heating_energy', "Monthly Heating Energy Profile [MMBTU]", 'red',
-                              "Monthly Heating Energy Usage Profile by Fiscal Year", p8g2_filename)
+    p8g2_url = gu.create_monthly_profile(monthly_heating, 'total_heating_energy', "Monthly Heating Energy Profile [MMBTU]", 'red',
+                                         "Monthly Heating Energy Usage Profile by Fiscal Year", p8g2_filename) or p8g2_url
 
     # Convert df to dictionary
     heating_use_rows = bu.df_to_dictionaries(heating_usage)
@@ -1031,56 +1463,27 @@ def heating_usage_cost_reports(site, df, ut, df_utility_cost, df_usage):
 
     heating_cost_and_use = heating_cost_and_use[final_cost_col_list]
 
-    # ---- Create DataFrame with the Monthly Average Price Per MMBTU for All Sites
-
-    # Filter out natural gas customer charges as the unit cost goes to infinity if there is a charge but no use
-    df_no_gas_cust_charges = df.drop(df[(df['service_type'] == 'natural_gas') & (df['units'] != 'CCF')].index)
-
-    # Filter out records with zero usage, which correspond to things like customer charges, etc.
-    nonzero_usage = df_no_gas_cust_charges.query("usage > 0")
-
-    nonzero_usage = nonzero_usage.query("mmbtu > 0")
-
-    # Filter out zero cost or less records (these are related to waste oil)
-    nonzero_usage = nonzero_usage.query("cost > 0")
-
-    # Get the total fuel cost and usage for all buildings by year and month
-    grouped_nonzero_usage = nonzero_usage.groupby(['service_type', 'fiscal_year', 'fiscal_mo']).sum()
-
-    # Divide the total cost for all building by the total usage for all buildings so that the average is weighted correctly
-    grouped_nonzero_usage['avg_price_per_mmbtu'] = grouped_nonzero_usage.cost / grouped_nonzero_usage.mmbtu
-
-    # Get only the desired outcome, price per million BTU for each fuel type, and the number of calendar months it is based on
-    # i.e. the number of months of bills for each fuel for all buildings for that particular month.
-    grouped_nonzero_usage = grouped_nonzero_usage[['avg_price_per_mmbtu', 'cal_mo']]
-
-    # Drop electricity from the dataframe.
-    grouped_nonzero_usage = grouped_nonzero_usage.reset_index()
-    grouped_nonzero_heatfuel_use = grouped_nonzero_usage.query("service_type != 'Electricity'")
-
-    # Create a column for each service type
-    grouped_nonzero_heatfuel_use = pd.pivot_table(grouped_nonzero_heatfuel_use,
-                                                  values='avg_price_per_mmbtu',
-                                                  index=['fiscal_year', 'fiscal_mo'],
-                                                  columns='service_type'
-                                                    )
-    grouped_nonzero_heatfuel_use = grouped_nonzero_heatfuel_use.reset_index()
+    # ---- Get the Monthly Average Price Per MMBTU for All Sites
+    if fuel_prices is None:
+        fuel_prices = fuel_price_table(site_ix)
 
     # --- Monthly Cost Per MMBTU: Data and Graphs
 
     # Exclude other charges from the natural gas costs.  This is because the unit costs for natural gas go to infinity
     # when there is zero usage but a customer charge
-    cost_df1 = df.drop(df[(df['service_type'] == 'natural_gas') & (df['units'] != 'CCF')].index)
+    site_df = site_ix[site]
+    cost_df1 = site_df.drop(site_df[(site_df['service_type'] == 'natural_gas') & (site_df['units'] != 'CCF')].index)
 
     # Create cost dataframe for given site from processed data
-    cost_df1 = cost_df1.query('site_id == @site')[['service_type', 'fiscal_year', 'fiscal_mo', 'cost']]
+    cost_df1 = cost_df1[['service_type', 'fiscal_year', 'fiscal_mo', 'cost']]
 
     # Split out by service type
     monthly_heating_cost = pd.pivot_table(cost_df1,
                                     values='cost',
                                     index=['fiscal_year', 'fiscal_mo'],
                                     columns=['service_type'],
-                                    aggfunc=np.sum
+                                    aggfunc=np.sum,
+                                    observed=True
                                     )
 
     # Add in columns for the missing energy services
@@ -1110,7 +1513,7 @@ def heating_usage_cost_reports(site, df, ut, df_utility_cost, df_usage):
     # Add in unit costs for fuels that are currently blank
 
     # Get only columns that exist in the dataframe
-    available_service_list = list(grouped_nonzero_heatfuel_use.columns.values)
+    available_service_list = list(fuel_prices.columns.values)
 
     heat_services_in_grouped_df = list(set(bu.all_heat_services) & set(available_service_list))
 
@@ -1121,9 +1524,8 @@ def heating_usage_cost_reports(site, df, ut, df_utility_cost, df_usage):
 
 
     # Add in average unit costs calculated from all sites for each month
-    monthly_heat_energy_and_use = pd.merge(monthly_heat_energy_and_use, grouped_nonzero_heatfuel_use,
-                                           left_on=['fiscal_year', 'fiscal_mo'], right_on=['fiscal_year', 'fiscal_mo'],
-                                          how='left', suffixes=('', '_avg_unit_cost'))
+    monthly_heat_energy_and_use = monthly_heat_energy_and_use.join(fuel_prices, on=['fiscal_year', 'fiscal_mo'],
+                                                                   rsuffix='_avg_unit_cost')
 
     # Check each column to see if it is NaN (identified when the value does not equal itself) and if it is, fill with the average
     # price per MMBTU taken from all sites
@@ -1150,7 +1552,7 @@ def heating_usage_cost_reports(site, df, ut, df_utility_cost, df_usage):
     monthly_heat_energy_and_use['date'] = monthly_heat_energy_and_use[['calendar_year','calendar_mo']].apply(get_date, axis=1)
 
     p9g1_filename, p9g1_url = gu.graph_filename_url(site, "heating_cost_g1")
-    gu.fuel_price_comparison_graph(monthly_heat_energy_and_use, 'date', unit_cost_cols, 'building_unit_cost', p9g1_filename)
+    p9g1_url = gu.fuel_price_comparison_graph(monthly_heat_energy_and_use, 'date', unit_cost_cols, 'building_unit_cost', p9g1_filename) or p9g1_url
 
     # --- Realized Savings from Fuel Switching: Page 9, Graph 2
 
@@ -1184,8 +1586,8 @@ def heating_usage_cost_reports(site, df, ut, df_utility_cost, df_usage):
     monthly_heat_energy_and_use['cumulative_fuel_switching_savings'] = np.cumsum(monthly_heat_energy_and_use.fuel_switching_savings)
 
     p9g2_filename, p9g2_url = gu.graph_filename_url(site, "heating_cost_g2")
-    gu.create_monthly_line_graph(monthly_heat_energy_and_use, 'date', 'cumulative_fuel_switching_savings',
-                                'Cumulative Fuel Switching Savings Realized [$]', p9g2_filename)
+    p9g2_url = gu.create_monthly_line_graph(monthly_heat_energy_and_use, 'date', 'cumulative_fuel_switching_savings',
+                                           'Cumulative Fuel Switching Savings Realized [$]', p9g2_filename) or p9g2_url
 
     # Convert df to dictionary
     heating_cost_rows = bu.df_to_dictionaries(heating_cost_and_use)
@@ -1200,9 +1602,9 @@ def heating_usage_cost_reports(site, df, ut, df_utility_cost, df_usage):
 
 # ---------------------- Water Analysis Table ---------------------------
 
-def water_report(site, df):
+def water_report(site, site_ix):
 
-    water_use = df.query('site_id == @site')[['service_type', 'fiscal_year', 'fiscal_mo','cost', 'usage', 'units']]
+    water_use = site_ix[site][['service_type', 'fiscal_year', 'fiscal_mo','cost', 'usage', 'units']]
 
     # Abort if no data
     if water_use.empty:
@@ -1218,7 +1620,8 @@ def water_report(site, df):
                                   values='usage',
                                   index=['fiscal_year',],
                                   columns=['service_type'],
-                                  aggfunc=np.sum
+                                  aggfunc=np.sum,
+                                  observed=True
     )
 
      # Add in columns for the missing services
@@ -1236,7 +1639,8 @@ def water_report(site, df):
                                   values='cost',
                                   index=['fiscal_year',],
                                   columns=['service_type'],
-                                  aggfunc=np.sum
+                                  aggfunc=np.sum,
+                                  observed=True
     )
 
 
@@ -1286,8 +1690,8 @@ def water_report(site, df):
     # ---- Create Water Cost Stacked Bar Graph - Page 10 Graph 1
 
     p10g1_filename, p10g1_url = gu.graph_filename_url(site, "water_analysis_g1")
-    gu.create_stacked_bar(water_use_and_cost.reset_index(), 'fiscal_year', ['sewer_cost', 'water_cost'],
-                          'Utility Cost [$]', "Annual Water and Sewer Costs", p10g1_filename)
+    p10g1_url = gu.create_stacked_bar(water_use_and_cost.reset_index(), 'fiscal_year', ['sewer_cost', 'water_cost'],
+                                      'Utility Cost [$]', "Annual Water and Sewer Costs", p10g1_filename) or p10g1_url
 
     # ---- Create Monthly Water Profile Graph
 
@@ -1296,16 +1700,18 @@ def water_report(site, df):
                                   values='usage',
                                   index=['fiscal_year', 'fiscal_mo'],
                                   columns=['service_type'],
-                                  aggfunc=np.sum
+                                  aggfunc=np.sum,
+                                  observed=True
     )
 
     p10g2_filename, p10g2_url = gu.graph_filename_url(site, "water_analysis_g2")
 
     if 'water' in list(water_gal_df_monthly.columns.values):
-        gu.create_monthly_profile(water_gal_df_monthly, 'water', 'Monthly Water Usage Profile [gallons]', 'green',
-                                  "Monthly Water Usage Profile by Fiscal Year", p10g2_filename)
+        p10g2_url = gu.create_monthly_profile(water_gal_df_monthly, 'water', 'Monthly Water Usage Profile [gallons]', 'green',
+                                              "Monthly Water Usage Profile by Fiscal Year", p10g2_filename) or p10g2_url
     else:
-        shutil.copyfile(os.path.abspath('no_data_available.png'), os.path.abspath(p10g2_filename))
+        p10g2_url = gu.NO_DATA
+        gu.count_no_data()
 
     # Convert df to dictionary
     water_rows = bu.df_to_dictionaries(water_use_and_cost)
@@ -1324,6 +1730,152 @@ def water_report(site, df):
 
 # Time when the script started running. Used to determine cumulative time
 start_time = None
+#******************************************************************************
+#******************************************************************************
+# --------------------- Creating the Report for Each Site ---------------------
+
+def site_report(site_id, data):
+    """Creates the benchmarking report for the site 'site_id', writing the 
+    HTML report file (and the debug file, if requested) to the 'output' 
+    directory.  'data' is a dictionary of the read-only data shared by all of
+    the sites: 'site_ix' and 'ut' as described for the report functions,
+    'energy_portfolio' (an EnergyIndexPortfolio), 'fuel_prices' (from 
+    fuel_price_table()), 'report_date_time', 'graph_format' (the format of
+    the graph files, see graph_util.set_graph_format()), and 'graph_cache' 
+    (the graph_util.GraphCache used for the graphs, or None).
+    """
+    site_ix = data['site_ix']
+    ut = data['ut']
+
+    # Gather template data from each of the report sections.  The functions
+    # return a dictionary with variables needed by the template.  Sometimes other
+    # values are returned from the function, often for use in later reports.
+
+    template_data = building_info_report(site_id, ut, data['report_date_time'])
+
+    report_data = energy_index_report(site_id, site_ix, ut, data['energy_portfolio'])
+    template_data.update(report_data)
+
+    report_data, df_utility_cost = utility_cost_report(site_id, site_ix, ut)
+    template_data.update(report_data)
+
+    # Filter down to just this site's bills and only services that
+    # are energy services in order to determine whether there are any
+    # energy services. Only do energy reports if there are some energy
+    # services
+    energy_services = bu.missing_energy_services([])
+    df1 = site_ix[site_id].query('service_type==@energy_services')
+    if not df1.empty:
+
+        report_data, df_usage = energy_use_cost_reports(site_id, site_ix, ut, df_utility_cost)
+        template_data.update(report_data)
+
+        report_data = electrical_usage_and_cost_reports(site_id, site_ix)
+        template_data.update(report_data)
+
+        #df_utility_cost.to_pickle('df_utility_cost.pkl')
+        #df_usage.to_pickle('df_usage.pkl')
+        #import sys; sys.exit()
+
+        report_data = heating_usage_cost_reports(site_id, site_ix, ut, df_utility_cost, df_usage, data['fuel_prices'])
+        template_data.update(report_data)
+
+    report_data = water_report(site_id, site_ix)
+    template_data.update(report_data)
+
+    # save template data variables to debug file if requested
+    if settings.WRITE_DEBUG_DATA:
+        with open('output/debug/{}.vars'.format(site_id), 'w') as fout:
+            pprint.pprint(template_data, fout)
+
+    # create report file
+    result = template_util.get_template('sites/index.html').render(template_data)
+    with open('output/sites/{}.html'.format(site_id), 'w') as fout:
+        fout.write(result)
+
+# The data shared by all of the site reports in a worker process.  It is 
+# inherited from the main process when worker processes are forked, and sent
+# once to each worker otherwise; only Site IDs are sent for each report.
+_site_report_data = None
+
+def _init_site_report_worker(data):
+    """Initializes a worker process for creating site reports."""
+    global _site_report_data
+    if data is not None:
+        _site_report_data = data
+        gu.set_graph_format(data['graph_format'])
+        gu.set_graph_cache(data['graph_cache'])
+
+def _site_report_worker(site_id):
+    """Creates the report for 'site_id' in a worker process.  Returns the 
+    Site ID, the process ID, the elapsed time in seconds, the (hits, 
+    misses) counts of the graph cache for the report, and the number of 
+    graphs without data.
+    """
+    st = time.time()
+    site_report(site_id, _site_report_data)
+    graph_cache = _site_report_data['graph_cache']
+    cache_counts = graph_cache.take_counts() if graph_cache else (0, 0)
+    return site_id, os.getpid(), time.time() - st, cache_counts, gu.take_no_data_count()
+
+def run_site_reports(site_ids, data, workers):
+    """Creates the reports for the sites in 'site_ids', using the shared 
+    'data' described in site_report().  If 'workers' is greater than 1, the 
+    sites are divided among a pool of that many worker processes.  Each 
+    report is written to its own files, so the output does not depend on the
+    number of workers.  The graph cache counts of the workers are added to 
+    the counts of data['graph_cache'], and their counts of graphs without
+    data are added with graph_util.count_no_data().
+    """
+    global _site_report_data
+
+    if workers <= 1 or len(site_ids) <= 1:
+        for site_id in site_ids:
+            msg("Site '{}' is being processed...".format(site_id))
+            site_report(site_id, data)
+        return
+
+    # Compute the shared portfolio data before the workers start, so it is
+    # only computed once.
+    data['energy_portfolio'].prepare(site_ids)
+
+    # Load all of the site, service and degree-day resources now, so they are
+    # not loaded again by each worker, and so the Util object can be pickled.
+    data['ut'].load_all()
+
+    # Forked workers inherit the shared data without it being copied or 
+    # pickled; otherwise the data is pickled once for each worker.
+    if 'fork' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('fork')
+        _site_report_data = data
+        init_data = None
+    else:
+        context = multiprocessing.get_context()
+        init_data = data
+
+    worker_times = {}
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                                    initializer=_init_site_report_worker,
+                                                    initargs=(init_data,)) as executor:
+            # Several sites are sent to a worker at a time to reduce the 
+            # communication overhead.
+            chunk_size = max(1, min(8, len(site_ids) // (workers * 4)))
+            for site_id, pid, elapsed, (hits, misses), no_data in executor.map(_site_report_worker, site_ids, 
+                                                                               chunksize=chunk_size):
+                msg("Site '{}' was processed ({:.1f} s).".format(site_id, elapsed))
+                if data['graph_cache']:
+                    data['graph_cache'].hits += hits
+                    data['graph_cache'].misses += misses
+                gu.count_no_data(no_data)
+                n_sites, tot_time = worker_times.get(pid, (0, 0.0))
+                worker_times[pid] = (n_sites + 1, tot_time + elapsed)
+    finally:
+        _site_report_data = None
+
+    for i, (pid, (n_sites, tot_time)) in enumerate(sorted(worker_times.items())):
+        msg('Worker {} (pid {}): {} sites in {:.1f} s'.format(i + 1, pid, n_sites, tot_time))
+
 def msg(the_message):
     """Prints a message to the console, along cumulative elapsed time
     since the script started.
@@ -1347,26 +1899,46 @@ if __name__=="__main__":
     # Read and Preprocess the data in the Utility Bill file, acquiring
     # a DataFrame of preprocessed data and a utility function object that is
     # needed by the analysis routines.
-    if settings.USE_DATA_FROM_LAST_RUN:
-        # Read the data from the pickle files that were created during the
-        # last run of the script.
-        df = pickle.load(open('df_processed.pkl', 'rb'))
-        util_obj = pickle.load(open('util_obj.pkl', 'rb'))
-        msg('Data from Last Run has been loaded.')
-
-    else:
-        # Run the full reading and processing routine
-        df_raw, df, util_obj = preprocess_data()
-
-        # Pickle the DataFrames and utility object for fast
-        # loading later, if needed
-        df_raw.to_pickle('df_raw.pkl')
-        df.to_pickle('df_processed.pkl')
-        pickle.dump(util_obj, open('util_obj.pkl', 'wb'))
-
-        # We no longer need the raw DataFrame, so delete it to
-        # save memory
-        del df_raw
+    # The preprocessed data is cached in files that are named by a hash of all
+    # the inputs to the preprocessing, so the cached data is only used if none
+    # of those inputs have changed.
+    cache_dir = getattr(settings, 'CACHE_DIR_PATH', 'cache/')
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_key = preprocess_cache_key()
+    df_fn = cu.cache_path(cache_dir, 'df_processed', cache_key, 'npz')
+    util_fn = cu.cache_path(cache_dir, 'util_snapshot', cache_key, 'npz')
+
+    util_obj = None
+    if settings.USE_DATA_FROM_LAST_RUN and os.path.exists(df_fn) and os.path.exists(util_fn):
+        # Read the data from the cache files that were created during the
+        # last run of the script.  A snapshot of the utility object in an
+        # older format, or a damaged cache file, is rejected, and the data 
+        # is preprocessed again.
+        try:
+            util_obj = bu.Util.load_snapshot(util_fn)
+            df = cu.load_frame(df_fn)
+            msg('Data from Last Run has been loaded.')
+        except ValueError as e:
+            util_obj = None
+            msg('{}  Preprocessing again.'.format(e))
+
+    elif settings.USE_DATA_FROM_LAST_RUN:
+        msg('Input data or code has changed since the last run; preprocessing again.')
+
+    if util_obj is None:
+        # Run the full reading and processing routine.  The raw bill records
+        # are not needed after preprocessing.
+        _, df, util_obj = preprocess_data()
+
+        # Save the DataFrame and utility object to the cache for fast
+        # loading later, if needed, and remove the cache files from prior 
+        # runs, including utility objects saved with pickle by older 
+        # versions of this script.
+        cu.save_frame(df, df_fn)
+        util_obj.save_snapshot(util_fn)
+        cu.remove_stale_entries(cache_dir, 'df_processed', cache_key, 'npz')
+        cu.remove_stale_entries(cache_dir, 'util_snapshot', cache_key, 'npz')
+        cu.remove_stale_entries(cache_dir, 'util_obj', None, 'pkl')
 
     # Clean out the output directories to prepare for the new report files
     out_dirs = [
@@ -1380,6 +1952,9 @@ if __name__=="__main__":
             if not 'placeholder' in fn:    # don't delete placeholder file
                 os.remove(fn)
 
+    # All graphs without data are shown with this one image.
+    gu.save_no_data_image()
+
     # Create Index (Home) page
     site_cats = util_obj.site_categories_and_buildings()
     template_data = dict(
@@ -1390,68 +1965,69 @@ if __name__=="__main__":
     result = ix_template.render(template_data)
     open('output/index.html', 'w').write(result)
 
-    # ------ Loop through the sites, creating a report for each
-    
-    # Get the template used to create the site benchmarking report.
-    site_template = template_util.get_template('sites/index.html')
+    # ------ Create a report for each site
     
-    site_count = 0    # tracks number of site processed
-    for site_id in util_obj.all_sites():
-        # This line shortens the calculation process to start with whatever
-        # Site ID you want to start with
-        # if site_id < '1187': continue
-
-        msg("Site '{}' is being processed...".format(site_id))
-
-        # Gather template data from each of the report sections.  The functions
-        # return a dictionary with variables needed by the template.  Sometimes other
-        # values are returned from the function, often for use in later reports.
-
-        template_data = building_info_report(site_id, util_obj, report_date_time)
-
-        report_data = energy_index_report(site_id, df, util_obj)
-        template_data.update(report_data)
-
-        report_data, df_utility_cost = utility_cost_report(site_id, df, util_obj)
-        template_data.update(report_data)
-
-        # Filter down to just this site's bills and only services that
-        # are energy services in order to determine whether there are any
-        # energy services. Only do energy reports if there are some energy
-        # services
-        energy_services = bu.missing_energy_services([])
-        df1 = df.query('site_id==@site_id and service_type==@energy_services')
-        if not df1.empty:
-
-            report_data, df_usage = energy_use_cost_reports(site_id, df, util_obj, df_utility_cost)
-            template_data.update(report_data)
-
-            report_data = electrical_usage_and_cost_reports(site_id, df)
-            template_data.update(report_data)
-
-            #df_utility_cost.to_pickle('df_utility_cost.pkl')
-            #df_usage.to_pickle('df_usage.pkl')
-            #import sys; sys.exit()
-
-            report_data = heating_usage_cost_reports(site_id, df, util_obj, df_utility_cost, df_usage)
-            template_data.update(report_data)
+    # Partition the preprocessed data by site once, so the reports for each
+    # site do not need to search the whole DataFrame.
+    site_ix = bu.SiteIndex(df)
+
+    # The graphs are saved as images, or as chart files that are drawn by 
+    # the browser.
+    graph_format = 'json' if getattr(settings, 'CLIENT_SIDE_GRAPHS', False) else 'png'
+    gu.set_graph_format(graph_format)
+
+    # Graphs that were drawn by earlier runs with the same data are copied
+    # from the graph cache, if it is used.
+    graph_cache_mb = getattr(settings, 'GRAPH_CACHE_MAX_MB', 0)
+    graph_cache = None
+    if graph_cache_mb > 0:
+        graph_cache = gu.GraphCache(os.path.join(cache_dir, 'graphs'), graph_cache_mb * 2**20)
+    gu.set_graph_cache(graph_cache)
+
+    # The portfolio-wide data for the Energy Index report and the fuel price
+    # table for the Heating Cost report are computed once and shared by all
+    # of the sites.
+    shared_data = dict(
+        site_ix=site_ix,
+        ut=util_obj,
+        energy_portfolio=EnergyIndexPortfolio(site_ix, util_obj),
+        fuel_prices=fuel_price_table(site_ix),
+        report_date_time=report_date_time,
+        graph_format=graph_format,
+        graph_cache=graph_cache,
+    )
 
-        report_data = water_report(site_id, df)
-        template_data.update(report_data)
+    # The sites are processed in alphabetical order, optionally only the
+    # first few of them.
+    site_ids = util_obj.all_sites()
+    if settings.MAX_NUMBER_SITES_TO_RUN:
+        site_ids = site_ids[:settings.MAX_NUMBER_SITES_TO_RUN]
+
+    workers = getattr(settings, 'SITE_REPORT_WORKERS', 1) or os.cpu_count()
+
+    # With a single report process, the graphs can be rendered by a pool of
+    # processes while the reports are being created.
+    render_workers = getattr(settings, 'GRAPH_RENDER_WORKERS', 0)
+    use_render_pool = workers <= 1 and render_workers > 0
+    if use_render_pool:
+        gu.start_render_pool(render_workers)
+    try:
+        run_site_reports(site_ids, shared_data, workers)
+    finally:
+        failures = gu.finish_render_pool()
+    if use_render_pool:
+        msg('Graph rendering finished.')
+    for graph, error in failures:
+        msg('Graph {} could not be made: {}'.format(graph, error))
+
+    graph_files = [fn for fn in glob.glob('output/images/*') if not 'placeholder' in fn]
+    msg('Graphs: {:,} files written ({:.1f} MB); {:,} graphs without data use the shared no-data image.'.format(
+        len(graph_files), sum(os.path.getsize(fn) for fn in graph_files) / 2**20, gu.no_data_count))
+
+    if graph_cache:
+        removed, cache_bytes = graph_cache.evict()
+        msg('Graph cache: {} hits, {} misses; {} images evicted, {:.1f} MB in cache.'.format(
+            graph_cache.hits, graph_cache.misses, removed, cache_bytes / 2**20))
 
-        # save template data variables to debug file if requested
-        if settings.WRITE_DEBUG_DATA:
-            with open('output/debug/{}.vars'.format(site_id), 'w') as fout:
-                pprint.pprint(template_data, fout)
-
-        # create report file
-        result = site_template.render(template_data)
-        with open('output/sites/{}.html'.format(site_id), 'w') as fout:
-            fout.write(result)
-        
-        site_count += 1
-        if site_count == settings.MAX_NUMBER_SITES_TO_RUN:
-            break
-    
     print()
     msg('Benchmarking Script Complete!')
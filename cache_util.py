@@ -0,0 +1,262 @@
+"""Utilities for caching data between runs of the benchmarking script.
+DataFrames are stored in a simple columnar format: a Numpy '.npz' file with
+one array (or a pair of code & category arrays for text columns) per column,
+so that individual columns can be loaded without reading the rest of the
+file.  Cache entries are named by a hash of the inputs used to create them,
+so a changed input automatically results in a cache miss.  Parsed Excel 
+spreadsheets are cached the same way; see read_excel_cached().  Several 
+DataFrames and arrays can be stored together in one file with save_frames().
+"""
+import os
+import glob
+import json
+import pickle
+import hashlib
+import zipfile
+import contextlib
+import numpy as np
+import pandas as pd
+
+def file_hash(file_path):
+    """Returns a hex string hash of the contents of the file at 'file_path'.
+    """
+    h = hashlib.sha1()
+    with open(file_path, 'rb') as fin:
+        for block in iter(lambda: fin.read(2**20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def cache_key(*parts):
+    """Returns a hex string hash of the string representations of 'parts'.
+    Used to name cache entries by the inputs that produced them.
+    """
+    h = hashlib.sha1()
+    for part in parts:
+        h.update(str(part).encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+def _encode_column(ser):
+    """Returns a (kind, dictionary of arrays) two-tuple that encodes the
+    Pandas Series 'ser' using Numpy arrays that can be stored without pickling,
+    except for object columns with values other than strings.
+    """
+    if isinstance(ser.dtype, pd.CategoricalDtype):
+        cats = ser.cat.categories
+        kind, arrays = _encode_column(pd.Series(cats))
+        arrays = {'cats_' + k: v for k, v in arrays.items()}
+        arrays['codes'] = ser.cat.codes.values
+        return 'categorical_' + kind, arrays
+
+    elif ser.dtype == object:
+        values = ser.values
+        missing = pd.isnull(values)
+        if all(isinstance(v, str) for v in values[~missing]):
+            # Store text as integer codes into an array of the unique strings.
+            codes, uniques = pd.factorize(values)
+            return 'text', {'codes': codes.astype(np.int32), 'uniques': np.array(uniques, dtype=str)}
+        else:
+            return 'object', {'values': values}
+
+    else:
+        return 'array', {'values': ser.values}
+
+def _decode_column(kind, arrays):
+    """Inverse of _encode_column(), returning a Numpy array or Pandas
+    Categorical.  'arrays' is a dictionary-like object holding the stored
+    arrays of the column.
+    """
+    if kind.startswith('categorical_'):
+        cat_arrays = {k[5:]: arrays[k] for k in arrays if k.startswith('cats_')}
+        cats = _decode_column(kind[12:], cat_arrays)
+        return pd.Categorical.from_codes(arrays['codes'], categories=cats)
+
+    elif kind == 'text':
+        codes = arrays['codes']
+        values = np.full(len(codes), np.nan, dtype=object)
+        present = codes >= 0
+        values[present] = arrays['uniques'].astype(object)[codes[present]]
+        return values
+
+    else:
+        return arrays['values']
+
+def _frame_arrays(df, prefix=''):
+    """Encodes the DataFrame 'df', including its index, as a dictionary of
+    Numpy arrays with keys starting with 'prefix'.  Returns (frame metadata,
+    dictionary of arrays).
+    """
+    if df.index.equals(pd.RangeIndex(len(df))):
+        # a default index does not need to be stored.
+        index_names = []
+        df_all = df
+    else:
+        index_names = [nm if nm is not None else '__index_{}__'.format(i)
+                       for i, nm in enumerate(df.index.names)]
+        df_all = df.copy()
+        df_all.index.names = index_names
+        df_all = df_all.reset_index()
+
+    meta = {'index': index_names, 'columns': []}
+    arrays = {}
+    for i, col in enumerate(df_all.columns):
+        kind, col_arrays = _encode_column(df_all[col])
+        meta['columns'].append([col, kind])
+        for k, v in col_arrays.items():
+            arrays['{}{}_{}'.format(prefix, i, k)] = v
+    return meta, arrays
+
+def _frame_from_arrays(meta, npz, prefix='', columns=None):
+    """Inverse of _frame_arrays(): returns the DataFrame described by the
+    frame metadata 'meta' from the arrays in the open '.npz' file 'npz'.  If
+    'columns' is a list of column names, only those columns (and the index)
+    are read.
+    """
+    data = {}
+    for i, (col, kind) in enumerate(meta['columns']):
+        if columns is not None and col not in columns and col not in meta['index']:
+            continue
+        col_prefix = '{}{}_'.format(prefix, i)
+        keys = [k for k in npz.files if k.startswith(col_prefix)]
+        if kind.endswith('object'):
+            # Only the arrays of object columns are stored with pickling.
+            arrays = {k[len(col_prefix):]: _read_pickled(npz, k) for k in keys}
+        else:
+            arrays = {k[len(col_prefix):]: npz[k] for k in keys}
+        data[col] = _decode_column(kind, arrays)
+
+    df = pd.DataFrame(data)
+    if meta['index']:
+        df.set_index(meta['index'], inplace=True)
+        df.index.names = [None if nm.startswith('__index_') else nm for nm in df.index.names]
+    if columns is not None:
+        df = df[[c for c in columns if c in df.columns]]
+    return df
+
+def _read_pickled(npz, key):
+    """Returns the array 'key', which holds Python objects, from the open 
+    '.npz' file 'npz'.  Pickling is enabled only while the array is read.
+    """
+    npz.allow_pickle = True
+    try:
+        return npz[key]
+    finally:
+        npz.allow_pickle = False
+
+# The errors raised when a truncated or corrupt '.npz' file is read.
+_READ_ERRORS = (OSError, EOFError, KeyError, zipfile.BadZipFile, 
+                pickle.UnpicklingError, ValueError)
+
+@contextlib.contextmanager
+def _open_npz(file_path):
+    """Context manager that opens the '.npz' file 'file_path' without 
+    pickling, and raises ValueError if the file cannot be read, so that 
+    callers can treat a damaged cache file like a missing one.
+    """
+    try:
+        with np.load(file_path, allow_pickle=False) as npz:
+            yield npz
+    except _READ_ERRORS as e:
+        raise ValueError('Cannot read cache file {}: {}: {}'.format(
+            file_path, type(e).__name__, e))
+
+def _save_npz(file_path, arrays, compress=False):
+    """Saves the dictionary of Numpy arrays 'arrays' to the '.npz' file 
+    'file_path', compressing the file if 'compress' is True.
+    """
+    # write to a temporary file first so a partially written file is never
+    # mistaken for a complete one.
+    tmp_path = file_path + '.tmp.npz'
+    (np.savez_compressed if compress else np.savez)(tmp_path, **arrays)
+    os.replace(tmp_path, file_path)
+
+def save_frame(df, file_path):
+    """Saves the DataFrame 'df', including its index, to the columnar file
+    'file_path' (a '.npz' file).  Load it with load_frame().
+    """
+    meta, arrays = _frame_arrays(df)
+    arrays['meta'] = np.array(json.dumps(meta))
+    _save_npz(file_path, arrays)
+
+def load_frame(file_path, columns=None):
+    """Loads a DataFrame saved by save_frame() from 'file_path'.  If
+    'columns' is a list of column names, only those columns (and the index)
+    are read from the file.  Raises ValueError if the file cannot be read.
+    """
+    with _open_npz(file_path) as npz:
+        meta = json.loads(str(npz['meta']))
+        return _frame_from_arrays(meta, npz, columns=columns)
+
+def save_frames(file_path, frames, arrays, info, compress=True):
+    """Saves the DataFrames in the dictionary 'frames' and the Numpy arrays
+    in the dictionary 'arrays' (both keyed on name), and the JSON-serializable
+    object 'info', to the columnar file 'file_path' (a '.npz' file).  The 
+    file is compressed unless 'compress' is False.  Load them with 
+    load_frames().
+    """
+    meta = {'info': info, 'frames': {}, 'arrays': list(arrays)}
+    npz_arrays = {}
+    for i, (name, df) in enumerate(frames.items()):
+        frame_meta, frame_arrays = _frame_arrays(df, 'f{}_'.format(i))
+        meta['frames'][name] = [i, frame_meta]
+        npz_arrays.update(frame_arrays)
+    for i, arr in enumerate(arrays.values()):
+        npz_arrays['a{}'.format(i)] = arr
+    npz_arrays['meta'] = np.array(json.dumps(meta))
+    _save_npz(file_path, npz_arrays, compress)
+
+def load_frames(file_path):
+    """Loads the DataFrames, Numpy arrays and info object saved by 
+    save_frames() from 'file_path'.  Returns (dictionary of DataFrames, 
+    dictionary of arrays, info object).  Raises ValueError if the file 
+    cannot be read.
+    """
+    with _open_npz(file_path) as npz:
+        meta = json.loads(str(npz['meta']))
+        frames = {name: _frame_from_arrays(frame_meta, npz, 'f{}_'.format(i))
+                  for name, (i, frame_meta) in meta['frames'].items()}
+        arrays = {name: npz['a{}'.format(i)] for i, name in enumerate(meta['arrays'])}
+    return frames, arrays, meta['info']
+
+def cache_path(cache_dir, name, key, ext):
+    """Returns the path to the cache entry having the base name 'name', the
+    hash key 'key', and the file extension 'ext' in the 'cache_dir' directory.
+    """
+    return os.path.join(cache_dir, '{}_{}.{}'.format(name, key, ext))
+
+def remove_stale_entries(cache_dir, name, key, ext):
+    """Deletes the cache entries in 'cache_dir' with the base name 'name' and
+    file extension 'ext' that do not have the hash key 'key'.
+    """
+    current = cache_path(cache_dir, name, key, ext)
+    for fn in glob.glob(cache_path(cache_dir, name, '*', ext)):
+        if fn != current:
+            os.remove(fn)
+
+def read_excel_cached(file_path, cache_dir, **kwargs):
+    """Returns the DataFrame from pd.read_excel(file_path, **kwargs), using a
+    parsed copy of the sheet stored in the 'cache_dir' directory if the Excel
+    file has not changed since the copy was made.  Changes are detected by
+    the modification time and size of the file.  If 'cache_dir' is None, the
+    file is always parsed.
+    """
+    if cache_dir is None:
+        return pd.read_excel(file_path, **kwargs)
+
+    # The entry name identifies the file and the way it is read; the key 
+    # identifies the version of the file.
+    name = 'excel_' + cache_key(os.path.abspath(file_path), sorted(kwargs.items()))[:16]
+    stat = os.stat(file_path)
+    key = cache_key(stat.st_mtime_ns, stat.st_size)
+    fn = cache_path(cache_dir, name, key, 'npz')
+    if os.path.exists(fn):
+        try:
+            return load_frame(fn)
+        except ValueError:
+            pass     # a damaged cache file is replaced below
+
+    df = pd.read_excel(file_path, **kwargs)
+    os.makedirs(cache_dir, exist_ok=True)
+    save_frame(df, fn)
+    remove_stale_entries(cache_dir, name, key, 'npz')
+    return df
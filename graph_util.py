@@ -2,13 +2,28 @@ import pandas as pd
 import numpy as np
 import matplotlib as mpl
 mpl.use('Agg')
-import matplotlib.pyplot as plt
+import matplotlib.style
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from matplotlib.ticker import FuncFormatter
 from matplotlib.ticker import FormatStrFormatter
 import matplotlib.dates as mdates
+import matplotlib.colors as mcolors
 import bench_util as bu
+import cache_util as cu
 import shutil
+import datetime
 import os
+import sys
+import json
+import warnings
+import pickle
+import hashlib
+import inspect
+import functools
+import collections
+import multiprocessing
+import concurrent.futures
 from matplotlib import font_manager as fm
 
 # Set the matplotlib settings (eventually this will go at the top of the graph_util)
@@ -22,7 +37,7 @@ mpl.rcParams['ytick.labelsize'] = 16
 mpl.rcParams['legend.framealpha'] = 0.5
 
 # Set the style for the graphs
-plt.style.use('bmh')
+mpl.style.use('bmh')
 
 # Additional matplotlib formatting settings
 months = mdates.MonthLocator()
@@ -30,6 +45,664 @@ months = mdates.MonthLocator()
 # This formats the months as three-letter abbreviations
 months_format = mdates.DateFormatter('%b')
 
+# ---------------------------- Figure Templates ------------------------------
+
+# The graphs are drawn on Matplotlib Figures that are made directly, with an 
+# Agg canvas, instead of through pyplot.  So, no global pyplot state is kept 
+# between graphs, and each Figure is freed as soon as its graph is saved.  The
+# styling that is the same for every graph of a type is applied by the 
+# template functions below, which set up the Axes of a new Figure.
+
+def _thousands_formatter():
+    """Returns a tick formatter that displays a comma for thousands."""
+    formatter = FuncFormatter(lambda x, p: format(int(x), ','))
+    formatter.chart_format = 'thousands'     # the format used by charts.js
+    return formatter
+
+def _percent_formatter():
+    """Returns a tick formatter that displays fractions as whole percents."""
+    formatter = FuncFormatter('{0:.0%}'.format)
+    formatter.chart_format = 'percent'
+    return formatter
+
+def _fiscal_year_axes(ax):
+    """Template for graphs of yearly values with a Fiscal Year x-axis and 
+    values formatted with a thousands separator.
+    """
+    ax.set_xlabel('Fiscal Year')
+    ax.get_yaxis().set_major_formatter(_thousands_formatter())
+
+def _distribution_axes(ax):
+    """Template for the stacked area graphs of the percentage of each utility
+    by fiscal year.
+    """
+    ax.set_xlabel('Fiscal Year')
+    ax.yaxis.set_major_formatter(_percent_formatter())
+
+def _bar_with_line_axes(ax):
+    """Template for the yearly stacked bar graphs with a line on a second 
+    y-axis, which is created by twinx() and is the second Axes of the Figure.
+    """
+    _fiscal_year_axes(ax)
+    ax2 = ax.twinx()
+    ax2.get_yaxis().set_major_formatter(_thousands_formatter())
+
+def _monthly_profile_axes(ax):
+    """Template for the graphs of monthly values by fiscal month."""
+    ax.set_xlabel('Month of Year')
+    ax.get_yaxis().set_major_formatter(_thousands_formatter())
+
+def _pie_axes(ax):
+    """Template for the pie charts."""
+    ax.tick_params(axis='both', which='both', labelsize=32)
+
+def _comparison_axes(ax):
+    """Template for the graphs comparing a building to its peer groups."""
+    ax.tick_params(axis='x', labelrotation=45)
+    ax.set_xlabel('Fiscal Year')
+
+def _plain_axes(ax):
+    """Template for graphs that need no special styling."""
+    pass
+
+_figure_templates = {
+    'fiscal_year': _fiscal_year_axes,
+    'distribution': _distribution_axes,
+    'bar_with_line': _bar_with_line_axes,
+    'monthly_profile': _monthly_profile_axes,
+    'pie': _pie_axes,
+    'comparison': _comparison_axes,
+    'plain': _plain_axes,
+}
+
+def new_figure(template='plain'):
+    """Returns a new (Figure, Axes) two-tuple for drawing a graph, with the 
+    Axes set up by the template named 'template' (a key of 
+    '_figure_templates').  Any other Axes created by the template, such as a 
+    second y-axis, are in the list 'Figure.axes'.  Save the graph with 
+    'Figure.savefig()'; the Figure does not need to be closed.  If the graph
+    format is 'json', a ChartFigure and ChartAxes are returned instead.
+    """
+    if _graph_format == 'json':
+        fig = ChartFigure()
+        ax = fig.add_subplot(111)
+    else:
+        fig = Figure()
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot(111)
+    _figure_templates[template](ax)
+    return fig, ax
+
+# --------------------------- Client-Side Charts -----------------------------
+
+# The format of the graph files: 'png' images drawn by Matplotlib, or 'json' 
+# files describing charts that are drawn in the browser by the 'js/charts.js'
+# script of the report web site.
+_graph_format = 'png'
+
+def set_graph_format(graph_format):
+    """Sets the format of the graph files made by the graph functions: 'png' 
+    or 'json'.
+    """
+    global _graph_format
+    if graph_format not in ('png', 'json'):
+        raise ValueError('Unknown graph format: {}'.format(graph_format))
+    _graph_format = graph_format
+
+# Returned by a graph function instead of saving a graph when there is no data
+# for the graph.  The site report templates show the shared "no data" image, 
+# saved once by save_no_data_image(), in place of a graph with this URL.
+NO_DATA = 'no_data'
+
+# The number of graphs that were not saved because they had no data.
+no_data_count = 0
+
+def save_no_data_image(out_dir='output/images'):
+    """Saves the 'no_data_available.png' image shown for all graphs without
+    data to the 'out_dir' directory.
+    """
+    shutil.copyfile(os.path.abspath('no_data_available.png'), os.path.join(out_dir, 'no_data_available.png'))
+
+def count_no_data(n=1):
+    """Adds 'n' graphs to the count of graphs without data."""
+    global no_data_count
+    no_data_count += n
+
+def take_no_data_count():
+    """Returns the count of graphs without data and resets it to zero.  Used
+    to collect the counts of worker processes.
+    """
+    global no_data_count
+    count = no_data_count
+    no_data_count = 0
+    return count
+
+def _chart_number(val):
+    """Returns the number 'val' as compactly as possible for a chart file: 
+    rounded to 6 significant digits, as an integer if it is whole, and None
+    if it is not finite.
+    """
+    val = float(val)
+    if not np.isfinite(val):
+        return None
+    val = float('{:.6g}'.format(val))
+    return int(val) if val.is_integer() and abs(val) < 1e15 else val
+
+def _chart_values(values):
+    """Returns a list of the numbers or dates in 'values' for a chart file.
+    Dates are given as milliseconds since 1970.
+    """
+    values = np.asarray(values)
+    if values.dtype == object and any(isinstance(v, (datetime.date, pd.Timestamp)) for v in values):
+        values = pd.to_datetime(values).values
+    if np.issubdtype(values.dtype, np.datetime64):
+        return [None if pd.isnull(v) else int(v) for v in values.astype('datetime64[ms]').astype('int64')]
+    return [_chart_number(v) for v in values.astype(float)]
+
+def _chart_color(color, default=None):
+    """Returns the Matplotlib color 'color' as a hex string, using 'default' 
+    if 'color' is None.
+    """
+    if color is None:
+        color = default
+    return None if color is None else mcolors.to_hex(color)
+
+class _ChartText:
+    """Stands in for the Matplotlib Text objects returned by a ChartAxes."""
+
+    def set_fontproperties(self, props):
+        pass
+
+class _ChartLegend:
+    """Stands in for the Matplotlib Legend returned by ChartAxes.legend()."""
+
+    def get_frame(self):
+        return self
+
+    def set_alpha(self, alpha):
+        pass
+
+class _ChartAxis:
+    """The x or y axis of a ChartAxes."""
+
+    def __init__(self):
+        self.spec = {}
+
+    def set_major_formatter(self, formatter):
+        # Only the formatters made by this module are known to charts.js.
+        chart_format = getattr(formatter, 'chart_format', None) or getattr(formatter, 'fmt', None)
+        if chart_format:
+            self.spec['format'] = chart_format
+
+class ChartAxes:
+    """Records a graph drawn with the subset of the Matplotlib Axes methods
+    used by the graph functions, so the graph can be saved as a chart file
+    and drawn by the browser.
+    """
+
+    def __init__(self, figure, twin=False):
+        self.figure = figure
+        self.twin = twin
+        self.xaxis = _ChartAxis()
+        self.yaxis = _ChartAxis()
+        self.title = None
+        self.legend_spec = None
+        self.series = []
+        self._colors = mpl.rcParams['axes.prop_cycle'].by_key()['color']
+        self._next_color = 0
+
+    def get_xaxis(self):
+        return self.xaxis
+
+    def get_yaxis(self):
+        return self.yaxis
+
+    def _default_color(self):
+        """Returns the next color of the color cycle."""
+        color = self._colors[self._next_color % len(self._colors)]
+        self._next_color += 1
+        return color
+
+    def _add(self, series_type, label, **spec):
+        spec['type'] = series_type
+        if label is not None and not str(label).startswith('_'):
+            spec['label'] = str(label)
+        if self.twin:
+            spec['axis'] = 'y2'
+        self.series.append(spec)
+        return spec
+
+    def set_title(self, title):
+        self.title = title
+
+    def set_xlabel(self, label):
+        self.xaxis.spec['label'] = label
+
+    def set_ylabel(self, label):
+        self.yaxis.spec['label'] = label
+
+    def set_xticks(self, ticks, labels=None):
+        self.xaxis.spec['ticks'] = _chart_values(ticks)
+        if labels is not None:
+            self.set_xticklabels(labels)
+
+    def set_xticklabels(self, labels):
+        self.xaxis.spec['tick_labels'] = [str(lbl) for lbl in labels]
+
+    def set_yticks(self, ticks):
+        self.yaxis.spec['ticks'] = _chart_values(ticks)
+
+    def set_ylim(self, bottom=None, top=None):
+        if bottom is not None:
+            self.yaxis.spec['min'] = _chart_number(bottom)
+        if top is not None:
+            self.yaxis.spec['max'] = _chart_number(top)
+
+    def tick_params(self, axis='both', labelrotation=None, **kwargs):
+        if labelrotation is not None and axis in ('x', 'both'):
+            self.xaxis.spec['rotation'] = labelrotation
+
+    def axis(self, *args):
+        pass
+
+    def twinx(self):
+        twin = ChartAxes(self.figure, twin=True)
+        self.figure.axes.append(twin)
+        return twin
+
+    def bar(self, x, height, width=0.8, label=None, bottom=0, color=None):
+        x = _chart_values(x)
+        base = _chart_values(np.broadcast_to(np.asarray(bottom, dtype=float), (len(x),)))
+        return self._add('bar', label, x=x, y=_chart_values(height), base=base, width=width,
+                         color=_chart_color(color, self._default_color()))
+
+    def plot(self, x, y, label=None, color=None, linestyle='-', linewidth=None, marker=None, markersize=None):
+        spec = self._add('line', label, x=_chart_values(x), y=_chart_values(y),
+                         color=_chart_color(color, self._default_color()))
+        if linestyle == '--':
+            spec['dash'] = True
+        if linewidth is not None:
+            spec['width'] = float(linewidth)
+        if marker:
+            spec['marker'] = marker
+            spec['marker_size'] = markersize or 6
+        return [spec]
+
+    def plot_date(self, x, y, fmt='o', color=None, label=None):
+        return self.plot(x, y, label=label, color=color)
+
+    def stackplot(self, x, ys, labels=(), colors=None):
+        x = _chart_values(x)
+        ys = np.asarray(ys, dtype=float)
+        top = np.zeros(ys.shape[1])
+        colors = colors or [self._default_color() for row in ys]
+        for row, label, color in zip(ys, labels, colors):
+            bottom, top = top, top + row
+            self._add('band', label, x=x, y1=_chart_values(bottom), y2=_chart_values(top),
+                      color=_chart_color(color))
+
+    def fill_between(self, x, y1, y2, alpha=None, color=None, label=None):
+        self._add('band', label, x=_chart_values(x), y1=_chart_values(y1), y2=_chart_values(y2),
+                  color=_chart_color(color, self._default_color()), alpha=alpha)
+
+    def scatter(self, x, y, marker='o', alpha=None, color=None, label=None):
+        self._add('scatter', label, x=_chart_values(x), y=_chart_values(y), marker=marker,
+                  color=_chart_color(color, self._default_color()), alpha=alpha)
+
+    def pie(self, values, labels=None, autopct=None, shadow=False, startangle=0, colors=None):
+        values = _chart_values(values)
+        colors = colors or [self._default_color() for v in values]
+        self._add('pie', None, values=values, labels=[str(lbl) for lbl in labels], 
+                  colors=[_chart_color(c) for c in colors], start_angle=startangle, 
+                  percents=autopct is not None)
+        texts = [_ChartText() for v in values]
+        return [], texts, [_ChartText() for v in values]
+
+    def get_legend_handles_labels(self):
+        handles = [s for s in self.series if 'label' in s]
+        return handles, [s['label'] for s in handles]
+
+    def legend(self, *args, loc='best', ncol=1, **kwargs):
+        # The legend always lists the labeled series of all of the Axes.
+        self.figure.legend_spec = {'loc': loc, 'ncol': ncol}
+        return _ChartLegend()
+
+class ChartFigure:
+    """Stands in for a Matplotlib Figure when the graph format is 'json'.  
+    savefig() writes a chart file: a JSON object giving the title, the
+    settings of the x-axis and the y-axis (and second y-axis, 'y2', if 
+    present), the legend, and the list of data series, which charts.js draws.
+    """
+
+    def __init__(self):
+        self.axes = []
+        self.legend_spec = None
+
+    def add_subplot(self, *args):
+        ax = ChartAxes(self)
+        self.axes.append(ax)
+        return ax
+
+    def savefig(self, filename):
+        ax = self.axes[0]
+        chart = {
+            'title': next((a.title for a in self.axes if a.title), None),
+            'x': ax.xaxis.spec,
+            'y': ax.yaxis.spec,
+            'legend': self.legend_spec,
+            'series': [s for a in self.axes for s in a.series],
+        }
+        if len(self.axes) > 1:
+            chart['y2'] = self.axes[1].yaxis.spec
+        with open(filename, 'w') as fout:
+            json.dump(chart, fout, separators=(',', ':'))
+
+# ------------------------------ Graph Cache --------------------------------
+
+class GraphCache:
+    """A cache of graph images, stored in the 'cache_dir' directory.  Each 
+    entry is named by a hash of the graph function, the data and parameters
+    passed to it (but not the names of its output files), and the version of
+    this module, so an entry is only used for a graph that would be drawn
+    identically.  An entry is copied to the output file, or hard linked to it
+    where possible, instead of drawing the graph.  The least recently used 
+    entries are removed by evict() to keep the cache under 'max_bytes'.  
+    The 'hits' and 'misses' attributes count the graphs that were found and 
+    not found in the cache.
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+        # The version of the graph code: the source of this module, which 
+        # includes the Matplotlib settings, the Matplotlib version, and the
+        # image used for graphs without data.
+        self.version = cu.cache_key(
+            inspect.getsource(sys.modules[__name__]),
+            mpl.__version__,
+            cu.file_hash(os.path.abspath('no_data_available.png')),
+        )
+
+    def key(self, func_name, params):
+        """Returns the key of the graph made by the graph function named
+        'func_name' from the dictionary of arguments 'params', which excludes
+        the output file names.
+        """
+        h = hashlib.sha1(self.version.encode('utf-8'))
+        h.update(pickle.dumps((func_name, _graph_format, _canonical(params)), protocol=4))
+        return h.hexdigest()
+
+    def _entry_paths(self, key, n_files):
+        """Returns the paths to the 'n_files' graph files of the entry 'key'."""
+        return [os.path.join(self.cache_dir, '{}_{}.{}'.format(key, i, _graph_format)) for i in range(n_files)]
+
+    def fetch(self, key, filenames):
+        """If the cache holds the entry 'key', puts its images in the files
+        'filenames' and returns True; otherwise returns False.
+        """
+        paths = self._entry_paths(key, len(filenames))
+        if not all(os.path.exists(p) for p in paths):
+            self.misses += 1
+            return False
+        try:
+            for path, filename in zip(paths, filenames):
+                _link_or_copy(path, filename)
+                os.utime(path)      # marks the entry as recently used
+        except OSError:
+            # the entry was evicted by another process while being read.
+            self.misses += 1
+            return False
+        self.hits += 1
+        return True
+
+    def store(self, key, filenames):
+        """Stores the images in the files 'filenames' in the entry 'key'."""
+        for filename, path in zip(filenames, self._entry_paths(key, len(filenames))):
+            tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+            _link_or_copy(filename, tmp_path)
+            os.replace(tmp_path, path)
+
+    def take_counts(self):
+        """Returns the (hits, misses) counts and resets them to zero.  Used 
+        to collect the counts of worker processes.
+        """
+        counts = (self.hits, self.misses)
+        self.hits = self.misses = 0
+        return counts
+
+    def evict(self):
+        """Removes the least recently used images until the cache is no 
+        larger than 'max_bytes'.  Returns (number of images removed, bytes
+        in the cache).
+        """
+        entries = []
+        for fn in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, fn)
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+            removed += 1
+        return removed, total
+
+def _canonical(value):
+    """Returns a form of 'value' that pickles the same way whenever it holds
+    the same data.  The pickle of a DataFrame depends on how its data is laid
+    out in memory, so DataFrames and Series are replaced by their labels, data
+    types and a hash of their values and index.
+    """
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        if isinstance(value, pd.DataFrame):
+            labels = (list(value.columns), value.columns.names, [str(t) for t in value.dtypes])
+        else:
+            labels = (value.name, str(value.dtype))
+        row_hashes = pd.util.hash_pandas_object(value, index=True).values
+        return (type(value).__name__, labels, list(value.index.names), row_hashes.tobytes())
+    elif isinstance(value, dict):
+        return {k: _canonical(v) for k, v in value.items()}
+    elif isinstance(value, (list, tuple)):
+        return type(value)(_canonical(v) for v in value)
+    return value
+
+def _link_or_copy(src, dst):
+    """Makes 'dst' a hard link to the file 'src', or a copy of it if the file
+    cannot be linked, replacing any existing 'dst' file.
+    """
+    if os.path.exists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+# The graph cache used by the graph functions decorated with @graph_job, or 
+# None if graphs are not cached.
+_graph_cache = None
+
+def set_graph_cache(graph_cache):
+    """Makes the graph functions use the GraphCache 'graph_cache', or no 
+    cache if it is None.
+    """
+    global _graph_cache
+    _graph_cache = graph_cache
+
+def _output_files(arguments):
+    """Returns the list of files written by a graph function called with the
+    dictionary of arguments 'arguments': the 'filename' argument or the list
+    in the 'filenames' argument.
+    """
+    if 'filenames' in arguments:
+        # None is given for the graphs of a set that are not saved.
+        return [fn for fn in arguments['filenames'] if fn is not None]
+    return [arguments['filename']]
+
+# ------------------------- Graph Rendering Pool ----------------------------
+
+# When a rendering pool has been started with start_render_pool(), calling one
+# of the graph functions decorated with @graph_job only submits a job to the 
+# pool, and returns immediately; the graph is rendered and saved by a worker
+# process.  finish_render_pool() waits for all of the jobs to finish.  When no
+# pool is running, the graph functions render the graph directly.
+_render_pool = None
+_render_max_pending = 0
+_render_jobs = collections.deque()   # (graph label, future) of submitted jobs
+_render_failures = []                # (graph label, error message) of failed jobs
+
+def _init_render_worker(graph_cache, graph_format):
+    """Initializes a rendering worker process, making sure that its graph 
+    functions render directly, in the format 'graph_format', and store their
+    graphs in the GraphCache 'graph_cache', and warming up Matplotlib so the 
+    fonts and the Agg renderer are loaded before the first job arrives.
+    """
+    global _render_pool, _graph_cache
+    _render_pool = None
+    _graph_cache = graph_cache
+    set_graph_format(graph_format)
+    _render_jobs.clear()
+    _render_failures.clear()
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111)
+    ax.plot([0, 1], [0, 1], label='warm-up')
+    ax.legend()
+    ax.set_title('warm-up')
+    fig.canvas.draw()
+
+def _run_render_job(job):
+    """Renders one graph in a worker process.  'job' is a pickled (graph 
+    function name, args, kwargs, graph cache key) tuple; the graph is stored
+    in the graph cache if the key is not None.
+    """
+    func_name, args, kwargs, key = pickle.loads(job)
+    func = globals()[func_name].__wrapped__
+    func(*args, **kwargs)
+    if key is not None:
+        _graph_cache.store(key, _output_files(_bind_arguments(func, args, kwargs)))
+
+def _bind_arguments(func, args, kwargs):
+    """Returns a dictionary of the arguments of the call func(*args, **kwargs), 
+    keyed on parameter name.
+    """
+    return inspect.signature(func).bind(*args, **kwargs).arguments
+
+def _job_label(func, arguments):
+    """Returns a label identifying a graph job in error messages, from the 
+    dictionary of arguments 'arguments' of the call.
+    """
+    return '{}({})'.format(func.__name__, ', '.join(_output_files(arguments)))
+
+def _collect_render_jobs(max_pending):
+    """Collects the results of finished rendering jobs, in the order they were
+    submitted, waiting for jobs to finish until no more than 'max_pending' 
+    jobs are outstanding.  Failed jobs are recorded in '_render_failures'.
+    """
+    while _render_jobs and (len(_render_jobs) > max_pending or _render_jobs[0][1].done()):
+        label, future = _render_jobs.popleft()
+        try:
+            future.result()
+        except Exception as e:
+            _render_failures.append((label, '{}: {}'.format(type(e).__name__, e)))
+
+def graph_job(func=None, check_data=None):
+    """Decorator for graph functions that save a graph to a file and do not
+    return a value.  The file is given by the 'filename' parameter of the 
+    function, or the files by a 'filenames' parameter.  If 'check_data' is
+    given, it is called with the dictionary of the arguments of each call, 
+    and if it returns False, no graph is saved and the function returns 
+    NO_DATA; otherwise the function returns None, so a caller can use
+    'url = graph_function(...) or url'.  If a graph cache is set, the graph
+    is taken from the cache when possible, and stored in the cache otherwise.
+    If a rendering pool is running, calls to the function are submitted to 
+    the pool instead of being run directly.  Use as '@graph_job' or 
+    '@graph_job(check_data=...)'.
+    """
+    if func is None:
+        return functools.partial(graph_job, check_data=check_data)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        arguments = None
+        if check_data is not None:
+            # The check is made here, not by the pool, so the caller knows
+            # right away to show the shared "no data" image.
+            arguments = _bind_arguments(func, args, kwargs)
+            if not check_data(arguments):
+                count_no_data()
+                return NO_DATA
+
+        if _render_pool is None and _graph_cache is None:
+            func(*args, **kwargs)
+            return
+
+        if arguments is None:
+            arguments = _bind_arguments(func, args, kwargs)
+        key = None
+        if _graph_cache is not None:
+            params = {k: v for k, v in arguments.items() if k not in ('filename', 'filenames')}
+            key = _graph_cache.key(func.__name__, params)
+            if _graph_cache.fetch(key, _output_files(arguments)):
+                return
+
+        if _render_pool is None:
+            func(*args, **kwargs)
+            _graph_cache.store(key, _output_files(arguments))
+            return
+
+        # Pickle the arguments now, so that later changes to them by the 
+        # caller do not affect the graph.
+        job = pickle.dumps((func.__name__, args, kwargs, key))
+        future = _render_pool.submit(_run_render_job, job)
+        _render_jobs.append((_job_label(func, arguments), future))
+
+        # Limit the number of outstanding jobs, so the data of unrendered 
+        # graphs does not build up in memory.
+        _collect_render_jobs(_render_max_pending)
+
+    return wrapper
+
+def start_render_pool(workers):
+    """Starts a pool of 'workers' processes to render graphs.  Until 
+    finish_render_pool() is called, graphs are rendered by the pool, while 
+    the caller continues with its work.  The workers use the graph format and
+    the graph cache set before the pool is started.
+    """
+    global _render_pool, _render_max_pending
+    if 'fork' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('fork')
+    else:
+        context = multiprocessing.get_context()
+    _render_pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                                          initializer=_init_render_worker,
+                                                          initargs=(_graph_cache, _graph_format))
+    _render_max_pending = workers * 16
+
+def finish_render_pool():
+    """Waits for all of the graphs submitted to the rendering pool to be 
+    saved, and shuts down the pool.  Returns a list of (graph, error message)
+    two-tuples for the graphs that failed to render.
+    """
+    global _render_pool
+    if _render_pool is None:
+        return []
+    try:
+        _collect_render_jobs(0)
+    finally:
+        _render_pool.shutdown()
+        _render_pool = None
+    failures = list(_render_failures)
+    _render_failures.clear()
+    return failures
+
 def beautify_legend(df, col_list):
     """ This function takes a dataframe and the list of columns that 
     will ultimately be displayed and re-formats the names so that they 
@@ -95,246 +768,246 @@ def nonzero_df(df):
     float_cols = df.dtypes[df.dtypes == np.float64].index.values
     return np.any(df[float_cols].fillna(0.0) > 0)
 
+def has_data(df, cols=None):
+    """Returns True if the DataFrame 'df' is not empty and has a non-zero
+    value in a float column, only looking at the columns in the list 'cols' 
+    if it is given.  This is the test the graph functions use to decide 
+    whether there is data for a graph.
+    """
+    return not df.empty and nonzero_df(df if cols is None else df[cols])
 
+
+@graph_job(check_data=lambda a: has_data(a['df']))
 def area_cost_distribution(df, fiscal_year_col, utility_col_list, filename):
     # Inputs include the dataframe, the column name for the fiscal year column, and the list of column names for the 
     # different utility bills.  The dataframe should already include the summed bills for each fiscal year.
     
-    if not df.empty and nonzero_df(df):
-        fig, ax = plt.subplots()
+    fig, ax = new_figure('distribution')
 
-        # Makes the legend prettier.
-        df, utility_col_list = beautify_legend(df, utility_col_list)
+    # Makes the legend prettier.
+    df, utility_col_list = beautify_legend(df, utility_col_list)
         
-        # Take costs for each utility type and convert to percent of total cost by fiscal year
-        df['total_costs'] = df[utility_col_list].sum(axis=1)
+    # Take costs for each utility type and convert to percent of total cost by fiscal year
+    df['total_costs'] = df[utility_col_list].sum(axis=1)
 
        
-        # Standardize colors using color_formatter utility
-        color_dict = color_formatter(utility_col_list)
+    # Standardize colors using color_formatter utility
+    color_dict = color_formatter(utility_col_list)
         
         
-        percent_columns = []
+    percent_columns = []
 
-        # Create dictionary for differently named keys
-        percent_col_colors = {}
+    # Create dictionary for differently named keys
+    percent_col_colors = {}
         
-        for col in utility_col_list:
-            percent_col = "Percent " + col
-            percent_columns.append(percent_col)
-            df[percent_col] = df[col] / df.total_costs
-            percent_col_colors[percent_col] = color_dict[col]
+    for col in utility_col_list:
+        percent_col = "Percent " + col
+        percent_columns.append(percent_col)
+        df[percent_col] = df[col] / df.total_costs
+        percent_col_colors[percent_col] = color_dict[col]
             
-        df = df.fillna(0)
+    df = df.fillna(0)
 
-        # Create stacked area plot
-        ax.stackplot(df[fiscal_year_col], df[percent_columns].T, labels=percent_columns,
-                    colors=[ percent_col_colors[i] for i in percent_columns])
+    # Create stacked area plot
+    ax.stackplot(df[fiscal_year_col], df[percent_columns].T, labels=percent_columns,
+                colors=[ percent_col_colors[i] for i in percent_columns])
 
-        # Format the y axis to be in percent
-        ax.yaxis.set_major_formatter(FuncFormatter('{0:.0%}'.format))
-        
-        # Format the x-axis to include all fiscal years
-        plt.xticks(np.arange(df[fiscal_year_col].min(), df[fiscal_year_col].max()+1, 1.0))
+    # Format the x-axis to include all fiscal years
+    ax.set_xticks(np.arange(df[fiscal_year_col].min(), df[fiscal_year_col].max()+1, 1.0))
 
-        # Add title and axis labels
-        plt.title('Annual Utility Cost Distribution')
-        plt.ylabel('Utility Cost Distribution')
-        plt.xlabel('Fiscal Year')
+    # Add title and axis labels
+    ax.set_title('Annual Utility Cost Distribution')
+    ax.set_ylabel('Utility Cost Distribution')
         
-        # Add legend
-        leg = plt.legend(loc='lower right', ncol=2, fancybox=True, shadow=True)
-        leg.get_frame().set_alpha(0.5)
+    # Add legend
+    leg = ax.legend(loc='lower right', ncol=2, fancybox=True, shadow=True)
+    leg.get_frame().set_alpha(0.5)
         
-        # Save and show
-        plt.savefig(filename)
-        plt.close('all')
-    else:
-        shutil.copyfile(os.path.abspath('no_data_available.png'), os.path.abspath(filename))
+    # Save
+    fig.savefig(filename)
         
         
+@graph_job(check_data=lambda a: has_data(a['df']))
 def area_use_distribution(df, fiscal_year_col, utility_col_list, filename):
     # Inputs include the dataframe, the column name for the fiscal year column, and the list of column names for the 
     # different utility bills.  The dataframe should already include the summed bills for each fiscal year.
     
-    # Test to see if the dataframe is empty or if all values equal zero
-    if not df.empty and nonzero_df(df):
-        # Makes the legend prettier.
-        df, utility_col_list = beautify_legend(df, utility_col_list)
+    # Makes the legend prettier.
+    df, utility_col_list = beautify_legend(df, utility_col_list)
         
-        fig, ax = plt.subplots()
+    fig, ax = new_figure('distribution')
 
-        # Take usage for each utility type and convert to percent of total cost by fiscal year
-        df['total_use'] = df[utility_col_list].sum(axis=1)
+    # Take usage for each utility type and convert to percent of total cost by fiscal year
+    df['total_use'] = df[utility_col_list].sum(axis=1)
         
-        # Standardize colors using color_formatter utility
-        color_dict = color_formatter(utility_col_list)
+    # Standardize colors using color_formatter utility
+    color_dict = color_formatter(utility_col_list)
         
-        percent_columns = []
+    percent_columns = []
         
-        # Create dictionary for differently named keys
-        percent_col_colors = {}
+    # Create dictionary for differently named keys
+    percent_col_colors = {}
 
-        for col in utility_col_list:
-            percent_col = "Percent " + col
-            percent_columns.append(percent_col)
-            df[percent_col] = df[col] / df.total_use
-            percent_col_colors[percent_col] = color_dict[col]
+    for col in utility_col_list:
+        percent_col = "Percent " + col
+        percent_columns.append(percent_col)
+        df[percent_col] = df[col] / df.total_use
+        percent_col_colors[percent_col] = color_dict[col]
      
-        # Fill the NaNs
-        df = df.fillna(0)
+    # Fill the NaNs
+    df = df.fillna(0)
         
-        # Create stacked area plot
-        ax.stackplot(df[fiscal_year_col], df[percent_columns].T, labels=percent_columns, 
-                     colors=[ percent_col_colors[i] for i in percent_columns])
+    # Create stacked area plot
+    ax.stackplot(df[fiscal_year_col], df[percent_columns].T, labels=percent_columns, 
+                 colors=[ percent_col_colors[i] for i in percent_columns])
 
 
-        # Format the y axis to be in percent
-        ax.yaxis.set_major_formatter(FuncFormatter('{0:.0%}'.format))
-        
-        # Format the x-axis to include all fiscal years
-        plt.xticks(np.arange(df[fiscal_year_col].min(), df[fiscal_year_col].max()+1, 1.0))
+    # Format the x-axis to include all fiscal years
+    ax.set_xticks(np.arange(df[fiscal_year_col].min(), df[fiscal_year_col].max()+1, 1.0))
 
-        # Add title and axis labels
-        plt.title('Annual Energy Usage Distribution')
-        plt.ylabel('Annual Energy Usage Distribution')
-        plt.xlabel('Fiscal Year')
+    # Add title and axis labels
+    ax.set_title('Annual Energy Usage Distribution')
+    ax.set_ylabel('Annual Energy Usage Distribution')
         
-        # Add legend 
-        leg = plt.legend(loc='lower right', ncol=2, fancybox=True, shadow=True)
-        leg.get_frame().set_alpha(0.5)
+    # Add legend 
+    leg = ax.legend(loc='lower right', ncol=2, fancybox=True, shadow=True)
+    leg.get_frame().set_alpha(0.5)
         
-        # Save and show
-        plt.savefig(filename)
-        plt.close('all')
-    else:
-        shutil.copyfile(os.path.abspath('no_data_available.png'), os.path.abspath(filename))
+    # Save
+    fig.savefig(filename)
         
         
+@graph_job(check_data=lambda a: has_data(a['df'], a['column_name_list']))
 def create_stacked_bar(df, fiscal_year_col, column_name_list, ylabel, title, filename):
     
     # Parameters include the dataframe, the name of the column where the fiscal year is listed, a list of the column names
     # with the correct data for the chart, and the filename where the output should be saved.
     
-    # Test to see if the dataframe is empty or if all values equal zero
-    if not df.empty and nonzero_df(df[column_name_list]):
-        # Makes the legend prettier.
-        df, column_name_list = beautify_legend(df, column_name_list)
-
-        # Create the figure
-        fig, ax = plt.subplots()
+    # Makes the legend prettier.
+    df, column_name_list = beautify_legend(df, column_name_list)
 
-        # Set the bar width
-        width = 0.50
+    # Create the figure
+    fig, ax = new_figure('fiscal_year')
 
-        # Standardize colors using color_formatter utility
-        color_dict = color_formatter(column_name_list)
+    # Set the bar width
+    width = 0.50
 
-        # Create the stacked bars.  The "bottom" is the sum of all previous bars to set the starting point for the next bar.
-        previous_col_name = 0
+    # Standardize colors using color_formatter utility
+    color_dict = color_formatter(column_name_list)
 
-        # Fill the NaNs
-        df = df.fillna(0)
+    # Create the stacked bars.  The "bottom" is the sum of all previous bars to set the starting point for the next bar.
+    previous_col_name = 0
 
-        for col in column_name_list:
-            col_name = plt.bar(df[fiscal_year_col], df[col], width, label=col, bottom=previous_col_name, color=color_dict[col])
-            previous_col_name = previous_col_name + df[col]
+    # Fill the NaNs
+    df = df.fillna(0)
 
-        # label axes
-        plt.ylabel(ylabel)
-        plt.xlabel('Fiscal Year')
+    for col in column_name_list:
+        col_name = ax.bar(df[fiscal_year_col], df[col], width, label=col, bottom=previous_col_name, color=color_dict[col])
+        previous_col_name = previous_col_name + df[col]
 
-        # Make one bar for each fiscal year
-        plt.xticks(np.arange(df[fiscal_year_col].min(), df[fiscal_year_col].max()+1, 1.0), 
-                   np.sort(list(df[fiscal_year_col].unique())))
+    # label axes
+    ax.set_ylabel(ylabel)
 
-        df['total_cost'] = df[column_name_list].sum(axis=1)
-        ax.set_ylim(bottom=0, top=df.total_cost.max() + df.total_cost.max()*0.10)
+    # Make one bar for each fiscal year
+    ax.set_xticks(np.arange(df[fiscal_year_col].min(), df[fiscal_year_col].max()+1, 1.0))
+    ax.set_xticklabels(np.sort(list(df[fiscal_year_col].unique())))
 
-        # Format the y-axis so a comma is displayed for thousands
-        ax.get_yaxis().set_major_formatter(FuncFormatter(lambda x, p: format(int(x), ',')))
+    df['total_cost'] = df[column_name_list].sum(axis=1)
+    ax.set_ylim(bottom=0, top=df.total_cost.max() + df.total_cost.max()*0.10)
 
-        plt.title(title)
-        leg = plt.legend(loc='lower right', ncol=2, fancybox=True, shadow=True)
-        leg.get_frame().set_alpha(0.5)
+    ax.set_title(title)
+    leg = ax.legend(loc='lower right', ncol=2, fancybox=True, shadow=True)
+    leg.get_frame().set_alpha(0.5)
 
-        # Save and show
-        plt.savefig(filename)
-        plt.close('all')
-    else:
-        shutil.copyfile(os.path.abspath('no_data_available.png'), os.path.abspath(filename))
+    # Save
+    fig.savefig(filename)
 
         
+@graph_job(check_data=lambda a: has_data(a['df'], a['column_name_list']))
 def energy_use_stacked_bar(df, fiscal_year_col, column_name_list, filename):
     
     # Parameters include the dataframe, the name of the column where the fiscal year is listed, a list of the column names
     # with the correct data for the chart, and the filename where the output should be saved.
     
-    # Test to see if the dataframe is empty or if all values equal zero
-    if not df.empty and nonzero_df(df[column_name_list]):
-        # Makes the legend prettier.
-        df, column_name_list = beautify_legend(df, column_name_list)
+    # Makes the legend prettier.
+    df, column_name_list = beautify_legend(df, column_name_list)
         
-        # Create the figure
-        fig, ax = plt.subplots()
+    # Create the figure
+    fig, ax = new_figure('fiscal_year')
         
-        # Set the bar width
-        width = 0.50
+    # Set the bar width
+    width = 0.50
         
-        # Standardize colors using color_formatter utility
-        color_dict = color_formatter(column_name_list)
+    # Standardize colors using color_formatter utility
+    color_dict = color_formatter(column_name_list)
         
-        # Fill the NaNs
-        df = df.fillna(0)
+    # Fill the NaNs
+    df = df.fillna(0)
         
-        # Create the stacked bars.  The "bottom" is the sum of all previous bars to set the starting point for the next bar.
-        previous_col_name = 0
+    # Create the stacked bars.  The "bottom" is the sum of all previous bars to set the starting point for the next bar.
+    previous_col_name = 0
         
-        for col in column_name_list:
+    for col in column_name_list:
           
-            col_name = ax.bar(df[fiscal_year_col].values, df[col].values, width, label=col, bottom=previous_col_name, 
-                              color=color_dict[col])
-            previous_col_name = previous_col_name + df[col]
+        col_name = ax.bar(df[fiscal_year_col].values, df[col].values, width, label=col, bottom=previous_col_name, 
+                          color=color_dict[col])
+        previous_col_name = previous_col_name + df[col]
           
-        # label axes
-        plt.ylabel('Annual Energy Usage [MMBTU]')
-        plt.xlabel('Fiscal Year')
-        plt.title('Total Annual Energy Usage')
+    # label axes
+    ax.set_ylabel('Annual Energy Usage [MMBTU]')
+    ax.set_title('Total Annual Energy Usage')
         
         
-        # Make one bar for each fiscal year
-        plt.xticks(np.arange(df[fiscal_year_col].min(), df[fiscal_year_col].max()+1, 1.0), 
-                   np.sort(list(df[fiscal_year_col].unique())))
+    # Make one bar for each fiscal year
+    ax.set_xticks(np.arange(df[fiscal_year_col].min(), df[fiscal_year_col].max()+1, 1.0))
+    ax.set_xticklabels(np.sort(list(df[fiscal_year_col].unique())))
         
-        # Set the yticks to go up to the total usage in increments of 1,000
-        df['total_use'] = df[column_name_list].sum(axis=1)
-        plt.yticks(np.arange(0, df.total_use.max()+df.total_use.max()*0.10, 1000))
+    # Set the yticks to go up to the total usage in increments of 1,000
+    df['total_use'] = df[column_name_list].sum(axis=1)
+    ax.set_yticks(np.arange(0, df.total_use.max()+df.total_use.max()*0.10, 1000))
         
-        # Format the y-axis so a comma is displayed for thousands
-        ax.get_yaxis().set_major_formatter(FuncFormatter(lambda x, p: format(int(x), ',')))
-        
-        leg = plt.legend(loc='lower right', ncol=2, fancybox=True, shadow=True)
-        leg.get_frame().set_alpha(0.5)
+    leg = ax.legend(loc='lower right', ncol=2, fancybox=True, shadow=True)
+    leg.get_frame().set_alpha(0.5)
         
-        # Save and show
-        plt.savefig(filename)
-        plt.close('all')
-    else:
-        shutil.copyfile(os.path.abspath('no_data_available.png'), os.path.abspath(filename))
+    # Save
+    fig.savefig(filename)
 
         
 def usage_pie_charts(df, use_or_cost_cols, chart_type, base_filename, site_id):
+    """Makes energy use or cost pie charts for the three most recent years in 
+    'df', returning a list of the URLs of the graphs, with NO_DATA for the 
+    years without data.  See _usage_pie_charts() for the first three 
+    parameters.  The file names and URLs are determined here, so the graphs
+    can be made by the rendering pool or taken from the graph cache.
+    """
+    # base_filename: Base filename for the graphs. A final filename will be 
+    #    created that includes the Site ID, the correct output directory, and 
+    #    the pertinent year.
+    # site_id:  The Site ID to be used to create the filename.
+    years = df.sort_index(ascending=False).index.values[0:3]
+    fns_urls = [graph_filename_url(site_id, '{}_{}'.format(base_filename, year)) for year in years]
+
+    # A year has data if its shares of the total, as graphed, sum to more
+    # than zero.
+    totals = df[use_or_cost_cols].sum(axis=1)
+    shares = df[use_or_cost_cols].div(totals, axis=0).sum(axis=1)
+    year_has_data = [shares.loc[year] > 0 for year in years]
+    count_no_data(year_has_data.count(False))
+
+    if any(year_has_data):
+        filenames = [fn if ok else None for (fn, url), ok in zip(fns_urls, year_has_data)]
+        _usage_pie_charts(df, use_or_cost_cols, chart_type, filenames)
+    return [url if ok else NO_DATA for (fn, url), ok in zip(fns_urls, year_has_data)]
+
+@graph_job
+def _usage_pie_charts(df, use_or_cost_cols, chart_type, filenames):
     
     # df: A dataframe with the fiscal_year as the index and needs to include the values for the passed in list of columns.
     # use_or_cost_cols: a list of the energy usage or energy cost column names
     # chart_type: 1 for an energy use pie chart, 2 for an energy cost pie chart
-    # base_filename: Base filename for that graph. A final filename will be 
-    #    created that includes the Site ID, the correct output directory, and 
-    #    the pertinent year.
-    # site_id:  The Site ID to be used to create the filename.
-    # 
-    # This function returns a list of the URLs that can be used to access the
-    # three graphs from the report page.
+    # filenames: The file names for the graphs of the three most recent 
+    #    years, most recent year first; None for a year whose graph is not
+    #    saved.
 
     # Makes the legend prettier.
     df, use_or_cost_cols = beautify_legend(df, use_or_cost_cols)
@@ -356,14 +1029,10 @@ def usage_pie_charts(df, use_or_cost_cols, chart_type, base_filename, site_id):
     most_recent_complete_years = most_recent_complete_years.drop('Totals', axis=1)
 
     
-    # List holding the Matplotlib figures created.
-    figs = []
-    
-    # List holding the URLs that will access the saved graph image files.
-    urls = []
-    
     # Create a pie chart for each of 3 most recent complete years
-    for year in years:
+    for year, final_fn in zip(years, filenames):
+        if final_fn is None:
+            continue
    
         # Make current year dataframe
         year_df = most_recent_complete_years.query("fiscal_year == @year")
@@ -377,53 +1046,33 @@ def usage_pie_charts(df, use_or_cost_cols, chart_type, base_filename, site_id):
             else:
                 updated_use_or_cost_cols.append(col)
 
-        fig, ax = plt.subplots()
-
-        if year_df.sum(axis=1).values[0] > 0:
-            patches, texts, autotexts = ax.pie(list(year_df.iloc[0].values), labels=list(year_df.columns.values), autopct='%1.1f%%',
-                                                    shadow=True, startangle=90, colors=[ color_dict[i] for i in updated_use_or_cost_cols])
-            
-            plt.tick_params(axis='both', which='both', labelsize=32)
+        fig, ax = new_figure('pie')
+        patches, texts, autotexts = ax.pie(list(year_df.iloc[0].values), labels=list(year_df.columns.values), autopct='%1.1f%%',
+                                                shadow=True, startangle=90, colors=[ color_dict[i] for i in updated_use_or_cost_cols])
         
-            # Create the title based on whether it is an energy use or energy cost pie chart.  
-            if chart_type == 1:
-                title = "FY " + str(year) + " Energy Usage [MMBTU]"
-            else:
-                title = "FY " + str(year) + " Energy Cost [$]"
+        # Create the title based on whether it is an energy use or energy cost pie chart.  
+        if chart_type == 1:
+            title = "FY " + str(year) + " Energy Usage [MMBTU]"
+        else:
+            title = "FY " + str(year) + " Energy Cost [$]"
                 
-            plt.title(title)
-            
-            # Make the graph take up a larger portion of the figure 
-            plt.axis([0.75, 0.75, 0.75, 0.75])
-            ax.axis('equal')  # Equal aspect ratio ensures that pie is drawn as a circle.
+        ax.set_title(title)
             
-            # Increase the font size of the labels
-            props = fm.FontProperties()
-            props.set_size(32)
-            plt.setp(autotexts, fontproperties=props)
-            plt.setp(texts, fontproperties=props)
+        # Make the graph take up a larger portion of the figure 
+        ax.axis([0.75, 0.75, 0.75, 0.75])
+        ax.axis('equal')  # Equal aspect ratio ensures that pie is drawn as a circle.
             
-            # Include the year in the file
-            fn_with_yr = '{}_{}'.format(base_filename, year)
-            final_fn, url = graph_filename_url(site_id, fn_with_yr)
-            urls.append(url)
-            
-            # Save and show
-            plt.savefig(final_fn)
-            figs.append(fig)
-        else:
-            # Include the year in the file
-            fn_with_yr = '{}_{}'.format(base_filename, year)
-            final_fn, url = graph_filename_url(site_id, fn_with_yr)
-            urls.append(url)
-            shutil.copyfile(os.path.abspath('no_data_available.png'), os.path.abspath(final_fn))
+        # Increase the font size of the labels
+        props = fm.FontProperties()
+        props.set_size(32)
+        for text in autotexts + texts:
+            text.set_fontproperties(props)
             
-        
-    plt.close('all')
-    
-    return urls
+        # Save
+        fig.savefig(final_fn)
 
 
+@graph_job(check_data=lambda a: has_data(a['df']))
 def create_monthly_profile(df, graph_column_name, yaxis_name, color_choice, title, filename):
     # Parameters: 
         # df: A dataframe with the fiscal_year, fiscal_mo, and appropriate graph column name ('kWh', 'kW', etc.)
@@ -431,62 +1080,53 @@ def create_monthly_profile(df, graph_column_name, yaxis_name, color_choice, titl
         # yaxis_name: A string that will be displayed on the y-axis
         # color_choice: 'blue', 'red', or 'green' depending on the desired color palette.  
 
-    # Test to see if the dataframe is empty or if all values equal zero
-    if not df.empty and nonzero_df(df):
-        # Get five most recent years
-        recent_years = (sorted(list(df.index.levels[0].values), reverse=True)[0:5])
+    # Get five most recent years
+    recent_years = (sorted(list(df.index.levels[0].values), reverse=True)[0:5])
         
-        # Reset the index of the dataframe for more straightforward queries
-        df_reset = df.reset_index()
+    # Reset the index of the dataframe for more straightforward queries
+    df_reset = df.reset_index()
 
-        # Create a color dictionary of progressively lighter colors of three different shades and convert to dataframe
-        color_dict = {'blue': ['#08519c', '#3182bd', '#6baed6', '#bdd7e7', '#eff3ff'],
-                      'red': ['#a50f15', '#de2d26', '#fb6a4a', '#fcae91', '#fee5d9'],
-                      'green': ['#006d2c', '#31a354', '#74c476', '#bae4b3', '#edf8e9']
-                     }
+    # Create a color dictionary of progressively lighter colors of three different shades and convert to dataframe
+    color_dict = {'blue': ['#08519c', '#3182bd', '#6baed6', '#bdd7e7', '#eff3ff'],
+                  'red': ['#a50f15', '#de2d26', '#fb6a4a', '#fcae91', '#fee5d9'],
+                  'green': ['#006d2c', '#31a354', '#74c476', '#bae4b3', '#edf8e9']
+                 }
 
-        color_df = pd.DataFrame.from_dict(color_dict)
+    color_df = pd.DataFrame.from_dict(color_dict)
 
         
-        # i is the counter for the different colors
-        i=0
+    # i is the counter for the different colors
+    i=0
 
-        # Create the plots
-        fig, ax = plt.subplots()
+    # Create the plots
+    fig, ax = new_figure('monthly_profile')
 
-        for year in recent_years:
+    for year in recent_years:
 
-            # Create df for one year only so it's plotted as a single line
-            year_df = df_reset.query("fiscal_year == @year")
+        # Create df for one year only so it's plotted as a single line
+        year_df = df_reset.query("fiscal_year == @year")
 
-            # Plot the data
-            ax.plot_date(year_df['fiscal_mo'], year_df[graph_column_name], fmt='-', color=color_df.iloc[i][color_choice], 
-                         label=str(year_df.fiscal_year.iloc[0]))
+        # Plot the data
+        ax.plot_date(year_df['fiscal_mo'], year_df[graph_column_name], fmt='-', color=color_df.iloc[i][color_choice], 
+                     label=str(year_df.fiscal_year.iloc[0]))
 
-            # Increase counter by one to use the next color
-            i += 1
+        # Increase counter by one to use the next color
+        i += 1
 
-        
-        # Format the y-axis so a comma is displayed for thousands
-        ax.get_yaxis().set_major_formatter(FuncFormatter(lambda x, p: format(int(x), ',')))
-        
-        # Set x-axis labels to be fiscal months, starting in July
-        ax.set_xticks(year_df.fiscal_mo.values)
-        ax.set_xticklabels(bu.mo_list)
+    # Set x-axis labels to be fiscal months, starting in July
+    ax.set_xticks(year_df.fiscal_mo.values)
+    ax.set_xticklabels(bu.mo_list)
 
-        # Add the labels
-        plt.xlabel('Month of Year')
-        plt.ylabel(yaxis_name)
-        plt.legend()
-        plt.title(title)
+    # Add the labels
+    ax.set_ylabel(yaxis_name)
+    ax.legend()
+    ax.set_title(title)
 
-        # Save and show
-        plt.savefig(filename)
-        plt.close('all')
-    else:
-        shutil.copyfile(os.path.abspath('no_data_available.png'), os.path.abspath(filename))
+    # Save
+    fig.savefig(filename)
         
         
+@graph_job(check_data=lambda a: has_data(a['df'], list(a['bar_col_list']) + [a['line_col']]))
 def stacked_bar_with_line(df, fiscal_year_col, bar_col_list, line_col, ylabel1, ylabel2, title, filename):
     
     # Parameters:
@@ -496,197 +1136,211 @@ def stacked_bar_with_line(df, fiscal_year_col, bar_col_list, line_col, ylabel1,
     # ylabel1 and ylabel2: Strings to name the y-axes
     # filename: A string with the filename where the output should be saved.
     
-    # Test to see if the dataframe is empty or if all values equal zero
-    all_cols = []
-    all_cols.extend(bar_col_list)
-    all_cols.append(line_col)
-    if not df.empty and nonzero_df(df[all_cols]):
-        # Makes the legend prettier.
-        df, bar_col_list = beautify_legend(df, bar_col_list)
+    # Makes the legend prettier.
+    df, bar_col_list = beautify_legend(df, bar_col_list)
         
-         # Makes the legend prettier.
-        df_line, line_col = beautify_legend(df, [line_col])
+     # Makes the legend prettier.
+    df_line, line_col = beautify_legend(df, [line_col])
         
-        # Create the figure
-        fig, ax = plt.subplots()
+    # Create the figure.  The line is drawn on a separate y-axis, the 
+    # second Axes of the figure.
+    fig, ax = new_figure('bar_with_line')
+    ax2 = fig.axes[1]
         
-        # Set the bar width
-        width = 0.50
+    # Set the bar width
+    width = 0.50
         
-        # Standardize colors using color_formatter utility
-        color_dict = color_formatter(bar_col_list)
+    # Standardize colors using color_formatter utility
+    color_dict = color_formatter(bar_col_list)
         
-        # Create the stacked bars.  The "bottom" is the sum of all previous bars to set the starting point for the next bar.
-        previous_col_name = 0
+    # Create the stacked bars.  The "bottom" is the sum of all previous bars to set the starting point for the next bar.
+    previous_col_name = 0
         
-        # Fill the NaNs
-        df = df.fillna(0)
-        df_line = df_line.fillna(0)
+    # Fill the NaNs
+    df = df.fillna(0)
+    df_line = df_line.fillna(0)
         
-        for col in bar_col_list:
-            col_name = ax.bar(df[fiscal_year_col], df[col], width, label=col, bottom=previous_col_name, color=color_dict[col])
-            previous_col_name = previous_col_name + df[col]
+    for col in bar_col_list:
+        col_name = ax.bar(df[fiscal_year_col], df[col], width, label=col, bottom=previous_col_name, color=color_dict[col])
+        previous_col_name = previous_col_name + df[col]
           
-        # label axes
-        ax.set_ylabel(ylabel1)
-        ax.set_xlabel('Fiscal Year')
-        
-        # Make one bar for each fiscal year
-        plt.xticks(np.arange(df[fiscal_year_col].min(), df[fiscal_year_col].max()+1, 1.0), 
-                   np.sort(list(df[fiscal_year_col].unique())))
+    # label axes
+    ax.set_ylabel(ylabel1)
         
-        ax.set_ylim(bottom=0, top=previous_col_name.max() + previous_col_name.max()*0.10)
+    # Make one bar for each fiscal year
+    ax.set_xticks(np.arange(df[fiscal_year_col].min(), df[fiscal_year_col].max()+1, 1.0))
+    ax.set_xticklabels(np.sort(list(df[fiscal_year_col].unique())))
         
-        # Create the line on the same graph but on a separate axis.
-        ax2 = ax.twinx()
-        ax2.plot(df_line[fiscal_year_col], df_line[line_col[0]], label=line_col[0], color='k',linewidth=5, marker='D', markersize=10)
-        ax2.set_ylabel(ylabel2)
+    ax.set_ylim(bottom=0, top=previous_col_name.max() + previous_col_name.max()*0.10)
         
-        # Ensure that the axis starts at 0.
-        ax2.set_ylim(bottom=0, top=df_line[line_col[0]].max() + df_line[line_col[0]].max()*0.10)
+    # Create the line on the same graph but on the separate axis.
+    ax2.plot(df_line[fiscal_year_col], df_line[line_col[0]], label=line_col[0], color='k',linewidth=5, marker='D', markersize=10)
+    ax2.set_ylabel(ylabel2)
         
-        # Format the y-axis so a comma is displayed for thousands
-        ax.get_yaxis().set_major_formatter(FuncFormatter(lambda x, p: format(int(x), ',')))
-        ax2.get_yaxis().set_major_formatter(FuncFormatter(lambda x, p: format(int(x), ',')))
+    # Ensure that the axis starts at 0.
+    ax2.set_ylim(bottom=0, top=df_line[line_col[0]].max() + df_line[line_col[0]].max()*0.10)
         
-        h1, l1 = ax.get_legend_handles_labels()
-        h2, l2 = ax2.get_legend_handles_labels()
-        ax.legend(h1+h2, l1+l2, loc='lower left')
-        plt.title(title)
+    h1, l1 = ax.get_legend_handles_labels()
+    h2, l2 = ax2.get_legend_handles_labels()
+    ax.legend(h1+h2, l1+l2, loc='lower left')
+    ax2.set_title(title)
         
-        # Save and show
-        plt.savefig(filename)
-        plt.close('all')
-    else:
-        shutil.copyfile(os.path.abspath('no_data_available.png'), os.path.abspath(filename))
+    # Save
+    fig.savefig(filename)
     
     
+@graph_job(check_data=lambda a: has_data(a['unit_cost_df']))
 def fuel_price_comparison_graph(unit_cost_df, date_col, unit_cost_cols, bldg_unit_cost_col, filename):
     
-        # Test to see if the dataframe is empty or if all values equal zero
-    if not unit_cost_df.empty and nonzero_df(unit_cost_df):
-        # Makes the legend prettier.
-        unit_cost_df, unit_cost_cols = beautify_legend(unit_cost_df, unit_cost_cols)
+    # Makes the legend prettier.
+    unit_cost_df, unit_cost_cols = beautify_legend(unit_cost_df, unit_cost_cols)
         
-        # Makes the legend prettier.
-        unit_cost_df, bldg_unit_cost_col = beautify_legend(unit_cost_df, [bldg_unit_cost_col])
+    # Makes the legend prettier.
+    unit_cost_df, bldg_unit_cost_col = beautify_legend(unit_cost_df, [bldg_unit_cost_col])
         
-        # Standardize colors using color_formatter utility
-        color_dict = color_formatter(unit_cost_cols)
+    # Standardize colors using color_formatter utility
+    color_dict = color_formatter(unit_cost_cols)
 
-        fig, ax = plt.subplots()
+    fig, ax = new_figure()
 
-        # Plot the fuel unit costs for each fuel type
-        for col in unit_cost_cols:
-            plt.plot(unit_cost_df[date_col], unit_cost_df[col], label=col, linestyle='--', color=color_dict[col])
+    # Plot the fuel unit costs for each fuel type
+    for col in unit_cost_cols:
+        ax.plot(unit_cost_df[date_col], unit_cost_df[col], label=col, linestyle='--', color=color_dict[col])
 
-        # Plot the building unit cost for fuels used
-        plt.plot(unit_cost_df[date_col], unit_cost_df[bldg_unit_cost_col[0]], label=bldg_unit_cost_col[0], linestyle='-', color='k')
+    # Plot the building unit cost for fuels used
+    ax.plot(unit_cost_df[date_col], unit_cost_df[bldg_unit_cost_col[0]], label=bldg_unit_cost_col[0], linestyle='-', color='k')
 
-        plt.ylabel('Energy Cost [$/MMBTU]')
-        plt.xlabel('Date')
-        plt.title("Heating Fuel Unit Price Comparison [$/MMBTU]")
+    ax.set_ylabel('Energy Cost [$/MMBTU]')
+    ax.set_xlabel('Date')
+    ax.set_title("Heating Fuel Unit Price Comparison [$/MMBTU]")
 
-        plt.legend()
+    ax.legend()
         
-        # Save and show
-        plt.savefig(filename)
-        plt.close('all')
-    else: 
-        shutil.copyfile(os.path.abspath('no_data_available.png'), os.path.abspath(filename))        
+    # Save
+    fig.savefig(filename)
 
+@graph_job(check_data=lambda a: has_data(a['df']))
 def create_monthly_line_graph(df, date_col, graph_col, ylabel, filename):
     
-    # Test to see if the dataframe is empty or if all values equal zero
-    if not df.empty and nonzero_df(df):    
-        fig, ax = plt.subplots()
+    fig, ax = new_figure()
         
-        # Create the plot
-        plt.plot(df[date_col], df[graph_col], color='k')
+    # Create the plot
+    ax.plot(df[date_col], df[graph_col], color='k')
         
-        # Set the ylabel
-        plt.ylabel(ylabel)
+    # Set the ylabel
+    ax.set_ylabel(ylabel)
         
-        if df[graph_col].max() > 1000:
-            # Format the y-axis so a comma is displayed for thousands
-            ax.get_yaxis().set_major_formatter(FuncFormatter(lambda x, p: format(int(x), ',')))
+    if df[graph_col].max() > 1000:
+        # Format the y-axis so a comma is displayed for thousands
+        ax.get_yaxis().set_major_formatter(_thousands_formatter())
         
-        plt.title("Realized Cumulative Energy Savings from Fuel Switching")
+    ax.set_title("Realized Cumulative Energy Savings from Fuel Switching")
         
-        # Save and show
-        plt.savefig(filename)
-        plt.close('all')
-    else: 
-        shutil.copyfile(os.path.abspath('no_data_available.png'), os.path.abspath(filename))            
+    # Save
+    fig.savefig(filename)
     
 def graph_filename_url(site_id, base_graph_name):
     """This function returns a two-tuple: graph file name, graph URL.
     The graph file name is used to save the graph to the file system; the
     graph URL is used in an HTML site report to load the graph into an
-    image tag.
+    image tag (or, for 'json' chart files, a chart canvas).
     Parameters:
     'site_id': the Site ID of the site this graph is related to.
     'base_graph_name': a graph file name, not including the Site ID and not
-        including the 'png' extension.  For example: 'eco_g1', which will
-        produce a graph file name of 'ANSBG1_eco_g1.png' assuming
-        the Site ID is ANSBG1.
+        including the extension, which is given by the graph format.  For
+        example: 'eco_g1', which will produce a graph file name of 
+        'ANSBG1_eco_g1.png' assuming the Site ID is ANSBG1.
     """
-    fn = 'output/images/{}_{}.png'.format(site_id, base_graph_name)
-    url = 'images/{}_{}.png'.format(site_id, base_graph_name)
+    fn = 'output/images/{}_{}.{}'.format(site_id, base_graph_name, _graph_format)
+    url = 'images/{}_{}.{}'.format(site_id, base_graph_name, _graph_format)
     return fn, url
 
-def building_type_comparison_graph(df, graph_column, site, filename):
+# The columns of the comparison data that peer groups are formed from, and the
+# metrics that are compared within the groups.
+comparison_group_cols = ('primary_func', 'site_category')
+comparison_metrics = ('eci', 'eui', 'specific_eui')
+
+def comparison_bands(df, percentiles=(10, 90)):
+    """Returns a DataFrame of percentiles of the comparison metrics for each
+    peer group and fiscal year, used for the 10th-90th percentile bands of the
+    building type and building owner comparison graphs.  'df' holds the 
+    yearly values of all sites, in the format used by those graphs.  The 
+    returned DataFrame is indexed on (group type, group, metric, fiscal_year),
+    where the group type is the column that forms the peer groups (see 
+    'comparison_group_cols'), and has a column for each percentile, named 
+    'p10', 'p90', etc.  Infinite and NaN values are ignored.
+    """
+    values = df[list(comparison_metrics)].to_numpy(dtype=float)
+    values[np.isinf(values)] = np.nan
+
+    bands = []
+    for group_col in comparison_group_cols:
+        # Place the values of each group/year in a row of a NaN-padded array,
+        # so the percentiles of all groups and metrics are found in one call.
+        # Rows with a missing group are left out.
+        gb = df.groupby([group_col, 'fiscal_year'], sort=True)
+        codes = gb.ngroup().values
+        ok = ~np.isnan(codes)
+        codes = codes[ok].astype(int)
+        pos = gb.cumcount().values[ok].astype(int)
+        keys = gb.size().index
+        arr = np.full((len(comparison_metrics), len(keys), pos.max() + 1 if len(pos) else 0), np.nan)
+        arr[:, codes, pos] = values[ok].T
+        with warnings.catch_warnings():
+            # groups with no values for a metric give NaN
+            warnings.simplefilter('ignore', RuntimeWarning)
+            pct = np.nanpercentile(arr, percentiles, axis=2)
+
+        n_metrics, n_keys = len(comparison_metrics), len(keys)
+        index = pd.MultiIndex.from_arrays([
+            np.repeat(group_col, n_metrics * n_keys),
+            np.tile(keys.get_level_values(0), n_metrics),
+            np.repeat(comparison_metrics, n_keys),
+            np.tile(keys.get_level_values(1), n_metrics),
+        ], names=['group_type', 'group', 'metric', 'fiscal_year'])
+        data = {'p{}'.format(p): pct[i].ravel() for i, p in enumerate(percentiles)}
+        bands.append(pd.DataFrame(data, index=index))
+
+    return pd.concat(bands).sort_index()
+
+def _comparison_band(bands, group_type, group, metric):
+    """Returns the percentile bands for one peer group and metric from the
+    'bands' DataFrame made by comparison_bands(), indexed on fiscal_year.  A
+    group without any values gives an empty DataFrame.
+    """
+    try:
+        return bands.loc[(group_type, group, metric)]
+    except KeyError:
+        return bands.iloc[:0].droplevel(['group_type', 'group', 'metric'])
+
+@graph_job(check_data=lambda a: (a['df'].site_id == a['site']).any())
+def building_type_comparison_graph(df, graph_column, site, filename, bands=None):
     ''' This function creates a graph that compares the eui, eci, or specific_eui to 
     buildings of a chosen usage type in the dataset. The inputs are the df in a format similar to 
     the df5.pkl, the column name to graph, the building site name, 
-    and the filename for saving the output.'''
+    and the filename for saving the output.  'bands' is the DataFrame of 
+    percentile bands from comparison_bands(df); pass it when making several 
+    graphs from the same 'df' so the bands are only calculated once.'''
     
     # Create df with chosen building site to create line plot
     site_df = df.query("site_id == @site")
-
-    # There may be no energy data for this building.  Show "No Data" graph and exit.
-    if len(site_df)==0:
-        shutil.copyfile(os.path.abspath('no_data_available.png'), os.path.abspath(filename))            
-        return
     
     # Get the usage type of the site.  Note that the usage type should be the same
     # for all records for a given site, but if not this code will only take the first.
     usage_type = site_df.primary_func.iloc[0]
     
-    # Limit dataframe to only buildings of the chosen usage type
-    usage_type_df = df.query("primary_func == @usage_type")
-
-    # Replace infinity values with NaN's so that they are ignored during percentile calculations
-    usage_type_df = usage_type_df.replace([np.inf, -np.inf], np.nan)
-
-    # Get the 10th percentile for this given usage type
-    usage_type_10 = usage_type_df.groupby(['fiscal_year']).quantile(0.1)
-    # Reset the index for easier merging
-    usage_type_10 = usage_type_10.reset_index()
-
-    # Get the 90th percentile for this given usage type
-    usage_type_90 = usage_type_df.groupby(['fiscal_year']).quantile(0.9)
-    # Reset the index for easier merging
-    usage_type_90 = usage_type_90.reset_index()
-
-    # Merge dataframes
-    usage_df_10_90 = pd.merge(usage_type_90, usage_type_10, how='outer',
-                             left_on='fiscal_year', right_on='fiscal_year',
-                             suffixes=['_90', '_10'])
+    # Get the 10th and 90th percentiles of the buildings of the same usage type
+    if bands is None:
+        bands = comparison_bands(df)
+    usage_df_10_90 = _comparison_band(bands, 'primary_func', usage_type, graph_column)
 
     # Create the figure
-    fig, ax = plt.subplots()
-
-    plt.xticks(rotation=45)
+    fig, ax = new_figure('comparison')
 
     # Create the labels for the legend
     plot_label = graph_column.upper() + " for building site " + site
     area_label = usage_type + " 10th-90th percentile " + graph_column.upper()
 
-    # Define the column names for the 10th and 90th percentiles
-    graph_column_10 = graph_column + '_10'
-    graph_column_90 = graph_column + '_90'
-
     # Plot the line for the chosen building site
     ax.plot(site_df.fiscal_year, site_df[graph_column], linewidth='3.0', marker='o',
            markersize=8, label=plot_label)
@@ -695,18 +1349,18 @@ def building_type_comparison_graph(df, graph_column, site, filename):
         ax.get_yaxis().set_major_formatter(FormatStrFormatter('%.1f'))
     else:
         # Format the y-axis so a comma is displayed for thousands
-        ax.get_yaxis().set_major_formatter(FuncFormatter(lambda x, p: format(int(x), ',')))
+        ax.get_yaxis().set_major_formatter(_thousands_formatter())
 
     # Add in markers on the border of the area graph showing the 10th to 90th percentile
-    ax.scatter(usage_df_10_90.fiscal_year, usage_df_10_90[graph_column_10], marker='s',
+    ax.scatter(usage_df_10_90.index, usage_df_10_90.p10, marker='s',
               alpha=0.5, color='#92c5de', label=None)
-    ax.scatter(usage_df_10_90.fiscal_year, usage_df_10_90[graph_column_90], marker='s',
+    ax.scatter(usage_df_10_90.index, usage_df_10_90.p90, marker='s',
               alpha=0.5, color='#92c5de', label=None)
 
 
     # Create an area graph showing the 10th to 90th percentile
-    ax.fill_between(usage_df_10_90.fiscal_year, usage_df_10_90[graph_column_10], 
-                    usage_df_10_90[graph_column_90], 
+    ax.fill_between(usage_df_10_90.index, usage_df_10_90.p10, 
+                    usage_df_10_90.p90, 
                     alpha=0.5, color='#92c5de', label=area_label)
 
     # Define the axis labels and titles
@@ -720,67 +1374,41 @@ def building_type_comparison_graph(df, graph_column, site, filename):
     yaxis_label = graph_column.upper() + " (" + units_dict[graph_column] + ")"
 
 
-    plt.ylabel(yaxis_label)
-    plt.xlabel('Fiscal Year')
-    plt.title(plot_title)
+    ax.set_ylabel(yaxis_label)
+    ax.set_title(plot_title)
 
-    plt.legend(fontsize=16)
+    ax.legend(fontsize=16)
 
-    plt.savefig(filename)
-    plt.close('all')
+    fig.savefig(filename)
    
-def building_owner_comparison_graph(df, graph_column, site, filename):
+@graph_job(check_data=lambda a: (a['df'].site_id == a['site']).any())
+def building_owner_comparison_graph(df, graph_column, site, filename, bands=None):
     ''' This function creates a graph that compares the eui, eci, or specific_eui to 
     buildings of a chosen usage type in the dataset. The inputs are the df in a format similar to 
     the df5.pkl, the column name to graph, the building site name, 
-    and the filename for saving the output.'''
+    and the filename for saving the output.  'bands' is the DataFrame of 
+    percentile bands from comparison_bands(df); pass it when making several 
+    graphs from the same 'df' so the bands are only calculated once.'''
     
     # Create df with chosen building site to create line plot
     site_df = df.query("site_id == @site")
-
-    # There may be no energy data for this building.  Show "No Data" graph and exit.
-    if len(site_df)==0:
-        shutil.copyfile(os.path.abspath('no_data_available.png'), os.path.abspath(filename))            
-        return
     
     # Get the usage type of the site.  Note that the usage type should be the same
     # for all records for a given site, but if not this code will only take the first.
     building_owner = site_df.site_category.iloc[0]
     
-    # Limit dataframe to only buildings of the chosen usage type
-    owner_df = df.query("site_category == @building_owner")
-
-    # Replace infinity values with NaN's so that they are ignored during percentile calculations
-    owner_df = owner_df.replace([np.inf, -np.inf], np.nan)
-
-    # Get the 10th percentile for this given usage type
-    owner_10 = owner_df.groupby(['fiscal_year']).quantile(0.1)
-    # Reset the index for easier merging
-    owner_10 = owner_10.reset_index()
-
-    # Get the 90th percentile for this given usage type
-    owner_90 = owner_df.groupby(['fiscal_year']).quantile(0.9)
-    # Reset the index for easier merging
-    owner_90 = owner_90.reset_index()
-
-    # Merge dataframes
-    owner_df_10_90 = pd.merge(owner_90, owner_10, how='outer',
-                             left_on='fiscal_year', right_on='fiscal_year',
-                             suffixes=['_90', '_10'])
+    # Get the 10th and 90th percentiles of the buildings of the same owner
+    if bands is None:
+        bands = comparison_bands(df)
+    owner_df_10_90 = _comparison_band(bands, 'site_category', building_owner, graph_column)
 
     # Create the figure
-    fig, ax = plt.subplots()
-
-    plt.xticks(rotation=45)
+    fig, ax = new_figure('comparison')
 
     # Create the labels for the legend
     plot_label = graph_column.upper() + " for building site " + site
     area_label = building_owner + " 10th-90th percentile " + graph_column.upper()
 
-    # Define the column names for the 10th and 90th percentiles
-    graph_column_10 = graph_column + '_10'
-    graph_column_90 = graph_column + '_90'
-
     # Plot the line for the chosen building site
     ax.plot(site_df.fiscal_year, site_df[graph_column], linewidth='3.0', marker='o',
            markersize=8, label=plot_label)
@@ -789,17 +1417,17 @@ def building_owner_comparison_graph(df, graph_column, site, filename):
         ax.get_yaxis().set_major_formatter(FormatStrFormatter('%.1f'))
     else:
         # Format the y-axis so a comma is displayed for thousands
-        ax.get_yaxis().set_major_formatter(FuncFormatter(lambda x, p: format(int(x), ',')))
+        ax.get_yaxis().set_major_formatter(_thousands_formatter())
 
     # Add in markers on the border of the area graph showing the 10th to 90th percentile
-    ax.scatter(owner_df_10_90.fiscal_year, owner_df_10_90[graph_column_10], marker='s',
+    ax.scatter(owner_df_10_90.index, owner_df_10_90.p10, marker='s',
                 alpha=0.5, color='#92c5de', label=None)
-    ax.scatter(owner_df_10_90.fiscal_year, owner_df_10_90[graph_column_90], marker='s',
+    ax.scatter(owner_df_10_90.index, owner_df_10_90.p90, marker='s',
                 alpha=0.5, color='#92c5de', label=None)
 
     # Create an area graph showing the 10th to 90th percentile
-    ax.fill_between(owner_df_10_90.fiscal_year, owner_df_10_90[graph_column_10], 
-                    owner_df_10_90[graph_column_90], 
+    ax.fill_between(owner_df_10_90.index, owner_df_10_90.p10, 
+                    owner_df_10_90.p90, 
                     alpha=0.5, color='#92c5de', label=area_label)
 
     # Define the axis labels and titles
@@ -813,14 +1441,12 @@ def building_owner_comparison_graph(df, graph_column, site, filename):
     yaxis_label = graph_column.upper() + " (" + units_dict[graph_column] + ")"
 
 
-    plt.ylabel(yaxis_label)
-    plt.xlabel('Fiscal Year')
-    plt.title(plot_title)
+    ax.set_ylabel(yaxis_label)
+    ax.set_title(plot_title)
 
-    plt.legend(fontsize=16)
+    ax.legend(fontsize=16)
 
-    plt.savefig(filename)
-    plt.close('all')
+    fig.savefig(filename)
             
         
             
@@ -0,0 +1,633 @@
+/*
+ * Draws the graphs of the site reports in the browser, when the benchmark
+ * script is run with the CLIENT_SIDE_GRAPHS setting.  Each graph is a
+ * <canvas class="chart" data-src="..."> element whose 'data-src' is the URL of
+ * a chart file written by graph_util.ChartFigure: a JSON object with the
+ * title, the x-axis, y-axis and second y-axis ('y2') settings, the legend,
+ * and the list of data series.  The series types are 'bar', 'line', 'band'
+ * (a filled area between two lines), 'scatter' and 'pie'.  No chart file is
+ * written for a graph without data; the report template shows the shared
+ * "no data" image in its place.
+ *
+ * The charts are styled to look like the Matplotlib 'bmh' style of the
+ * image graphs.  No other libraries are needed.
+ */
+(function () {
+    'use strict';
+
+    var ASPECT = 2 / 3;          // height / width, as for the 6 x 4 inch images
+    var FONT = '"DejaVu Sans", Verdana, Arial, sans-serif';
+    var AXES_BG = '#eeeeee';
+    var GRID_COLOR = '#b2b2b2';
+    var TEXT_COLOR = '#000000';
+    var DAY_MS = 24 * 3600 * 1000;
+    var MONTHS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+                  'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'];
+
+    // ------------------------- Numbers and ticks -------------------------
+
+    function finite(v) {
+        return v !== null && v !== undefined && isFinite(v);
+    }
+
+    // Returns about 'count' evenly spaced, round tick values covering lo - hi.
+    function niceTicks(lo, hi, count) {
+        if (lo === hi) {
+            lo -= 1;
+            hi += 1;
+        }
+        var raw = (hi - lo) / count;
+        var mag = Math.pow(10, Math.floor(Math.log(raw) / Math.LN10));
+        var steps = [1, 2, 2.5, 5, 10];
+        var step = mag;
+        for (var i = 0; i < steps.length; i++) {
+            if (steps[i] * mag >= raw) {
+                step = steps[i] * mag;
+                break;
+            }
+        }
+        var ticks = [];
+        var first = Math.ceil(lo / step - 1e-9);
+        for (var n = first; n * step <= hi + step * 1e-9; n++) {
+            ticks.push(n * step);
+        }
+        return ticks;
+    }
+
+    // Returns tick values at the start of months or years covering lo - hi,
+    // both in milliseconds since 1970.
+    function dateTicks(lo, hi, count) {
+        var months = (hi - lo) / (30.4 * DAY_MS);
+        var choices = [1, 2, 3, 4, 6, 12, 24, 36, 60, 120];
+        var every = choices[choices.length - 1];
+        for (var i = 0; i < choices.length; i++) {
+            if (months / choices[i] <= count) {
+                every = choices[i];
+                break;
+            }
+        }
+        var d = new Date(lo);
+        var year = d.getUTCFullYear();
+        var mo = every >= 12 ? 0 : Math.ceil(d.getUTCMonth() / every) * every;
+        var ticks = [];
+        for (;;) {
+            var t = Date.UTC(year, mo, 1);
+            if (t > hi) {
+                break;
+            }
+            if (t >= lo && (every < 12 || year % (every / 12) === 0)) {
+                ticks.push(t);
+            }
+            mo += every >= 12 ? 12 : every;
+            if (mo >= 12) {
+                year += Math.floor(mo / 12);
+                mo = mo % 12;
+            }
+        }
+        return ticks;
+    }
+
+    function formatDate(t, step) {
+        var d = new Date(t);
+        if (step >= 360 * DAY_MS) {
+            return String(d.getUTCFullYear());
+        }
+        return MONTHS[d.getUTCMonth()] + ' ' + d.getUTCFullYear();
+    }
+
+    function withCommas(s) {
+        var parts = s.split('.');
+        parts[0] = parts[0].replace(/\B(?=(\d{3})+(?!\d))/g, ',');
+        return parts.join('.');
+    }
+
+    // Returns the label for the tick value 'v' on an axis with the 'format'
+    // given by the chart file, and tick spacing 'step'.
+    function formatTick(v, format, step) {
+        if (format === 'thousands') {
+            return withCommas(String(v < 0 ? Math.ceil(v) : Math.floor(v)));
+        }
+        if (format === 'percent') {
+            return Math.round(v * 100) + '%';
+        }
+        var m = /^%\.(\d+)f$/.exec(format || '');
+        if (m) {
+            return v.toFixed(parseInt(m[1], 10));
+        }
+        var decimals = Math.max(0, -Math.floor(Math.log(step) / Math.LN10 + 1e-9));
+        return v.toFixed(Math.min(decimals, 6));
+    }
+
+    // --------------------------- Chart layout ----------------------------
+
+    function eachPoint(chart, axisName, fn) {
+        chart.series.forEach(function (s) {
+            if (s.type === 'pie' || (s.axis || 'y') !== axisName) {
+                return;
+            }
+            var ys = s.type === 'band' ? s.y1.concat(s.y2) :
+                     s.type === 'bar' ? s.y.map(function (y, i) { return y + (s.base[i] || 0); }).concat(s.base) :
+                     s.y;
+            var xs = s.type === 'band' ? s.x.concat(s.x) :
+                     s.type === 'bar' ? s.x.concat(s.x) : s.x;
+            for (var i = 0; i < ys.length; i++) {
+                if (finite(xs[i]) && finite(ys[i])) {
+                    fn(xs[i], ys[i], s);
+                }
+            }
+        });
+    }
+
+    // Returns the range and ticks of the x-axis.
+    function xScale(chart) {
+        var spec = chart.x || {};
+        var lo = Infinity, hi = -Infinity, halfBar = 0;
+        chart.series.forEach(function (s) {
+            if (s.type === 'pie') {
+                return;
+            }
+            s.x.forEach(function (x) {
+                if (finite(x)) {
+                    lo = Math.min(lo, x);
+                    hi = Math.max(hi, x);
+                }
+            });
+            if (s.type === 'bar') {
+                halfBar = Math.max(halfBar, s.width / 2);
+            }
+        });
+        (spec.ticks || []).forEach(function (t) {
+            lo = Math.min(lo, t);
+            hi = Math.max(hi, t);
+        });
+        if (!finite(lo)) {
+            lo = 0;
+            hi = 1;
+        }
+        // values of milliseconds since 1970 are dates
+        var isDate = lo > 1e11;
+        var pad = halfBar ? halfBar + 0.25 : (isDate ? 0 : (hi - lo) * 0.02);
+        var scale = {lo: lo - pad, hi: hi + pad, isDate: isDate, format: spec.format};
+        if (scale.hi === scale.lo) {
+            scale.lo -= 1;
+            scale.hi += 1;
+        }
+        if (spec.ticks) {
+            scale.ticks = spec.ticks;
+            scale.labels = spec.tick_labels || spec.ticks.map(function (t) {
+                return isDate ? formatDate(t, 0) : formatTick(t, spec.format, 1);
+            });
+        } else if (isDate) {
+            scale.ticks = dateTicks(lo, hi, 7);
+            var step = scale.ticks.length > 1 ? scale.ticks[1] - scale.ticks[0] : 365 * DAY_MS;
+            scale.labels = scale.ticks.map(function (t) { return formatDate(t, step); });
+        } else {
+            scale.ticks = niceTicks(lo, hi, 7).filter(function (t) {
+                return t >= scale.lo && t <= scale.hi;
+            });
+            var xstep = scale.ticks.length > 1 ? scale.ticks[1] - scale.ticks[0] : 1;
+            scale.labels = scale.ticks.map(function (t) { return formatTick(t, spec.format, xstep); });
+        }
+        return scale;
+    }
+
+    // Returns the range and ticks of the y-axis named 'axisName' ('y' or
+    // 'y2'), or null if no series use it.
+    function yScale(chart, axisName) {
+        var spec = chart[axisName] || {};
+        var lo = Infinity, hi = -Infinity, used = false, hasBars = false;
+        eachPoint(chart, axisName, function (x, y, s) {
+            lo = Math.min(lo, y);
+            hi = Math.max(hi, y);
+            used = true;
+            hasBars = hasBars || s.type === 'bar';
+        });
+        if (!used && axisName === 'y2') {
+            return null;
+        }
+        if (!used) {
+            lo = 0;
+            hi = 1;
+        }
+        if (hasBars) {
+            lo = Math.min(lo, 0);
+        }
+        var pad = (hi - lo) * 0.05;
+        if (finite(spec.min)) {
+            lo = spec.min;
+        } else if (!(hasBars && lo === 0)) {
+            lo -= pad;
+        }
+        if (finite(spec.max)) {
+            hi = spec.max;
+        } else {
+            hi += pad;
+        }
+        var ticks = spec.ticks || niceTicks(lo, hi, 6).filter(function (t) {
+            return t >= lo - 1e-9 * Math.abs(hi - lo) && t <= hi + 1e-9 * Math.abs(hi - lo);
+        });
+        var step = ticks.length > 1 ? ticks[1] - ticks[0] : 1;
+        return {
+            lo: lo, hi: hi === lo ? lo + 1 : hi, ticks: ticks,
+            labels: ticks.map(function (t) { return formatTick(t, spec.format, step); }),
+            label: spec.label
+        };
+    }
+
+    // ------------------------------ Drawing ------------------------------
+
+    function setFont(ctx, size, bold) {
+        ctx.font = (bold ? 'bold ' : '') + size + 'px ' + FONT;
+    }
+
+    function drawTitle(ctx, title, w, fs) {
+        if (!title) {
+            return 0;
+        }
+        var lines = String(title).split('\n');
+        setFont(ctx, fs * 1.2, false);
+        ctx.fillStyle = TEXT_COLOR;
+        ctx.textAlign = 'center';
+        ctx.textBaseline = 'top';
+        lines.forEach(function (line, i) {
+            ctx.fillText(line, w / 2, fs * 0.5 + i * fs * 1.4);
+        });
+        return fs * 0.8 + lines.length * fs * 1.4;
+    }
+
+    function maxWidth(ctx, labels) {
+        return labels.reduce(function (m, lbl) {
+            return Math.max(m, ctx.measureText(lbl).width);
+        }, 0);
+    }
+
+    function legendEntries(chart) {
+        return chart.series.filter(function (s) { return s.label !== undefined && s.type !== 'pie'; });
+    }
+
+    function drawPie(ctx, s, w, h, top, fs) {
+        var total = s.values.reduce(function (a, v) { return a + (v > 0 ? v : 0); }, 0);
+        if (!(total > 0)) {
+            return;
+        }
+        var cx = w / 2, cy = top + (h - top) / 2;
+        var r = Math.min(w, h - top) * 0.35;
+        // Matplotlib draws the wedges counterclockwise from 'start_angle'.
+        var angle = -s.start_angle * Math.PI / 180;
+        setFont(ctx, fs, false);
+        ctx.textBaseline = 'middle';
+        s.values.forEach(function (v, i) {
+            if (!(v > 0)) {
+                return;
+            }
+            var sweep = v / total * 2 * Math.PI;
+            ctx.beginPath();
+            ctx.moveTo(cx, cy);
+            ctx.arc(cx, cy, r, angle, angle - sweep, true);
+            ctx.closePath();
+            ctx.fillStyle = s.colors[i] || '#348abd';
+            ctx.fill();
+            var mid = angle - sweep / 2;
+            var cos = Math.cos(mid), sin = Math.sin(mid);
+            ctx.fillStyle = TEXT_COLOR;
+            ctx.textAlign = cos >= 0 ? 'left' : 'right';
+            ctx.fillText(s.labels[i], cx + cos * r * 1.1, cy + sin * r * 1.1);
+            if (s.percents) {
+                ctx.textAlign = 'center';
+                ctx.fillText((v / total * 100).toFixed(1) + '%', cx + cos * r * 0.6, cy + sin * r * 0.6);
+            }
+            angle -= sweep;
+        });
+    }
+
+    function drawSeries(ctx, s, px, py) {
+        var color = s.color || '#348abd';
+        var i;
+        ctx.save();
+        if (s.type === 'bar') {
+            ctx.fillStyle = color;
+            for (i = 0; i < s.x.length; i++) {
+                if (!finite(s.x[i]) || !finite(s.y[i])) {
+                    continue;
+                }
+                var base = s.base[i] || 0;
+                var x0 = px(s.x[i] - s.width / 2), x1 = px(s.x[i] + s.width / 2);
+                var y0 = py(base), y1 = py(base + s.y[i]);
+                ctx.fillRect(x0, Math.min(y0, y1), x1 - x0, Math.abs(y1 - y0));
+            }
+        } else if (s.type === 'band') {
+            ctx.fillStyle = color;
+            ctx.globalAlpha = finite(s.alpha) ? s.alpha : 1;
+            ctx.beginPath();
+            var started = false;
+            for (i = 0; i < s.x.length; i++) {
+                if (finite(s.x[i]) && finite(s.y2[i])) {
+                    ctx[started ? 'lineTo' : 'moveTo'](px(s.x[i]), py(s.y2[i]));
+                    started = true;
+                }
+            }
+            for (i = s.x.length - 1; i >= 0; i--) {
+                if (finite(s.x[i]) && finite(s.y1[i])) {
+                    ctx.lineTo(px(s.x[i]), py(s.y1[i]));
+                }
+            }
+            ctx.closePath();
+            ctx.fill();
+        } else if (s.type === 'line') {
+            ctx.strokeStyle = color;
+            ctx.lineWidth = (s.width || 1.5) * ctx.dpr;
+            if (s.dash) {
+                ctx.setLineDash([6 * ctx.dpr, 3 * ctx.dpr]);
+            }
+            ctx.beginPath();
+            var penDown = false;
+            for (i = 0; i < s.x.length; i++) {
+                if (!finite(s.x[i]) || !finite(s.y[i])) {
+                    penDown = false;
+                    continue;
+                }
+                ctx[penDown ? 'lineTo' : 'moveTo'](px(s.x[i]), py(s.y[i]));
+                penDown = true;
+            }
+            ctx.stroke();
+            if (s.marker) {
+                ctx.fillStyle = color;
+                var m = (s.marker_size || 6) * ctx.dpr / 2;
+                for (i = 0; i < s.x.length; i++) {
+                    if (finite(s.x[i]) && finite(s.y[i])) {
+                        drawMarker(ctx, s.marker, px(s.x[i]), py(s.y[i]), m);
+                    }
+                }
+            }
+        } else if (s.type === 'scatter') {
+            ctx.fillStyle = color;
+            ctx.globalAlpha = finite(s.alpha) ? s.alpha : 1;
+            for (i = 0; i < s.x.length; i++) {
+                if (finite(s.x[i]) && finite(s.y[i])) {
+                    drawMarker(ctx, s.marker || 'o', px(s.x[i]), py(s.y[i]), 3 * ctx.dpr);
+                }
+            }
+        }
+        ctx.restore();
+    }
+
+    function drawMarker(ctx, marker, x, y, r) {
+        ctx.beginPath();
+        if (marker === 's') {
+            ctx.rect(x - r, y - r, 2 * r, 2 * r);
+        } else if (marker === 'D') {
+            ctx.moveTo(x, y - r);
+            ctx.lineTo(x + r, y);
+            ctx.lineTo(x, y + r);
+            ctx.lineTo(x - r, y);
+            ctx.closePath();
+        } else {
+            ctx.arc(x, y, r, 0, 2 * Math.PI);
+        }
+        ctx.fill();
+    }
+
+    function drawLegend(ctx, chart, plot, px, py, fs) {
+        var entries = legendEntries(chart);
+        if (!chart.legend || !entries.length) {
+            return;
+        }
+        setFont(ctx, fs * 0.9, false);
+        var ncol = chart.legend.ncol || 1;
+        var nrow = Math.ceil(entries.length / ncol);
+        var swatch = fs * 1.6, gap = fs * 0.5, rowH = fs * 1.3;
+        var colW = swatch + gap + maxWidth(ctx, entries.map(function (s) { return s.label; })) + gap;
+        var w = colW * ncol + gap, h = rowH * nrow + gap;
+
+        var loc = chart.legend.loc;
+        if (loc !== 'lower right' && loc !== 'lower left' && loc !== 'upper right' && loc !== 'upper left') {
+            // 'best': the corner covering the fewest data points
+            var counts = {'upper right': 0, 'upper left': 0, 'lower left': 0, 'lower right': 0};
+            ['y', 'y2'].forEach(function (axisName) {
+                var toY = axisName === 'y' ? py.y : py.y2;
+                if (!toY) {
+                    return;
+                }
+                eachPoint(chart, axisName, function (x, y) {
+                    var X = px(x), Y = toY(y);
+                    var left = X < plot.x + w + gap, right = X > plot.x + plot.w - w - gap;
+                    var upper = Y < plot.y + h + gap, lower = Y > plot.y + plot.h - h - gap;
+                    if (upper && right) { counts['upper right']++; }
+                    if (upper && left) { counts['upper left']++; }
+                    if (lower && left) { counts['lower left']++; }
+                    if (lower && right) { counts['lower right']++; }
+                });
+            });
+            loc = Object.keys(counts).reduce(function (a, b) { return counts[b] < counts[a] ? b : a; });
+        }
+        var lx = loc.indexOf('left') >= 0 ? plot.x + gap : plot.x + plot.w - w - gap;
+        var ly = loc.indexOf('upper') >= 0 ? plot.y + gap : plot.y + plot.h - h - gap;
+
+        ctx.save();
+        ctx.globalAlpha = 0.5;
+        ctx.fillStyle = '#ffffff';
+        ctx.fillRect(lx, ly, w, h);
+        ctx.globalAlpha = 1;
+        ctx.strokeStyle = '#cccccc';
+        ctx.strokeRect(lx, ly, w, h);
+        ctx.textAlign = 'left';
+        ctx.textBaseline = 'middle';
+        entries.forEach(function (s, i) {
+            // entries fill the columns top to bottom, as in Matplotlib
+            var col = Math.floor(i / nrow), row = i % nrow;
+            var x = lx + gap + col * colW, y = ly + gap / 2 + row * rowH + rowH / 2;
+            ctx.globalAlpha = s.type === 'band' || s.type === 'scatter' ? (finite(s.alpha) ? s.alpha : 1) : 1;
+            ctx.fillStyle = s.color || '#348abd';
+            ctx.strokeStyle = s.color || '#348abd';
+            if (s.type === 'line') {
+                ctx.lineWidth = (s.width || 1.5) * ctx.dpr;
+                ctx.setLineDash(s.dash ? [6 * ctx.dpr, 3 * ctx.dpr] : []);
+                ctx.beginPath();
+                ctx.moveTo(x, y);
+                ctx.lineTo(x + swatch, y);
+                ctx.stroke();
+                ctx.setLineDash([]);
+                if (s.marker) {
+                    drawMarker(ctx, s.marker, x + swatch / 2, y, (s.marker_size || 6) * ctx.dpr / 2);
+                }
+            } else if (s.type === 'scatter') {
+                drawMarker(ctx, s.marker || 'o', x + swatch / 2, y, 3 * ctx.dpr);
+            } else {
+                ctx.fillRect(x, y - fs * 0.35, swatch, fs * 0.7);
+            }
+            ctx.globalAlpha = 1;
+            ctx.fillStyle = TEXT_COLOR;
+            ctx.fillText(s.label, x + swatch + gap, y);
+        });
+        ctx.restore();
+    }
+
+    function drawYAxis(ctx, scale, plot, right, fs) {
+        ctx.fillStyle = TEXT_COLOR;
+        ctx.textBaseline = 'middle';
+        ctx.textAlign = right ? 'left' : 'right';
+        setFont(ctx, fs, false);
+        var toY = function (v) { return plot.y + plot.h - (v - scale.lo) / (scale.hi - scale.lo) * plot.h; };
+        var x = right ? plot.x + plot.w + fs * 0.4 : plot.x - fs * 0.4;
+        scale.ticks.forEach(function (t, i) {
+            ctx.fillText(scale.labels[i], x, toY(t));
+        });
+        if (scale.label) {
+            ctx.save();
+            var lx = right ? plot.x + plot.w + fs * 0.8 + maxWidth(ctx, scale.labels) + fs * 0.6 :
+                             plot.x - fs * 0.8 - maxWidth(ctx, scale.labels) - fs * 0.6;
+            ctx.translate(lx, plot.y + plot.h / 2);
+            ctx.rotate(right ? Math.PI / 2 : -Math.PI / 2);
+            ctx.textAlign = 'center';
+            ctx.fillText(scale.label, 0, 0);
+            ctx.restore();
+        }
+        return toY;
+    }
+
+    // Draws the chart described by the chart file object 'chart' on 'canvas'.
+    function draw(canvas, chart) {
+        var dpr = window.devicePixelRatio || 1;
+        var cssW = canvas.clientWidth || 600;
+        var cssH = Math.round(cssW * ASPECT);
+        canvas.style.height = cssH + 'px';
+        canvas.width = Math.round(cssW * dpr);
+        canvas.height = Math.round(cssH * dpr);
+        var w = canvas.width, h = canvas.height;
+        var ctx = canvas.getContext('2d');
+        ctx.dpr = dpr;
+        var fs = Math.max(9, Math.min(14, cssW / 45)) * dpr;
+
+        ctx.fillStyle = '#ffffff';
+        ctx.fillRect(0, 0, w, h);
+        var top = drawTitle(ctx, chart.title, w, fs);
+
+        var pies = chart.series.filter(function (s) { return s.type === 'pie'; });
+        if (pies.length) {
+            pies.forEach(function (s) { drawPie(ctx, s, w, h, top, fs); });
+            return;
+        }
+
+        var xs = xScale(chart);
+        var ys = yScale(chart, 'y');
+        var ys2 = yScale(chart, 'y2');
+
+        // the margins leave room for the tick labels and axis labels
+        setFont(ctx, fs, false);
+        var rotation = ((chart.x || {}).rotation || 0) * Math.PI / 180;
+        var xLabelW = maxWidth(ctx, xs.labels);
+        var xTickH = rotation ? xLabelW * Math.sin(rotation) + fs : fs * 1.4;
+        var left = fs * 0.8 + maxWidth(ctx, ys.labels) + (ys.label ? fs * 1.8 : 0);
+        var right = ys2 ? fs * 0.8 + maxWidth(ctx, ys2.labels) + (ys2.label ? fs * 1.8 : 0) : fs * 1.5;
+        var bottom = xTickH + ((chart.x || {}).label ? fs * 1.8 : 0) + fs * 0.5;
+        var plot = {x: left, y: Math.max(top, fs), w: w - left - right, h: 0};
+        plot.h = h - plot.y - bottom;
+        if (plot.w <= 0 || plot.h <= 0) {
+            return;
+        }
+
+        var px = function (v) { return plot.x + (v - xs.lo) / (xs.hi - xs.lo) * plot.w; };
+
+        // background and grid
+        ctx.fillStyle = AXES_BG;
+        ctx.fillRect(plot.x, plot.y, plot.w, plot.h);
+        var toY = drawYAxis(ctx, ys, plot, false, fs);
+        var toY2 = ys2 ? drawYAxis(ctx, ys2, plot, true, fs) : null;
+        ctx.save();
+        ctx.strokeStyle = GRID_COLOR;
+        ctx.lineWidth = dpr;
+        ctx.setLineDash([2 * dpr, 2 * dpr]);
+        ctx.beginPath();
+        ys.ticks.forEach(function (t) {
+            var y = Math.round(toY(t)) + 0.5;
+            ctx.moveTo(plot.x, y);
+            ctx.lineTo(plot.x + plot.w, y);
+        });
+        xs.ticks.forEach(function (t) {
+            var x = Math.round(px(t)) + 0.5;
+            ctx.moveTo(x, plot.y);
+            ctx.lineTo(x, plot.y + plot.h);
+        });
+        ctx.stroke();
+        ctx.restore();
+
+        // the data, clipped to the plot area
+        ctx.save();
+        ctx.beginPath();
+        ctx.rect(plot.x, plot.y, plot.w, plot.h);
+        ctx.clip();
+        chart.series.forEach(function (s) {
+            drawSeries(ctx, s, px, s.axis === 'y2' && toY2 ? toY2 : toY);
+        });
+        ctx.restore();
+
+        // x tick labels and axis label
+        ctx.fillStyle = TEXT_COLOR;
+        setFont(ctx, fs, false);
+        xs.ticks.forEach(function (t, i) {
+            var x = px(t), y = plot.y + plot.h + fs * 0.4;
+            if (x < plot.x - 1 || x > plot.x + plot.w + 1) {
+                return;
+            }
+            if (rotation) {
+                ctx.save();
+                ctx.translate(x, y);
+                ctx.rotate(-rotation);
+                ctx.textAlign = 'right';
+                ctx.textBaseline = 'middle';
+                ctx.fillText(xs.labels[i], 0, 0);
+                ctx.restore();
+            } else {
+                ctx.textAlign = 'center';
+                ctx.textBaseline = 'top';
+                ctx.fillText(xs.labels[i], x, y);
+            }
+        });
+        if ((chart.x || {}).label) {
+            ctx.textAlign = 'center';
+            ctx.textBaseline = 'bottom';
+            ctx.fillText(chart.x.label, plot.x + plot.w / 2, h - fs * 0.3);
+        }
+
+        drawLegend(ctx, chart, plot, px, {y: toY, y2: toY2}, fs);
+    }
+
+    // ------------------------------ Loading ------------------------------
+
+    function load(canvas) {
+        var req = new XMLHttpRequest();
+        req.open('GET', canvas.getAttribute('data-src'));
+        req.onload = function () {
+            if (req.status !== 200 && req.status !== 0) {
+                return;
+            }
+            try {
+                canvas.chart = JSON.parse(req.responseText);
+            } catch (e) {
+                return;
+            }
+            draw(canvas, canvas.chart);
+        };
+        req.send();
+    }
+
+    function drawAll() {
+        var canvases = document.querySelectorAll('canvas.chart[data-src]');
+        for (var i = 0; i < canvases.length; i++) {
+            if (canvases[i].chart) {
+                draw(canvases[i], canvases[i].chart);
+            } else {
+                load(canvases[i]);
+            }
+        }
+    }
+
+    var resizeTimer = null;
+    window.addEventListener('resize', function () {
+        clearTimeout(resizeTimer);
+        resizeTimer = setTimeout(drawAll, 200);
+    });
+    document.addEventListener('DOMContentLoaded', drawAll);
+
+    window.BenchmarkCharts = {draw: draw, drawAll: drawAll};
+})();
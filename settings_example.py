@@ -20,13 +20,91 @@ UTILITY_BILL_FILE_PATH = 'data/20171017_AllDataExport.CSV'
 # energy data. (string directory path, use forward slashes for directory separators)
 OTHER_DATA_DIR_PATH = 'data/'
 
-# Set the following to True if you want to use the same Utility Bill and Other 
-# Data from the last run of the benchmark script.  This will substantially
-# speed up the time required to run the script, since reading the CSV file and
-# preprocessing the data are skipped. Useful for debugging code that doesn't 
+# Set the following to True if you want to use the preprocessed Utility Bill 
+# and Other Data from the last run of the benchmark script.  This will 
+# substantially speed up the time required to run the script, since 
+# preprocessing the data is skipped. The data from the last run is only used
+# if the Utility Bill file, the Buildings.xlsx and Services.xlsx files, the 
+# degree-day data and the preprocessing code are all unchanged; otherwise the
+# data is preprocessed again.  Useful for debugging code that doesn't 
 # affect the preprocessing routine.  (True / False)
 USE_DATA_FROM_LAST_RUN = False
 
+# The directory where the preprocessed data, the degree-day data, and parsed
+# copies of the Buildings.xlsx and Services.xlsx spreadsheets are cached 
+# between runs of the script.  The path should be expressed relative to this
+# directory. 
+# (string directory path, use forward slashes for directory separators)
+CACHE_DIR_PATH = 'cache/'
+
+# Degree-day data is downloaded from the Internet and a copy is kept in the 
+# cache directory above; the data is only downloaded again when it changes.
+# Set the following to True to only use that local copy of the degree-day 
+# data, for example when working without an Internet connection.  The local
+# copy is also used automatically if the download fails. (True / False)
+DEGREE_DAY_OFFLINE = False
+
+# If the Utility Bill CSV file is too large to read into memory all at once,
+# set this to the number of rows to read and process at one time, e.g. 500000.
+# Each chunk of rows is reduced to monthly totals before the next chunk is
+# read.  Set to 0 to read the whole file at once. (integer)
+UTILITY_BILL_CHUNK_SIZE = 0
+
+# Set the following to True to only split and summarize the utility bills
+# that were added, removed or changed since the last run of the script.  The
+# bills and preprocessed data from the last run are stored in the file
+# "bill_store.pkl" in the CACHE_DIR_PATH directory; delete that file to force
+# all of the bills to be processed.  The Utility Bill file is still read in full on each
+# run. (True / False)
+INCREMENTAL_PREPROCESSING = False
+
+# The number of processes used to split and summarize the utility bills.  The
+# bills are divided among the processes by site.  Set to 1 to use a single
+# process, or 0 to use one process per CPU core. (integer)
+PREPROCESS_WORKERS = 1
+
+# Set the following to True to store the preprocessed Utility Bill data with
+# memory-saving data types: Site IDs, service types, item descriptions and
+# units are stored as Pandas Categoricals and years and months as small
+# integers.  The compact data is checked against the original and is only
+# used if no data was changed. (True / False)
+COMPACT_DATA_FRAME = False
+
+# If COMPACT_DATA_FRAME is True, set this to True to also store usage, cost
+# and MMBtu values as 32-bit floats, which halves their memory use but
+# reduces precision to about 7 significant digits. (True / False)
+COMPACT_FLOAT32 = False
+
+# The number of processes used to create the site reports.  The sites are 
+# divided among the processes; the reports are the same as when a single 
+# process is used.  Set to 1 to use a single process, or 0 to use one process
+# per CPU core. (integer)
+SITE_REPORT_WORKERS = 1
+
+# The number of processes used to render the graphs of the site reports when
+# a single process creates the reports (SITE_REPORT_WORKERS is 1).  The
+# reports are created while these processes render the graphs, which are all
+# saved before the script finishes; graphs that could not be made are listed
+# at the end of the run.  Set to 0 to render the graphs in the process that
+# creates the reports. (integer)
+GRAPH_RENDER_WORKERS = 0
+
+# Set the following to the maximum size, in megabytes, of the cache of graph
+# images kept in the "graphs" folder of the CACHE_DIR_PATH directory.  A graph
+# whose data is the same as in an earlier run is copied from the cache instead
+# of being drawn again.  The least recently used images are removed when the 
+# cache is too large.  Set to 0 to not cache graphs. (number)
+GRAPH_CACHE_MAX_MB = 0
+
+# Set the following to True to have the browser draw the graphs of the site
+# reports, instead of saving them as images.  The data of each graph is saved
+# in a small ".json" file in the "output/images" directory, and is drawn by the
+# "output/js/charts.js" script.  This makes the script run faster and the
+# output much smaller, but the reports must then be viewed through a web 
+# server: browsers do not let a page opened from a file load the graph data.
+# (True / False)
+CLIENT_SIDE_GRAPHS = False
+
 # If the following setting is True, debug information will be written to the
 # 'output/debug' directory, including the raw variable values that are passed
 # to the HTML reporting template. (True / False)
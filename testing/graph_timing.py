@@ -0,0 +1,130 @@
+"""Timing comparison of making graphs with the Figure templates of graph_util,
+which draw on Figures made without pyplot, and with the pyplot approach that
+was previously used by every graph function: plt.subplots(), pyplot drawing
+calls, and plt.close('all').  Two types of graphs are timed: the yearly
+stacked bar graph of create_stacked_bar() and the monthly profile graph of
+create_monthly_profile(), each made N_GRAPHS times from random data.  The
+previous pyplot versions of the two functions are included below.  The
+images made by the two approaches are also checked to be identical.  The 
+median time per graph is reported.  Run from the 'testing' directory:
+
+    python graph_timing.py
+"""
+import os
+import sys
+import time
+import tempfile
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, '..')
+import graph_util as gu
+import matplotlib.pyplot as plt
+from matplotlib.ticker import FuncFormatter
+
+N_GRAPHS = 40
+
+def old_create_stacked_bar(df, fiscal_year_col, column_name_list, ylabel, title, filename):
+    """The pyplot version of graph_util.create_stacked_bar()."""
+    df, column_name_list = gu.beautify_legend(df, column_name_list)
+    fig, ax = plt.subplots()
+    width = 0.50
+    color_dict = gu.color_formatter(column_name_list)
+    previous_col_name = 0
+    df = df.fillna(0)
+    for col in column_name_list:
+        plt.bar(df[fiscal_year_col], df[col], width, label=col, bottom=previous_col_name, color=color_dict[col])
+        previous_col_name = previous_col_name + df[col]
+    plt.ylabel(ylabel)
+    plt.xlabel('Fiscal Year')
+    plt.xticks(np.arange(df[fiscal_year_col].min(), df[fiscal_year_col].max()+1, 1.0),
+               np.sort(list(df[fiscal_year_col].unique())))
+    df['total_cost'] = df[column_name_list].sum(axis=1)
+    ax.set_ylim(bottom=0, top=df.total_cost.max() + df.total_cost.max()*0.10)
+    ax.get_yaxis().set_major_formatter(FuncFormatter(lambda x, p: format(int(x), ',')))
+    plt.title(title)
+    leg = plt.legend(loc='lower right', ncol=2, fancybox=True, shadow=True)
+    leg.get_frame().set_alpha(0.5)
+    plt.savefig(filename)
+    plt.close('all')
+
+def old_create_monthly_profile(df, graph_column_name, yaxis_name, color_choice, title, filename):
+    """The pyplot version of graph_util.create_monthly_profile()."""
+    recent_years = (sorted(list(df.index.levels[0].values), reverse=True)[0:5])
+    df_reset = df.reset_index()
+    color_df = pd.DataFrame.from_dict({'blue': ['#08519c', '#3182bd', '#6baed6', '#bdd7e7', '#eff3ff']})
+    fig, ax = plt.subplots()
+    for i, year in enumerate(recent_years):
+        year_df = df_reset.query("fiscal_year == @year")
+        ax.plot_date(year_df['fiscal_mo'], year_df[graph_column_name], fmt='-', color=color_df.iloc[i][color_choice],
+                     label=str(year_df.fiscal_year.iloc[0]))
+    ax.get_yaxis().set_major_formatter(FuncFormatter(lambda x, p: format(int(x), ',')))
+    ax.set_xticks(year_df.fiscal_mo.values)
+    ax.set_xticklabels(gu.bu.mo_list)
+    plt.xlabel('Month of Year')
+    plt.ylabel(yaxis_name)
+    plt.legend()
+    plt.title(title)
+    plt.savefig(filename)
+    plt.close('all')
+
+def yearly_data(rng):
+    """Returns random yearly costs in the form used by create_stacked_bar()."""
+    return pd.DataFrame({
+        'fiscal_year': np.arange(2008, 2019),
+        'electricity_cost': rng.uniform(20000, 60000, 11),
+        'natural_gas_cost': rng.uniform(5000, 30000, 11),
+        'water_cost': rng.uniform(1000, 8000, 11),
+    })
+
+def monthly_data(rng):
+    """Returns random monthly usage in the form used by create_monthly_profile()."""
+    ix = pd.MultiIndex.from_product([range(2012, 2019), range(1, 13)], names=['fiscal_year', 'fiscal_mo'])
+    return pd.DataFrame({'kwh': rng.uniform(10000, 90000, len(ix))}, index=ix)
+
+def graph_time(make_graph, df, filename):
+    """Makes a graph with 'make_graph(df, filename)', returning the time it
+    took in milliseconds.
+    """
+    st = time.time()
+    make_graph(df, filename)
+    return (time.time() - st) * 1000.0
+
+graph_types = [
+    ('Stacked bar',
+     yearly_data,
+     lambda df, fn: old_create_stacked_bar(df, 'fiscal_year', ['electricity_cost', 'natural_gas_cost', 'water_cost'],
+                                           'Utility Cost [$]', 'Annual Utility Cost', fn),
+     lambda df, fn: gu.create_stacked_bar(df, 'fiscal_year', ['electricity_cost', 'natural_gas_cost', 'water_cost'],
+                                          'Utility Cost [$]', 'Annual Utility Cost', fn)),
+    ('Monthly profile',
+     monthly_data,
+     lambda df, fn: old_create_monthly_profile(df, 'kwh', 'kWh', 'blue', 'Electricity Usage', fn),
+     lambda df, fn: gu.create_monthly_profile(df, 'kwh', 'kWh', 'blue', 'Electricity Usage', fn)),
+]
+
+with tempfile.TemporaryDirectory() as out_dir:
+    for name, make_data, old_graph, new_graph in graph_types:
+        rng = np.random.RandomState(0)
+        data = [make_data(rng) for i in range(N_GRAPHS)]
+
+        # make one graph each way first, so one-time setup is not timed.
+        old_graph(data[0].copy(), os.path.join(out_dir, 'warm_old.png'))
+        new_graph(data[0].copy(), os.path.join(out_dir, 'warm_new.png'))
+
+        # The two approaches are alternated so that changes in the load on the
+        # computer affect both equally, and the median time is reported.
+        old_times, new_times = [], []
+        for i, df in enumerate(data):
+            old_times.append(graph_time(old_graph, df.copy(), os.path.join(out_dir, 'old_{}.png'.format(i))))
+            new_times.append(graph_time(new_graph, df.copy(), os.path.join(out_dir, 'new_{}.png'.format(i))))
+        old_time, new_time = np.median(old_times), np.median(new_times)
+        print('{}: pyplot {:.1f} ms per graph, Figure templates {:.1f} ms per graph (ratio {:.2f})'.format(
+            name, old_time, new_time, new_time / old_time))
+
+        # Check that the two approaches make the same images.
+        for i in range(N_GRAPHS):
+            with open(os.path.join(out_dir, 'old_{}.png'.format(i)), 'rb') as f_old, \
+                    open(os.path.join(out_dir, 'new_{}.png'.format(i)), 'rb') as f_new:
+                assert f_old.read() == f_new.read()
+        print('The {:,} images made each way are identical.'.format(N_GRAPHS))
@@ -0,0 +1,55 @@
+"""Timing comparison of the bill splitting routines in bench_util.  Splits
+1,000,000 randomly generated bills with the vectorized split_periods()
+function and compares that to the per-bill split_period() approach that was
+previously used in preprocess_data().  The per-bill approach is too slow to
+run on all 1,000,000 bills, so it is timed on a sample and the result is
+scaled up.  The results of the two approaches are also checked for agreement
+on the sample.  Run from the 'testing' directory:
+
+    python split_periods_timing.py
+"""
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, '..')
+import bench_util as bu
+
+N_BILLS = 1000000
+N_SAMPLE = 2000
+
+def old_split_period(start_date, end_date):
+    """The original, per-bill, daily Series & resample splitting routine."""
+    ser = pd.Series(data=1.0, index=pd.date_range(start_date, end_date))
+    ser.iloc[0] = 0.5
+    ser.iloc[-1] = 0.5
+    tot_days = ser.sum()
+    pieces = ser.resample('M').sum()
+    return [(dt.year, dt.month, days/tot_days, days) for dt, days in pieces.items()]
+
+# Make random bills that are mostly about one month long, starting anywhere
+# in a 15 year range.
+rng = np.random.RandomState(0)
+from_dt = np.datetime64('2005-01-01') + rng.randint(0, 15 * 365, N_BILLS).astype('timedelta64[D]')
+thru_dt = from_dt + rng.randint(0, 95, N_BILLS).astype('timedelta64[D]')
+
+st = time.time()
+pieces = bu.split_periods(from_dt, thru_dt)
+new_time = time.time() - st
+print('split_periods(): {:,} bills split into {:,} pieces in {:.2f} s'.format(N_BILLS, len(pieces), new_time))
+
+st = time.time()
+old_results = [old_split_period(f, t) for f, t in zip(from_dt[:N_SAMPLE], thru_dt[:N_SAMPLE])]
+old_time = (time.time() - st) * N_BILLS / N_SAMPLE
+print('split_period() loop: estimated {:.0f} s for {:,} bills'.format(old_time, N_BILLS))
+print('Speedup: {:.0f}x'.format(old_time / new_time))
+
+# Check that the two approaches agree on the sample.
+sample = pieces.query('bill_ix < @N_SAMPLE')
+new_results = [
+    list(zip(gp.cal_year, gp.cal_mo, gp.bill_frac, gp.days_served))
+    for _, gp in sample.groupby('bill_ix')
+]
+assert new_results == old_results
+print('Results agree for the {:,} sampled bills.'.format(N_SAMPLE))
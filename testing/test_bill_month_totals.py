@@ -0,0 +1,141 @@
+"""Tests that the single-pass aggregation in bench_util.bill_month_totals()
+gives the same monthly totals as the original pipeline, which split each 
+bill with a daily Pandas Series and resample(), and summed the pieces one at
+a time.  A copy of that original splitting code is kept here, so the test 
+does not depend on the new splitting code.  Random bills are used, including
+bills spanning calendar and fiscal year boundaries, non-usage charges, and 
+rows with a missing key.  A few splits are also checked against 
+hand-computed results.  Run from the 'testing' directory with pytest, or as
+a script:
+
+    python test_bill_month_totals.py
+"""
+import sys
+from collections import defaultdict
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, '..')
+import bench_util as bu
+
+def make_bills(n_bills=3000, seed=0):
+    """Returns a DataFrame of random bill charge rows in the form produced by
+    prepare_bills() in benchmark.py.
+    """
+    rng = np.random.RandomState(seed)
+    from_dt = np.datetime64('2014-01-01') + rng.randint(0, 5 * 365, n_bills).astype('timedelta64[D]')
+    thru_dt = from_dt + rng.randint(0, 100, n_bills).astype('timedelta64[D]')
+    site = rng.choice(['A01', 'B22', 'C3', 'D47'], n_bills)
+    service = rng.choice(['electricity', 'natural_gas', 'fuel_oil', 'water'], n_bills)
+
+    # several charge rows per bill
+    charges = rng.randint(1, 4, n_bills)
+    ix = np.repeat(np.arange(n_bills), charges)
+    n = len(ix)
+    df = pd.DataFrame({
+        'site_id': site[ix],
+        'service_type': service[ix],
+        'from_dt': from_dt[ix],
+        'thru_dt': thru_dt[ix],
+        'item_desc': rng.choice(['Energy', 'Demand', 'Other Charge'], n),
+        'units': rng.choice(['kWh', 'kW', 'Gallons', '-'], n),
+        'usage': rng.uniform(0.0, 5000.0, n),
+        'cost': rng.uniform(0.0, 900.0, n),
+        'mmbtu': rng.uniform(0.0, 50.0, n),
+    })
+    df.loc[df.item_desc == 'Other Charge', 'usage'] = np.nan
+    df.loc[rng.random_sample(n) < 0.01, 'service_type'] = np.nan
+    return df
+
+def old_split_period(start_date, end_date):
+    """The original, per-bill, daily Series & resample splitting routine.
+    Returns a list of (calendar year, calendar month, bill fraction, days
+    served) tuples.
+    """
+    ser = pd.Series(data=1.0, index=pd.date_range(start_date, end_date))
+    ser.iloc[0] = 0.5
+    ser.iloc[-1] = 0.5
+    tot_days = ser.sum()
+    pieces = ser.resample('M').sum()
+    return [(dt.year, dt.month, days/tot_days, days) for dt, days in pieces.items()]
+
+def old_calendar_to_fiscal(cal_year, cal_mo):
+    """The original calendar to fiscal year and month conversion."""
+    if cal_mo <= 6:
+        return cal_year, cal_mo + 6
+    else:
+        return cal_year + 1, cal_mo - 6
+
+def reference_totals(df):
+    """Returns a dictionary of the monthly totals of the bills in 'df',
+    computed by splitting each charge row with old_split_period().
+    """
+    tots = defaultdict(lambda: np.zeros(3))
+    for row in df.itertuples():
+        if pd.isnull(row.service_type):
+            continue
+        for cal_year, cal_mo, bill_frac, days in old_split_period(row.from_dt, row.thru_dt):
+            fyr, fmo = old_calendar_to_fiscal(cal_year, cal_mo)
+            key = (row.site_id, row.service_type, fyr, fmo, row.item_desc, row.units)
+            vals = np.nan_to_num([row.usage, row.cost, row.mmbtu]) * bill_frac
+            tots[key] += vals
+    return tots
+
+def test_split_by_hand():
+    # a one-day bill is all in its month
+    assert [tuple(p) for p in bu.split_period('2017-03-15', '2017-03-15')] == [(2017, 3, 1.0, 0.5)]
+
+    # 2017-01-20 to 2017-02-10: 11.5 days in January, 9.5 in February
+    pieces = bu.split_period('2017-01-20', '2017-02-10')
+    assert [(p.cal_year, p.cal_mo, p.days_served) for p in pieces] == [(2017, 1, 11.5), (2017, 2, 9.5)]
+    assert np.allclose([p.bill_frac for p in pieces], [11.5 / 21, 9.5 / 21])
+
+    # 2016-12-31 to 2017-01-01: half a day in each year
+    pieces = bu.split_period('2016-12-31', '2017-01-01')
+    assert [(p.cal_year, p.cal_mo, p.bill_frac, p.days_served) for p in pieces] == \
+        [(2016, 12, 0.5, 0.5), (2017, 1, 0.5, 0.5)]
+
+    # June is the last month of a fiscal year, July the first of the next
+    assert bu.calendar_to_fiscal(2017, 6) == (2017, 12)
+    assert bu.calendar_to_fiscal(2017, 7) == (2018, 1)
+
+def test_totals_match():
+    df = make_bills()
+    result = bu.bill_month_totals(df)
+    expected = reference_totals(df)
+
+    # one row for each key, in sorted order
+    keys = list(zip(result.site_id, result.service_type, result.fiscal_year,
+                    result.fiscal_mo, result.item_desc, result.units))
+    assert set(keys) == set(expected)
+    assert len(keys) == len(expected)
+    sort_keys = list(zip(result.site_id, result.service_type, result.cal_year,
+                         result.cal_mo, result.item_desc, result.units))
+    assert sort_keys == sorted(sort_keys)
+
+    # the totals of each row match
+    vals = result[['usage', 'cost', 'mmbtu']].values
+    assert np.allclose(vals, np.array([expected[k] for k in keys]), rtol=1e-12, atol=1e-9)
+
+    # and all of the usage and cost of the bills is allocated to months
+    df_valid = df.dropna(subset=['service_type'])
+    for col in ('usage', 'cost', 'mmbtu'):
+        assert np.isclose(result[col].sum(), df_valid[col].sum(), rtol=1e-12)
+
+def test_combine_matches_one_pass():
+    df = make_bills()
+    one_pass = bu.bill_month_totals(df)
+
+    # totals of two halves of the bills, combined
+    half = len(df) // 2
+    combined = bu.combine_month_totals(pd.concat([
+        bu.bill_month_totals(df.iloc[:half]),
+        bu.bill_month_totals(df.iloc[half:]),
+    ]))
+    pd.testing.assert_frame_equal(one_pass, combined, check_exact=False, rtol=1e-12)
+
+if __name__ == '__main__':
+    test_split_by_hand()
+    test_totals_match()
+    test_combine_matches_one_pass()
+    print('Monthly totals match.')
@@ -0,0 +1,58 @@
+"""Timing of the startup of the bench_util.Util object, which loads the
+Services.xlsx and Buildings.xlsx spreadsheets, the degree-day file and the
+service provider information lazily.  Three cases are timed:
+
+    lazy:        only building_info() is used, so the degree days and
+                 the Service Categories sheet are never loaded.
+    sequential:  every resource is loaded, one after another (the way the
+                 Util object used to start up).
+    load_all():  every resource is loaded, with the independent loads 
+                 overlapped on a thread pool.
+
+Run from the 'testing' directory, giving the Utility Bill CSV file and the
+directory holding Buildings.xlsx and Services.xlsx:
+
+    python util_startup_timing.py ../data/bills.csv ../data/
+
+Add a third argument giving a cache directory to keep a local copy of the 
+degree-day file, and a fourth argument of 'offline' to only use that copy.
+"""
+import sys
+import time
+import pandas as pd
+
+sys.path.insert(0, '..')
+import bench_util as bu
+
+bill_file, other_data_pth = sys.argv[1:3]
+dd_cache_dir = sys.argv[3] if len(sys.argv) > 3 else None
+dd_offline = len(sys.argv) > 4 and sys.argv[4] == 'offline'
+
+util_df = bu.last_bill_records(pd.read_csv(bill_file, parse_dates=['Thru']))
+
+def new_util():
+    # Make sure the degree-day file is read again for each case.
+    bu.degree_day_file_content.cache_clear()
+    return bu.Util(util_df, other_data_pth, dd_cache_dir, dd_offline)
+
+def show(label, elapsed, ut):
+    print('{:<12} {:6.2f} s'.format(label, elapsed))
+    for name, load_time in ut.load_times.items():
+        print('    {:<18} {:6.2f} s'.format(name, load_time))
+
+# Load everything once so that module imports are not part of the timings.
+new_util().load_all()
+
+ut = new_util()
+st = time.time()
+ut.building_info(ut.all_sites()[0])
+show('lazy', time.time() - st, ut)
+
+ut = new_util()
+st = time.time()
+for name in bu.Util.all_resources:
+    ut._resource(name)
+show('sequential', time.time() - st, ut)
+
+ut = new_util()
+show('load_all()', ut.load_all(), ut)